@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Booking, DriverLocation, RouteSnapshot
+from .models import Booking, DriverLocation, RouteSnapshot, RouteTrace
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
@@ -44,4 +44,13 @@ class RouteSnapshotAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
     
     def has_add_permission(self, request):
-        return False
\ No newline at end of file
+        return False
+
+@admin.register(RouteTrace)
+class RouteTraceAdmin(admin.ModelAdmin):
+    list_display = ['booking', 'updated_at']
+    search_fields = ['booking__id']
+    readonly_fields = ['booking', 'routes', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
@@ -8,13 +8,14 @@ from django.db import transaction
 from datetime import timedelta
 from decimal import Decimal
 import logging
+import math
 
-from .models import DriverLocation, Booking, RouteSnapshot, BookingStop
+from .models import Booking, RouteSnapshot, BookingStop
+from .serializers import GEOMETRY_FORMATS, RouteSnapshotSerializer
 from .services import RoutingService
+from . import cache_versions, geocoding, itinerary_geometry, itinerary_state, itinerary_stream, locations, realtime, spatial
 from .utils import (
     build_driver_itinerary, 
-    ensure_booking_stops, 
-    plan_driver_stops, 
     calculate_distance,
     generate_payment_pin,
     hash_payment_pin,
@@ -30,6 +31,11 @@ except Exception:
     dispatch_notification = None
     NotificationMessage = None
 
+try:  # Celery is optional in some environments
+    from .tasks import schedule_reroute
+except Exception:  # pragma: no cover - background worker not always available
+    schedule_reroute = None
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -47,26 +53,28 @@ def update_driver_location(request):
     if not latitude or not longitude:
         return Response({'error': 'Latitude and longitude required'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Update or create driver location
-    location, created = DriverLocation.objects.update_or_create(
-        driver=request.user,
-        defaults={
-            'latitude': Decimal(str(latitude)),
-            'longitude': Decimal(str(longitude)),
-            'heading': Decimal(str(heading)) if heading else None,
-            'speed': Decimal(str(speed)) if speed else None,
-            'accuracy': Decimal(str(accuracy)) if accuracy else None,
-        }
-    )
-    
-    # Check for active bookings and reroute if needed
-    active_bookings = Booking.objects.filter(
-        driver=request.user,
-        status__in=['accepted', 'on_the_way', 'started']
-    )
-
-    for active_booking in active_bookings:
-        check_and_reroute(active_booking, location)
+    # Buffered in the location store; flushed to DriverLocation in batches
+    try:
+        location = locations.record_location(
+            request.user.id, latitude, longitude,
+            heading=heading, speed=speed, accuracy=accuracy,
+        )
+    except (TypeError, ValueError):
+        return Response({'error': 'Invalid coordinates'}, status=status.HTTP_400_BAD_REQUEST)
+    spatial.index_driver_location(request.user.id, location.latitude, location.longitude)
+    realtime.publish_driver_position(request.user.id, location)
+    itinerary_stream.on_driver_moved(request.user.id, location)
+    cache_versions.bump_driver_bookings(request.user.id)
+    
+    # Reroute checks run in the background, coalesced per booking
+    if schedule_reroute is not None:
+        active_booking_ids = Booking.objects.filter(
+            driver=request.user,
+            status__in=['accepted', 'on_the_way', 'started']
+        ).values_list('id', flat=True)
+
+        for booking_id in active_booking_ids:
+            schedule_reroute(booking_id)
     
     return Response({
         'status': 'success',
@@ -91,56 +99,54 @@ def get_driver_location(request, booking_id):
     if not booking.driver:
         return Response({'error': 'No driver assigned'}, status=status.HTTP_404_NOT_FOUND)
     
-    try:
-        location = DriverLocation.objects.get(driver=booking.driver)
+    location = locations.get_location(booking.driver_id)
+    if location is None:
+        return Response({'error': 'Driver location not available'}, status=status.HTTP_404_NOT_FOUND)
+
+    # Calculate ETA if passenger is requesting
+    eta_seconds = None
+    if request.user == booking.passenger:
+        routing_service = RoutingService()
         
-        # Calculate ETA if passenger is requesting
-        eta_seconds = None
-        if request.user == booking.passenger:
-            routing_service = RoutingService()
-            
-            if booking.status == 'accepted' or booking.status == 'on_the_way':
-                # ETA to pickup
-                destination = (float(booking.pickup_longitude), float(booking.pickup_latitude))
-            else:
-                # ETA to destination
-                destination = (float(booking.destination_longitude), float(booking.destination_latitude))
-            
-            eta_seconds = routing_service.get_eta(location, destination)
+        if booking.status == 'accepted' or booking.status == 'on_the_way':
+            # ETA to pickup
+            destination = (float(booking.pickup_longitude), float(booking.pickup_latitude))
+        else:
+            # ETA to destination
+            destination = (float(booking.destination_longitude), float(booking.destination_latitude))
         
-        return Response({
-            'latitude': float(location.latitude),
-            'longitude': float(location.longitude),
-            'heading': float(location.heading) if location.heading else None,
-            'speed': float(location.speed) if location.speed else None,
-            'timestamp': location.timestamp.isoformat(),
-            'eta_seconds': eta_seconds
-        })
-    except DriverLocation.DoesNotExist:
-        return Response({'error': 'Driver location not available'}, status=status.HTTP_404_NOT_FOUND)
+        eta_seconds = routing_service.get_eta(location, destination)
+    
+    return Response({
+        'latitude': float(location.latitude),
+        'longitude': float(location.longitude),
+        'heading': float(location.heading) if location.heading else None,
+        'speed': float(location.speed) if location.speed else None,
+        'timestamp': location.timestamp.isoformat(),
+        'eta_seconds': eta_seconds
+    })
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_current_route(request, booking_id):
-    """Get current active route for a booking"""
+    """Get current active route for a booking (`?geometry=polyline` for the compact line)"""
     booking = get_object_or_404(Booking, id=booking_id)
     
     # Check permissions
     if request.user not in [booking.passenger, booking.driver]:
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
+    geometry_format = request.query_params.get('geometry', 'geojson')
+    if geometry_format not in GEOMETRY_FORMATS:
+        return Response({'error': f"geometry must be one of: {', '.join(GEOMETRY_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
     route = RouteSnapshot.objects.filter(booking=booking, is_active=True).first()
     
     if not route:
         return Response({'error': 'No active route found'}, status=status.HTTP_404_NOT_FOUND)
     
-    return Response({
-        'route_data': route.route_data,
-        'distance': float(route.distance),
-        'duration': route.duration,
-        'created_at': route.created_at.isoformat()
-    })
+    return Response(RouteSnapshotSerializer(route, context={'geometry_format': geometry_format}).data)
 
 
 def check_and_reroute(booking, driver_location):
@@ -186,32 +192,108 @@ def manual_reroute(request, booking_id):
     if request.user != booking.driver:
         return Response({'error': 'Only the assigned driver can reroute'}, status=status.HTTP_403_FORBIDDEN)
     
-    try:
-        location = DriverLocation.objects.get(driver=request.user)
-        check_and_reroute(booking, location)
-        
-        return Response({'status': 'success', 'message': 'Route recalculated'})
-    except DriverLocation.DoesNotExist:
+    location = locations.get_location(request.user.id)
+    if location is None:
         return Response({'error': 'Driver location not available'}, status=status.HTTP_404_NOT_FOUND)
 
+    check_and_reroute(booking, location)
+    return Response({'status': 'success', 'message': 'Route recalculated'})
+
+
+ITINERARY_CACHE = cache_versions.CachedResponse('driver_itinerary', cache_versions.DRIVER)
+ITINERARY_SHAPE_PARAMS = ('geometry', 'segments', 'tolerance', 'zoom')
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def driver_itinerary(request):
-    """Return the consolidated itinerary for the authenticated driver."""
+    """Return the consolidated itinerary for the authenticated driver.
+
+    Optional query parameters shrink the route geometry (see itinerary_geometry):
+    `tolerance` (metres) or `zoom` to simplify, `geometry=polyline` for encoded
+    lines and `segments=ref` for legs that index into the full line.
+    """
     if request.user.trikego_user != 'D':
         return Response({'error': 'Only drivers can access the itinerary.'}, status=status.HTTP_403_FORBIDDEN)
 
-    active_bookings = Booking.objects.filter(
-        driver=request.user,
-        status__in=['accepted', 'on_the_way', 'started']
-    )
+    geometry = request.query_params.get('geometry', 'points')
+    segments = request.query_params.get('segments', 'inline')
+    if geometry not in itinerary_geometry.GEOMETRY_FORMATS:
+        return Response({'error': f"geometry must be one of {', '.join(itinerary_geometry.GEOMETRY_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    if segments not in itinerary_geometry.SEGMENT_MODES:
+        return Response({'error': f"segments must be one of {', '.join(itinerary_geometry.SEGMENT_MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
 
-    for booking in active_bookings:
-        ensure_booking_stops(booking)
+    # Checked before the cache lookup so a bad value never costs a build or gets cached
+    try:
+        tolerance_m, zoom = (
+            float(value) if value not in (None, '') else None
+            for value in (request.query_params.get('tolerance'), request.query_params.get('zoom'))
+        )
+        if any(value is not None and not math.isfinite(value) for value in (tolerance_m, zoom)):
+            raise ValueError
+    except ValueError:
+        return Response({'error': 'tolerance and zoom must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    variant = cache_versions.variant_from_params(request.query_params, ITINERARY_SHAPE_PARAMS)
+    version, entry = ITINERARY_CACHE.lookup(request.user.id, variant=variant)
+    if entry:
+        if cache_versions.is_not_modified(request, entry['etag']):
+            return cache_versions.not_modified(entry['etag'])
+        return cache_versions.tag_response(Response(entry['body']), entry['etag'])
+
+    payload = itinerary_stream.build_itinerary_payload(request.user)
+    itinerary = payload.get('itinerary')
+    if itinerary:
+        tolerance = itinerary_geometry.tolerance_from_params(
+            tolerance_m, zoom, itinerary_geometry.reference_latitude(itinerary),
+        )
+        payload['itinerary'] = itinerary_geometry.shape_itinerary(itinerary, tolerance, geometry, segments)
+    etag = ITINERARY_CACHE.store(request.user.id, version, payload, variant=variant)
+    if cache_versions.is_not_modified(request, etag):
+        return cache_versions.not_modified(etag)
+    return cache_versions.tag_response(Response(payload), etag)
 
-    payload = build_driver_itinerary(request.user)
-    return Response(payload)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def geocode_autocomplete(request):
+    """Address suggestions as ORS-style GeoJSON features, served from shared caches when possible."""
+    query = (request.query_params.get('text') or '').strip()
+    try:
+        size = max(1, min(int(request.query_params.get('size', 10)), 20))
+    except (TypeError, ValueError):
+        size = 10
+
+    focus_point = None
+    focus_lat = request.query_params.get('focus.lat')
+    focus_lon = request.query_params.get('focus.lon')
+    if focus_lat and focus_lon:
+        try:
+            focus_point = (float(focus_lon), float(focus_lat))
+        except (TypeError, ValueError):
+            focus_point = None
+
+    places, source = geocoding.autocomplete(query, focus_point=focus_point, limit=size)
+    return Response({
+        'type': 'FeatureCollection',
+        'features': [geocoding.as_feature(place) for place in places],
+        'source': source,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def geocode_reverse(request):
+    """Address for a map point, cached on rounded coordinates."""
+    try:
+        lat = float(request.query_params.get('lat'))
+        lon = float(request.query_params.get('lon'))
+    except (TypeError, ValueError):
+        return Response({'error': 'lat and lon are required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    place = geocoding.reverse(lat, lon)
+    features = [geocoding.as_feature(place)] if place else []
+    return Response({'type': 'FeatureCollection', 'features': features})
 
 
 @api_view(['POST'])
@@ -274,6 +356,7 @@ def complete_itinerary_stop(request):
     stop.status = 'COMPLETED'
     stop.completed_at = timezone.now()
     stop.save(update_fields=['status', 'completed_at', 'updated_at'])
+    itinerary_state.pop_stop(request.user.id, stop.id)
 
     booking = stop.booking
 
@@ -314,9 +397,8 @@ def complete_itinerary_stop(request):
         Driver.objects.filter(user=request.user).update(status='Online')
 
     # Ensure pick/drop pair consistency – if dropoff completed, mark booking passenger status handled above
-    plan_driver_stops(request.user)
-
-    payload = build_driver_itinerary(request.user)
+    payload = build_driver_itinerary(request.user, persist=True)
+    itinerary_stream.mark_itinerary_dirty(request.user.id)
     
     # Check if this was a dropoff completion and add completed booking info for payment modal
     if stop.stop_type == 'DROPOFF':
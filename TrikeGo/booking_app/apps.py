@@ -5,3 +5,6 @@ class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'booking_app'
     label = 'booking'
+
+    def ready(self) -> None:
+        from . import signals  # noqa: F401
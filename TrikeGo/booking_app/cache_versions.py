@@ -0,0 +1,195 @@
+"""Version counters and ETag-backed response caching for polled endpoints.
+
+Each booking and each driver has a version number in the cache. Anything that
+changes what `route_info` or `driver_itinerary` would return for them bumps the
+number. A cached response is stored with the version it was built from, its body
+and a content-hash ETag, so a poll is answered from one `get_many` of the
+entry and the current version:
+
+- the version moved on (or either key is gone): rebuild;
+- the client's If-None-Match holds the entry's ETag: 304 with no body;
+- otherwise: the cached body, without touching the database or ORS.
+
+Versions start from the clock rather than 1, so a counter that was evicted and
+recreated cannot line up with an entry built from the old one.
+
+Model changes bump versions from booking_app.signals; changes made with
+queryset updates or outside the database (GPS fixes) call
+`bump_driver_bookings` / `bump_passenger_bookings`. Nothing deletes response
+cache keys by name.
+"""
+import hashlib
+import json
+import logging
+import time
+from typing import Iterable, Optional, Set
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponseNotModified
+
+logger = logging.getLogger(__name__)
+
+BOOKING = 'booking'
+DRIVER = 'driver'
+
+OPEN_STATUSES = ('accepted', 'on_the_way', 'started')
+
+# Counters outlive any entry built from them
+VERSION_TTL = 7 * 24 * 60 * 60
+
+
+def version_key(scope: str, obj_id) -> str:
+    return f'cachever:{scope}:{obj_id}'
+
+
+def _entry_key(name: str, obj_id, variant) -> str:
+    return f'etag:{name}:{obj_id}:{variant}'
+
+
+def _seed() -> int:
+    return int(time.time() * 1000)
+
+
+def current_version(scope: str, obj_id) -> int:
+    key = version_key(scope, obj_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), timeout=VERSION_TTL)
+        version = cache.get(key)
+    return version if version is not None else _seed()
+
+
+def bump(scope: str, *obj_ids) -> None:
+    """Invalidate every cached response built from these objects."""
+    for obj_id in obj_ids:
+        if obj_id is None:
+            continue
+        key = version_key(scope, obj_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), timeout=VERSION_TTL)
+        except Exception as exc:
+            logger.warning('Could not bump %s: %s', key, exc)
+
+
+def bump_booking(*booking_ids) -> None:
+    bump(BOOKING, *booking_ids)
+
+
+def bump_driver(*driver_ids) -> None:
+    bump(DRIVER, *driver_ids)
+
+
+def bump_on_commit(scope: str, *obj_ids) -> None:
+    """Bump now and again once the transaction commits.
+
+    The first bump retires entries built before the change; the second retires
+    any entry a concurrent request rebuilt from rows that were not committed yet.
+    """
+    bump(scope, *obj_ids)
+    transaction.on_commit(lambda: bump(scope, *obj_ids))
+
+
+def bump_driver_bookings(driver_id) -> None:
+    """Retire route_info for every open booking of a driver (GPS fix, profile or trike change)."""
+    from .models import Booking
+
+    bump_booking(*Booking.objects.filter(
+        driver_id=driver_id, status__in=OPEN_STATUSES,
+    ).values_list('id', flat=True))
+
+
+def bump_passenger_bookings(passenger_id) -> None:
+    from .models import Booking
+
+    bump_booking(*Booking.objects.filter(
+        passenger_id=passenger_id, status__in=('pending',) + OPEN_STATUSES,
+    ).values_list('id', flat=True))
+
+
+def content_etag(payload) -> str:
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return '"%s"' % hashlib.md5(body.encode('utf-8')).hexdigest()
+
+
+def _request_etags(request) -> Set[str]:
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    tags = set()
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag:
+            tags.add(tag)
+    return tags
+
+
+class CachedResponse:
+    """A versioned response cache for one endpoint.
+
+    `lookup` returns the version to build against and, when still current, the
+    cached entry; `store` saves a freshly built body under that version.
+    """
+
+    def __init__(self, name: str, scope: str, timeout: Optional[int] = None):
+        self.name = name
+        self.scope = scope
+        self.timeout = timeout
+
+    def _timeout(self) -> int:
+        if self.timeout is not None:
+            return self.timeout
+        return int(getattr(settings, 'RESPONSE_CACHE_TTL', 120))
+
+    def lookup(self, obj_id, variant=''):
+        """Return (version, entry); entry is None unless it was built from the current version."""
+        entry_key = _entry_key(self.name, obj_id, variant)
+        ver_key = version_key(self.scope, obj_id)
+        try:
+            found = cache.get_many([entry_key, ver_key])
+        except Exception:
+            return None, None
+        version = found.get(ver_key)
+        if version is None:
+            return current_version(self.scope, obj_id), None
+        entry = found.get(entry_key)
+        if not entry or entry.get('version') != version:
+            return version, None
+        return version, entry
+
+    def store(self, obj_id, version, body, variant='') -> str:
+        etag = content_etag(body)
+        if version is not None:
+            try:
+                cache.set(
+                    _entry_key(self.name, obj_id, variant),
+                    {'version': version, 'etag': etag, 'body': body},
+                    timeout=self._timeout(),
+                )
+            except Exception as exc:
+                logger.warning('Could not cache %s response for %s: %s', self.name, obj_id, exc)
+        return etag
+
+
+def is_not_modified(request, etag: str) -> bool:
+    tags = _request_etags(request)
+    return bool(etag) and (etag in tags or '*' in tags)
+
+
+def not_modified(etag: str):
+    return tag_response(HttpResponseNotModified(), etag)
+
+
+def tag_response(response, etag: str):
+    """Attach the ETag; no-cache makes browsers revalidate every poll with If-None-Match."""
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def variant_from_params(params, names: Iterable[str]) -> str:
+    """Stable cache variant for the query parameters that shape a response."""
+    return '&'.join(f'{name}={params.get(name)}' for name in names if params.get(name) not in (None, ''))
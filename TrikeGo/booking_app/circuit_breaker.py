@@ -0,0 +1,171 @@
+"""Circuit breaker for openrouteservice calls.
+
+* closed: calls go through. Once at least ORS_BREAKER_MIN_CALLS calls were made in
+  the last ORS_BREAKER_WINDOW_SECONDS and ORS_BREAKER_FAILURE_RATIO of them failed
+  or took longer than ORS_BREAKER_SLOW_SECONDS, the breaker trips.
+* open: calls are rejected straight away (RoutingService answers from straight-line
+  estimates instead) for ORS_BREAKER_OPEN_SECONDS.
+* half-open: one probe call at a time is let through. Success closes the breaker,
+  failure opens it again.
+
+State is kept per process so a worker reacts to what it sees without a cache round
+trip; the trip/recovery counters are shared through the cache like the route cache
+stats.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+STAT_NAMES = ('trips', 'recoveries', 'rejected', 'probes')
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the protected service while the breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name, window_seconds=None, min_calls=None, failure_ratio=None,
+                 slow_seconds=None, open_seconds=None):
+        self.name = name
+        self.window_seconds = float(window_seconds if window_seconds is not None else getattr(settings, 'ORS_BREAKER_WINDOW_SECONDS', 60))
+        self.min_calls = int(min_calls if min_calls is not None else getattr(settings, 'ORS_BREAKER_MIN_CALLS', 5))
+        self.failure_ratio = float(failure_ratio if failure_ratio is not None else getattr(settings, 'ORS_BREAKER_FAILURE_RATIO', 0.5))
+        self.slow_seconds = float(slow_seconds if slow_seconds is not None else getattr(settings, 'ORS_BREAKER_SLOW_SECONDS', 8))
+        self.open_seconds = float(open_seconds if open_seconds is not None else getattr(settings, 'ORS_BREAKER_OPEN_SECONDS', 30))
+
+        self._lock = threading.Lock()
+        self._calls = deque()  # (timestamp, failed)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go through now. A True in half-open state claims the probe."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                allowed = True
+            else:
+                allowed = False
+        self._incr('probes' if allowed else 'rejected')
+        return allowed
+
+    def record_success(self, elapsed: float = 0.0) -> None:
+        if elapsed > self.slow_seconds:
+            # Too slow to be useful counts against ORS like an error
+            self.record_failure()
+            return
+        with self._lock:
+            now = time.monotonic()
+            recovered = self._current_state(now) == HALF_OPEN
+            if recovered:
+                self._state = CLOSED
+                self._probing = False
+                self._calls.clear()
+            else:
+                self._append(now, False)
+        if recovered:
+            logger.warning('Circuit %s closed: routing restored', self.name)
+            self._incr('recoveries')
+
+    def record_failure(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == HALF_OPEN:
+                tripped = True
+            else:
+                self._append(now, True)
+                failures = sum(1 for _, failed in self._calls if failed)
+                tripped = (
+                    state == CLOSED
+                    and len(self._calls) >= self.min_calls
+                    and failures >= self.failure_ratio * len(self._calls)
+                )
+            if tripped:
+                self._state = OPEN
+                self._opened_at = now
+                self._probing = False
+                self._calls.clear()
+        if tripped:
+            logger.warning('Circuit %s opened: serving degraded estimates for %ss', self.name, self.open_seconds)
+            self._incr('trips')
+
+    def call(self, func, *args, is_client_error=None, **kwargs):
+        """Run `func` through the breaker; raises CircuitOpenError when it is open.
+
+        Exceptions for which `is_client_error(exc)` is true (bad requests, unroutable
+        points) are re-raised but recorded as successes: they say nothing about the
+        health of the service.
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            if is_client_error is not None and is_client_error(exc):
+                self.record_success(time.monotonic() - started)
+            else:
+                self.record_failure()
+            raise
+        self.record_success(time.monotonic() - started)
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._probing = False
+            self._calls.clear()
+
+    def _append(self, now, failed) -> None:
+        self._calls.append((now, failed))
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _stats_key(self, name) -> str:
+        return f'circuit_stats:{self.name}:{name}'
+
+    def _incr(self, name) -> None:
+        key = self._stats_key(name)
+        try:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, object]:
+        """Shared trip/recovery/rejection counters plus this process's state."""
+        keys = {name: self._stats_key(name) for name in STAT_NAMES}
+        try:
+            values = cache.get_many(list(keys.values()))
+        except Exception:
+            values = {}
+        stats = {name: int(values.get(key) or 0) for name, key in keys.items()}
+        stats['state'] = self.state
+        return stats
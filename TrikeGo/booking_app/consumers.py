@@ -0,0 +1,86 @@
+from channels.generic.websocket import AsyncWebsocketConsumer
+import asyncio
+import json
+from channels.db import database_sync_to_async
+
+from .models import Booking
+from . import itinerary_stream, realtime
+
+
+class BookingTrackingConsumer(AsyncWebsocketConsumer):
+    """Live driver position, ETA and status for one booking.
+
+    Sends a full `tracking.snapshot` on connect, then `tracking.delta` messages
+    containing only the fields that changed.
+    """
+
+    async def connect(self):
+        self.booking_id = self.scope['url_route']['kwargs'].get('booking_id')
+        self.group_name = realtime.tracking_group(self.booking_id)
+
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.close()
+            return
+
+        snapshot = await database_sync_to_async(self._snapshot_for)(user.id)
+        if snapshot is None:
+            await self.close()
+            return
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send(text_data=json.dumps({'type': 'tracking.snapshot', 'data': snapshot}))
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def tracking_update(self, event):
+        await self.send(text_data=json.dumps({'type': 'tracking.delta', 'data': event['data']}))
+
+    def _snapshot_for(self, user_id):
+        booking = Booking.objects.filter(id=self.booking_id).first()
+        if not booking or user_id not in (booking.passenger_id, booking.driver_id):
+            return None
+        return realtime.tracking_state(booking)
+
+
+class DriverItineraryConsumer(AsyncWebsocketConsumer):
+    """The authenticated driver's itinerary: a snapshot, then diffs when inputs change."""
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated or getattr(user, 'trikego_user', None) != 'D':
+            await self.close()
+            return
+
+        self.driver_id = user.id
+        self.group_name = itinerary_stream.itinerary_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await database_sync_to_async(itinerary_stream.add_listener)(user.id, self.channel_name)
+        self.heartbeat = asyncio.ensure_future(self._heartbeat())
+        # Broadcast so every open tab shares the same base for later diffs
+        await database_sync_to_async(self._publish_snapshot)(user)
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'driver_id', None) is None:
+            return
+        heartbeat = getattr(self, 'heartbeat', None)
+        if heartbeat is not None:
+            heartbeat.cancel()
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        await database_sync_to_async(itinerary_stream.remove_listener)(self.driver_id, self.channel_name)
+
+    async def _heartbeat(self):
+        # Stops with the worker, so the listener key expires if disconnect never runs
+        while True:
+            await asyncio.sleep(itinerary_stream.LISTENER_HEARTBEAT_SECONDS)
+            await database_sync_to_async(itinerary_stream.refresh_listener)(self.driver_id, self.channel_name)
+
+    async def itinerary_update(self, event):
+        await self.send(text_data=json.dumps({'type': 'itinerary.update', 'data': event['data']}))
+
+    def _publish_snapshot(self, user):
+        payload = itinerary_stream.build_itinerary_payload(user)
+        itinerary_stream.publish_snapshot(user, payload)
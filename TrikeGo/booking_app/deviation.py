@@ -0,0 +1,202 @@
+"""Point-to-polyline route deviation checks.
+
+Each active `RouteSnapshot` is converted once into a `RouteGeometry`: its GeoJSON
+vertices are projected onto a local metric plane, split into indexed segments and
+bucketed into a coarse grid. A location check then measures the true distance to
+the nearest *segment* (not vertex), looking first just ahead of the segment the
+driver last matched and only falling back to the grid when that window misses.
+"""
+import math
+import threading
+from collections import OrderedDict, namedtuple
+from typing import List, Optional, Sequence, Tuple
+
+from django.core.cache import cache
+
+from .geo import EARTH_RADIUS_KM
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+METERS_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+
+# Grid bucket edge in metres; roughly one city block
+GRID_CELL_M = 250.0
+# Segments scanned around the last match before falling back to the grid
+LOOKBEHIND_SEGMENTS = 2
+LOOKAHEAD_SEGMENTS = 40
+# Geometries kept in this process; snapshots are immutable so entries never go stale
+GEOMETRY_CACHE_SIZE = 256
+PROGRESS_TTL = 60 * 60
+
+Match = namedtuple('Match', ['distance_m', 'segment', 'along_m'])
+DeviationResult = namedtuple('DeviationResult', ['off_route', 'distance_m', 'segment', 'progress_m', 'remaining_m'])
+
+
+class RouteGeometry:
+    """Projected, segment-indexed polyline for fast point-to-route queries."""
+
+    def __init__(self, coords: Sequence[Sequence[float]], cell_size_m: float = GRID_CELL_M):
+        """`coords` are GeoJSON (lon, lat) pairs."""
+        points = [(float(c[0]), float(c[1])) for c in coords]
+        if not points:
+            raise ValueError('Route has no coordinates')
+        if len(points) == 1:
+            points = points * 2
+
+        self.lat0 = sum(p[1] for p in points) / len(points)
+        self.kx = METERS_PER_DEGREE * math.cos(math.radians(self.lat0))
+        self.ky = METERS_PER_DEGREE
+        self.cell_size = float(cell_size_m)
+
+        self.xs = [lon * self.kx for lon, _ in points]
+        self.ys = [lat * self.ky for _, lat in points]
+        self.segment_count = len(points) - 1
+
+        # Cumulative distance at the start of each segment, plus the total at the end
+        self.cumulative: List[float] = [0.0]
+        self.bboxes: List[Tuple[float, float, float, float]] = []
+        self.grid = {}
+        for i in range(self.segment_count):
+            x1, y1, x2, y2 = self.xs[i], self.ys[i], self.xs[i + 1], self.ys[i + 1]
+            self.cumulative.append(self.cumulative[-1] + math.hypot(x2 - x1, y2 - y1))
+            bbox = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+            self.bboxes.append(bbox)
+            for cell in self._cells_in(bbox):
+                self.grid.setdefault(cell, []).append(i)
+
+    @property
+    def length_m(self) -> float:
+        return self.cumulative[-1]
+
+    def project(self, lat: float, lon: float) -> Tuple[float, float]:
+        return float(lon) * self.kx, float(lat) * self.ky
+
+    def _cells_in(self, bbox):
+        size = self.cell_size
+        min_cx, min_cy = int(math.floor(bbox[0] / size)), int(math.floor(bbox[1] / size))
+        max_cx, max_cy = int(math.floor(bbox[2] / size)), int(math.floor(bbox[3] / size))
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                yield cx, cy
+
+    def _segment_distance(self, i: int, x: float, y: float) -> Tuple[float, float]:
+        """Distance from (x, y) to segment i and the distance along it to the foot point."""
+        x1, y1 = self.xs[i], self.ys[i]
+        dx, dy = self.xs[i + 1] - x1, self.ys[i + 1] - y1
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            t = 0.0
+        else:
+            t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length_sq))
+        px, py = x1 + t * dx, y1 + t * dy
+        return math.hypot(x - px, y - py), t * math.sqrt(length_sq)
+
+    def _best_of(self, segments, x: float, y: float, radius_m: float) -> Optional[Match]:
+        best = None
+        for i in segments:
+            bx1, by1, bx2, by2 = self.bboxes[i]
+            # Skip segments whose bounding box is already further than the radius or current best
+            limit = best.distance_m if best else radius_m
+            if x < bx1 - limit or x > bx2 + limit or y < by1 - limit or y > by2 + limit:
+                continue
+            distance, along = self._segment_distance(i, x, y)
+            if best is None or distance < best.distance_m:
+                best = Match(distance, i, self.cumulative[i] + along)
+        return best
+
+    def locate(self, lat: float, lon: float, radius_m: float, hint: Optional[int] = None) -> Optional[Match]:
+        """Nearest segment within `radius_m` of the point, or None when the route is further away.
+
+        When `hint` (the last matched segment) is given, segments just behind and
+        ahead of it are tried first so the driver's progress only moves forward
+        on routes that double back on themselves.
+        """
+        x, y = self.project(lat, lon)
+        if hint is not None and 0 <= hint < self.segment_count:
+            # Forward segments first so ties on overlapping legs keep the later one
+            window = list(range(hint, min(self.segment_count, hint + LOOKAHEAD_SEGMENTS + 1)))
+            window += range(max(0, hint - LOOKBEHIND_SEGMENTS), hint)
+            match = self._best_of(window, x, y, radius_m)
+            if match is not None and match.distance_m <= radius_m:
+                return match
+
+        span = int(2 * radius_m / self.cell_size) + 1
+        if span * span > self.segment_count:
+            # A query box this large touches more cells than there are segments
+            candidates = range(self.segment_count)
+        else:
+            found = set()
+            for cell in self._cells_in((x - radius_m, y - radius_m, x + radius_m, y + radius_m)):
+                found.update(self.grid.get(cell, ()))
+            candidates = sorted(found)
+        match = self._best_of(candidates, x, y, radius_m)
+        if match is not None and match.distance_m <= radius_m:
+            return match
+        return None
+
+
+_geometry_cache = OrderedDict()
+_geometry_lock = threading.Lock()
+
+
+def geometry_for_snapshot(snapshot) -> Optional[RouteGeometry]:
+    """Return the (cached) RouteGeometry for a RouteSnapshot, or None when it has no line."""
+    if snapshot is None:
+        return None
+    key = snapshot.pk
+    with _geometry_lock:
+        geometry = _geometry_cache.get(key)
+        if geometry is not None:
+            _geometry_cache.move_to_end(key)
+            return geometry
+
+    try:
+        coords = getattr(snapshot, 'coordinates', None)
+        if coords is None:
+            # Plain objects that only carry the ORS response
+            coords = snapshot.route_data['features'][0]['geometry']['coordinates']
+        geometry = RouteGeometry(coords)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+    if key is not None:
+        with _geometry_lock:
+            _geometry_cache[key] = geometry
+            while len(_geometry_cache) > GEOMETRY_CACHE_SIZE:
+                _geometry_cache.popitem(last=False)
+    return geometry
+
+
+def forget_snapshot(snapshot_id) -> None:
+    with _geometry_lock:
+        _geometry_cache.pop(snapshot_id, None)
+    cache.delete(_progress_key(snapshot_id))
+
+
+def _progress_key(snapshot_id) -> str:
+    return f'route_progress:{snapshot_id}'
+
+
+def check_deviation(snapshot, lat: float, lon: float, threshold_m: float = 100) -> Optional[DeviationResult]:
+    """Measure how far (lat, lon) is from the snapshot's route and record progress.
+
+    Returns None when the snapshot has no usable geometry.
+    """
+    geometry = geometry_for_snapshot(snapshot)
+    if geometry is None:
+        return None
+
+    progress_key = _progress_key(snapshot.pk)
+    hint = cache.get(progress_key) if snapshot.pk is not None else None
+    match = geometry.locate(lat, lon, float(threshold_m), hint=hint)
+    if match is None:
+        return DeviationResult(True, None, hint, None, None)
+
+    if snapshot.pk is not None and match.segment != hint:
+        cache.set(progress_key, match.segment, timeout=PROGRESS_TTL)
+    return DeviationResult(
+        False,
+        match.distance_m,
+        match.segment,
+        match.along_m,
+        max(0.0, geometry.length_m - match.along_m),
+    )
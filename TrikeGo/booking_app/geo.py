@@ -0,0 +1,97 @@
+"""Haversine distance kernels shared by booking planning and rerouting.
+
+Points are (lat, lon) tuples in decimal degrees and distances are kilometres.
+The batched helpers use NumPy when it is installed and fall back to plain Python
+otherwise; both paths return the same values to floating point precision.
+"""
+import math
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover - numpy is optional at runtime
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+
+# Below this many pairs the NumPy call overhead outweighs the vectorised maths
+NUMPY_MIN_PAIRS = 16
+
+Point = Tuple[float, float]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres."""
+    ph1 = math.radians(lat1)
+    ph2 = math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(ph1) * math.cos(ph2) * math.sin(d_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def _distances_to_many_py(point: Point, points: Sequence[Point]) -> List[float]:
+    lat, lon = float(point[0]), float(point[1])
+    return [haversine_km(lat, lon, float(p[0]), float(p[1])) for p in points]
+
+
+def _distance_matrix_py(points_a: Sequence[Point], points_b: Sequence[Point]) -> List[List[float]]:
+    return [_distances_to_many_py(a, points_b) for a in points_a]
+
+
+def _haversine_np(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    # Clip guards against a drifting a > 1 for antipodal points
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(np.clip(1 - a, 0.0, None)))
+
+
+def _as_array(points: Sequence[Point]):
+    arr = np.asarray(points, dtype=float)
+    return arr.reshape(-1, 2)
+
+
+def _distances_to_many_np(point: Point, points: Sequence[Point]) -> List[float]:
+    arr = _as_array(points)
+    return _haversine_np(float(point[0]), float(point[1]), arr[:, 0], arr[:, 1]).tolist()
+
+
+def _distance_matrix_np(points_a: Sequence[Point], points_b: Sequence[Point]) -> List[List[float]]:
+    a = _as_array(points_a)
+    b = _as_array(points_b)
+    return _haversine_np(a[:, 0:1], a[:, 1:2], b[:, 0][None, :], b[:, 1][None, :]).tolist()
+
+
+def distances_to_many(point: Point, points: Sequence[Point]) -> List[float]:
+    """Distances in km from `point` to each entry of `points`, in order."""
+    if not points:
+        return []
+    if np is not None and len(points) >= NUMPY_MIN_PAIRS:
+        return _distances_to_many_np(point, points)
+    return _distances_to_many_py(point, points)
+
+
+def distance_matrix(points_a: Sequence[Point], points_b: Sequence[Point]) -> List[List[float]]:
+    """Matrix of distances in km where row i, column j is points_a[i] -> points_b[j]."""
+    if not points_a:
+        return []
+    if not points_b:
+        return [[] for _ in points_a]
+    if np is not None and len(points_a) * len(points_b) >= NUMPY_MIN_PAIRS:
+        return _distance_matrix_np(points_a, points_b)
+    return _distance_matrix_py(points_a, points_b)
+
+
+def nearest(point: Point, points: Sequence[Point]) -> Optional[Tuple[int, float]]:
+    """Index and distance in km of the entry of `points` closest to `point`."""
+    if not points:
+        return None
+    if np is not None and len(points) >= NUMPY_MIN_PAIRS:
+        arr = _as_array(points)
+        dists = _haversine_np(float(point[0]), float(point[1]), arr[:, 0], arr[:, 1])
+        idx = int(np.argmin(dists))
+        return idx, float(dists[idx])
+    dists = _distances_to_many_py(point, points)
+    idx = min(range(len(dists)), key=dists.__getitem__)
+    return idx, dists[idx]
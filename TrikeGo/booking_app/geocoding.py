@@ -0,0 +1,287 @@
+"""Cached geocoding and address autocomplete in front of openrouteservice.
+
+The browser used to call ORS `/geocode/search` on every keystroke. Lookups now go
+through the server so every user shares the same caches and one upstream quota:
+
+* forward lookups are cached on the normalised query text (plus a coarse focus
+  point), so "SM City  Cebu" and "sm city cebu" are one entry;
+* reverse lookups are cached on coordinates rounded to GEOCODE_REVERSE_PRECISION
+  decimal places, so nearby map clicks share a result;
+* a per-process prefix index, seeded from past booking addresses and from every
+  resolved result, answers common places without any network I/O;
+* upstream calls are capped at GEOCODE_UPSTREAM_PER_MINUTE across all workers.
+  Over the cap, autocomplete answers from the index and caches only.
+
+Places are dicts shaped like `RoutingService.geocode_address` results:
+{'formatted', 'name', 'lat', 'lon'}.
+"""
+import bisect
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .services import RoutingService
+
+logger = logging.getLogger(__name__)
+
+Place = Dict[str, object]
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_query(text) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class PrefixIndex:
+    """Sorted array of normalised place names for prefix lookups.
+
+    Each place is indexed under its full label and its short name. Once
+    `max_entries` places are held, the oldest ones are dropped first.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = int(max_entries if max_entries is not None else _setting('GEOCODE_INDEX_MAX_ENTRIES', 5000))
+        self._lock = threading.Lock()
+        self._keys: List[Tuple[str, str]] = []  # (indexed text, place id), sorted
+        self._places: 'OrderedDict[str, Place]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+    @staticmethod
+    def _place_id(place: Place) -> str:
+        return f"{normalize_query(place.get('formatted'))}|{float(place['lat']):.5f},{float(place['lon']):.5f}"
+
+    @staticmethod
+    def _texts(place: Place):
+        texts = {normalize_query(place.get('formatted')), normalize_query(place.get('name'))}
+        texts.discard('')
+        return texts
+
+    def add(self, place: Place) -> None:
+        if not place or place.get('lat') is None or place.get('lon') is None:
+            return
+        texts = self._texts(place)
+        if not texts:
+            return
+        place_id = self._place_id(place)
+        with self._lock:
+            if place_id in self._places:
+                self._places.move_to_end(place_id)
+                return
+            self._places[place_id] = dict(place)
+            for text in texts:
+                bisect.insort(self._keys, (text, place_id))
+            while len(self._places) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        place_id, place = self._places.popitem(last=False)
+        for text in self._texts(place):
+            i = bisect.bisect_left(self._keys, (text, place_id))
+            if i < len(self._keys) and self._keys[i] == (text, place_id):
+                del self._keys[i]
+
+    def search(self, prefix: str, limit: int = 10) -> List[Place]:
+        """Places whose label or name starts with the normalised `prefix`."""
+        prefix = normalize_query(prefix)
+        if not prefix:
+            return []
+        found: List[Place] = []
+        seen = set()
+        with self._lock:
+            i = bisect.bisect_left(self._keys, (prefix, ''))
+            while i < len(self._keys) and len(found) < limit:
+                text, place_id = self._keys[i]
+                if not text.startswith(prefix):
+                    break
+                if place_id not in seen:
+                    seen.add(place_id)
+                    found.append(dict(self._places[place_id]))
+                i += 1
+        return found
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+            self._places.clear()
+
+
+place_index = PrefixIndex()
+_seed_lock = threading.Lock()
+_seeded = False
+
+
+def _booking_places(booking):
+    for address, lat, lon in (
+        (booking.pickup_address, booking.pickup_latitude, booking.pickup_longitude),
+        (booking.destination_address, booking.destination_latitude, booking.destination_longitude),
+    ):
+        if address and lat is not None and lon is not None:
+            yield {'formatted': address, 'name': address.split(',')[0], 'lat': float(lat), 'lon': float(lon)}
+
+
+def remember_booking(booking) -> None:
+    """Add a booking's pickup and destination to the local index."""
+    for place in _booking_places(booking):
+        place_index.add(place)
+
+
+def seed_index(force=False) -> int:
+    """Fill the index from the most recent bookings once per process. Returns places added."""
+    global _seeded
+    from .models import Booking
+
+    with _seed_lock:
+        if _seeded and not force:
+            return 0
+        _seeded = True
+        before = len(place_index)
+        limit = int(_setting('GEOCODE_INDEX_SEED_LIMIT', 2000))
+        try:
+            bookings = Booking.objects.only(
+                'pickup_address', 'pickup_latitude', 'pickup_longitude',
+                'destination_address', 'destination_latitude', 'destination_longitude',
+            ).order_by('-booking_time')[:limit]
+            # Oldest first, so the newest places are the last to be evicted
+            for booking in reversed(list(bookings)):
+                remember_booking(booking)
+        except Exception as exc:
+            logger.warning('Could not seed the geocoding index: %s', exc)
+        return len(place_index) - before
+
+
+def _forward_key(normalized: str, focus_point) -> str:
+    focus = ''
+    if focus_point:
+        # ~1 km buckets: the bias barely changes within a neighbourhood
+        focus = f'{float(focus_point[0]):.2f},{float(focus_point[1]):.2f}'
+    digest = hashlib.md5(f'{normalized}|{focus}'.encode('utf-8')).hexdigest()
+    return f'geocode:fwd:{digest}'
+
+
+def _reverse_key(lat, lon) -> str:
+    p = int(_setting('GEOCODE_REVERSE_PRECISION', 4))
+    return f'geocode:rev:{float(lat):.{p}f},{float(lon):.{p}f}'
+
+
+def _take_upstream_slot() -> bool:
+    """Count one upstream call against the shared per-minute quota."""
+    per_minute = int(_setting('GEOCODE_UPSTREAM_PER_MINUTE', 60))
+    if per_minute <= 0:
+        return True
+    key = f'geocode:quota:{int(time.time() // 60)}'
+    try:
+        cache.add(key, 0, timeout=120)
+        used = cache.incr(key)
+    except Exception:
+        return True
+    if used > per_minute:
+        logger.info('Geocoding quota of %s/min reached; answering from local data', per_minute)
+        return False
+    return True
+
+
+def geocode(query, focus_point=None) -> Tuple[List[Place], str]:
+    """Forward geocode through the shared cache. Returns (places, source).
+
+    `source` is 'cache', 'upstream' or 'quota' (over quota, nothing fetched).
+    `focus_point` is (lon, lat) like `RoutingService.geocode_address`.
+    """
+    normalized = normalize_query(query)
+    if not normalized:
+        return [], 'cache'
+    key = _forward_key(normalized, focus_point)
+    try:
+        cached = cache.get(key)
+    except Exception:
+        cached = None
+    if cached is not None:
+        return list(cached), 'cache'
+
+    if not _take_upstream_slot():
+        return [], 'quota'
+    results = RoutingService().geocode_address(query, focus_point=focus_point)
+    if results:
+        # Empty lists are not cached: geocode_address also returns [] on errors
+        try:
+            cache.set(key, results, timeout=int(_setting('GEOCODE_CACHE_TTL', 7 * 24 * 60 * 60)))
+        except Exception as exc:
+            logger.warning('Could not cache geocoding results for %r: %s', normalized, exc)
+        for place in results:
+            place_index.add(place)
+    return results, 'upstream'
+
+
+def reverse(lat, lon) -> Optional[Place]:
+    """Reverse geocode through a cache keyed on rounded coordinates."""
+    key = _reverse_key(lat, lon)
+    try:
+        cached = cache.get(key)
+    except Exception:
+        cached = None
+    if cached is not None:
+        return dict(cached, lat=float(lat), lon=float(lon))
+
+    if not _take_upstream_slot():
+        return None
+    place = RoutingService().reverse_geocode(lat, lon)
+    if place:
+        try:
+            cache.set(key, place, timeout=int(_setting('GEOCODE_CACHE_TTL', 7 * 24 * 60 * 60)))
+        except Exception as exc:
+            logger.warning('Could not cache reverse geocoding for %s: %s', key, exc)
+        place_index.add(place)
+    return place
+
+
+def autocomplete(query, focus_point=None, limit=10) -> Tuple[List[Place], str]:
+    """Suggestions for a partially typed address. Returns (places, source).
+
+    Answers from the local index alone ('local') once it has at least
+    GEOCODE_LOCAL_MIN_RESULTS matches; otherwise index matches come first,
+    followed by cached or upstream results.
+    """
+    normalized = normalize_query(query)
+    if len(normalized) < int(_setting('GEOCODE_MIN_QUERY_LENGTH', 3)):
+        return [], 'local'
+    seed_index()
+
+    local = place_index.search(normalized, limit)
+    if len(local) >= min(limit, int(_setting('GEOCODE_LOCAL_MIN_RESULTS', 5))):
+        return local, 'local'
+
+    remote, source = geocode(query, focus_point=focus_point)
+    merged = list(local)
+    seen = {PrefixIndex._place_id(place) for place in local}
+    for place in remote:
+        place_id = PrefixIndex._place_id(place)
+        if place_id not in seen:
+            seen.add(place_id)
+            merged.append(place)
+    return merged[:limit], source
+
+
+def as_feature(place: Place) -> Dict[str, object]:
+    """GeoJSON feature in the shape ORS geocoding returns, for the browser widgets."""
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [place['lon'], place['lat']]},
+        'properties': {'label': place.get('formatted', ''), 'name': place.get('name', '')},
+    }
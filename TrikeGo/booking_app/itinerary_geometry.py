@@ -0,0 +1,103 @@
+"""Compact route geometry for driver itinerary payloads.
+
+`build_driver_itinerary` returns the whole itinerary line (`fullRoutePolyline`)
+and every leg again in `fullRouteSegments`, each as [lat, lon] float pairs with
+every ORS vertex. `shape_itinerary` trims that for clients that ask:
+
+- a Douglas-Peucker `tolerance` in metres (or one derived from the map zoom),
+  applied per leg so stop positions are never moved or dropped;
+- `geometry='polyline'` sends lines as encoded polyline strings;
+- `segments='ref'` drops per-leg points and gives each leg a `pointRange`
+  [first, last] of indexes into `fullRoutePolyline` instead.
+
+The default arguments leave the payload unchanged.
+"""
+import copy
+from typing import Dict, List, Optional, Sequence
+
+from . import polyline
+
+GEOMETRY_FORMATS = ('points', 'polyline')
+SEGMENT_MODES = ('inline', 'ref')
+
+# Tolerance derived from a zoom level keeps the line within this many screen pixels
+ZOOM_TOLERANCE_PIXELS = 1.0
+MAX_TOLERANCE_METERS = 500.0
+
+
+def tolerance_from_params(tolerance=None, zoom=None, latitude: float = 0.0) -> float:
+    """Metres of tolerance from a `tolerance` or `zoom` request parameter; 0 disables.
+
+    Raises ValueError for values that are not numbers.
+    """
+    if tolerance not in (None, ''):
+        return min(max(0.0, float(tolerance)), MAX_TOLERANCE_METERS)
+    if zoom not in (None, ''):
+        zoom = min(max(0.0, float(zoom)), 22.0)
+        return min(polyline.tolerance_for_zoom(zoom, latitude, ZOOM_TOLERANCE_PIXELS), MAX_TOLERANCE_METERS)
+    return 0.0
+
+
+def _simplify(points: Sequence[Sequence[float]], tolerance_m: float) -> List[List[float]]:
+    points = [[float(p[0]), float(p[1])] for p in points]
+    if tolerance_m <= 0 or len(points) < 3:
+        return points
+    return [list(p) for p in polyline.simplify([tuple(p) for p in points], tolerance_m)]
+
+
+def _join(line: List[List[float]], points: List[List[float]]) -> List[int]:
+    """Append a leg to the line, sharing the joint vertex; returns the leg's [first, last] indexes."""
+    if line and points and line[-1] == points[0]:
+        first = len(line) - 1
+        line.extend(points[1:])
+    else:
+        first = len(line)
+        line.extend(points)
+    return [first, len(line) - 1]
+
+
+def shape_itinerary(
+    itinerary: Dict[str, object],
+    tolerance_m: float = 0.0,
+    geometry: str = 'points',
+    segments: str = 'inline',
+) -> Dict[str, object]:
+    """Return a copy of the itinerary dict with its route geometry simplified and encoded as asked."""
+    if tolerance_m <= 0 and geometry == 'points' and segments == 'inline':
+        return itinerary
+
+    shaped = dict(itinerary)
+    legs = [copy.copy(leg) for leg in (itinerary.get('fullRouteSegments') or [])]
+    full_line = list(itinerary.get('fullRoutePolyline') or [])
+
+    if segments == 'ref' and legs:
+        line: List[List[float]] = [[float(full_line[0][0]), float(full_line[0][1])]] if full_line else []
+        for leg in legs:
+            leg['pointRange'] = _join(line, _simplify(leg.pop('points', None) or [], tolerance_m))
+    else:
+        line = _simplify(full_line, tolerance_m)
+        for leg in legs:
+            points = _simplify(leg.get('points') or [], tolerance_m)
+            leg['points'] = polyline.encode(points) if geometry == 'polyline' else points
+
+    if geometry == 'polyline':
+        shaped['fullRoutePolyline'] = polyline.encode(line)
+        shaped['polylinePrecision'] = polyline.DEFAULT_PRECISION
+    else:
+        shaped['fullRoutePolyline'] = line
+    shaped['fullRouteSegments'] = legs
+    shaped['geometryFormat'] = geometry
+    shaped['segmentMode'] = segments
+    shaped['simplifyToleranceMeters'] = round(tolerance_m, 2)
+    return shaped
+
+
+def reference_latitude(itinerary: Dict[str, object]) -> float:
+    """Latitude used to turn a zoom level into metres; the driver's start or first stop."""
+    start: Optional[Sequence[float]] = itinerary.get('driverStartCoordinate')
+    if start:
+        return float(start[0])
+    for stop in itinerary.get('stops') or []:
+        if stop.get('coordinates'):
+            return float(stop['coordinates'][0])
+    return 0.0
@@ -0,0 +1,87 @@
+"""Per-driver itinerary state kept in the cache between requests.
+
+Two things are cached for each driver:
+
+* the order of their pending stops, as (stop_id, booking_id) pairs. It is updated
+  incrementally: new bookings are inserted at their cheapest position (see
+  utils.order_driver_stops), completed stops are popped and stops of cancelled or
+  reassigned bookings are removed. A full re-solve only happens when there is no
+  cached order.
+* the routed legs between stops (polyline points and distance/ETA metadata), so an
+  itinerary read only routes the legs that changed, usually just the driver's leg.
+
+Every reader reconciles the cached order against the stops in the database, so a
+missed event costs an insertion, not a wrong itinerary.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+STATE_TTL = 6 * 60 * 60
+
+
+def _order_key(driver_id) -> str:
+    return f'driver_stop_order:{driver_id}'
+
+
+def _segments_key(driver_id) -> str:
+    return f'driver_segments:{driver_id}'
+
+
+def get_order(driver_id) -> Optional[List[Tuple[int, int]]]:
+    """Cached (stop_id, booking_id) pairs in visiting order, or None when unknown."""
+    try:
+        order = cache.get(_order_key(driver_id))
+    except Exception:
+        return None
+    return [tuple(item) for item in order] if order is not None else None
+
+
+def store_order(driver_id, order: Iterable[Tuple[int, int]]) -> None:
+    try:
+        cache.set(_order_key(driver_id), [list(item) for item in order], timeout=STATE_TTL)
+    except Exception as exc:
+        logger.warning('Could not cache stop order for driver %s: %s', driver_id, exc)
+
+
+def _drop(driver_id, keep) -> None:
+    order = get_order(driver_id)
+    if order is None:
+        return
+    remaining = [item for item in order if keep(item)]
+    if len(remaining) != len(order):
+        store_order(driver_id, remaining)
+
+
+def pop_stop(driver_id, stop_id) -> None:
+    """A stop was completed: it no longer belongs to the pending order."""
+    _drop(driver_id, lambda item: item[0] != stop_id)
+
+
+def remove_booking(driver_id, booking_id) -> None:
+    """A booking left the driver (cancelled, reassigned or finished)."""
+    _drop(driver_id, lambda item: item[1] != booking_id)
+
+
+def forget(driver_id) -> None:
+    try:
+        cache.delete_many([_order_key(driver_id), _segments_key(driver_id)])
+    except Exception:
+        pass
+
+
+def get_segments(driver_id) -> Dict[tuple, tuple]:
+    try:
+        return dict(cache.get(_segments_key(driver_id)) or {})
+    except Exception:
+        return {}
+
+
+def store_segments(driver_id, segments: Dict[tuple, tuple]) -> None:
+    try:
+        cache.set(_segments_key(driver_id), segments, timeout=STATE_TTL)
+    except Exception as exc:
+        logger.warning('Could not cache route segments for driver %s: %s', driver_id, exc)
@@ -0,0 +1,189 @@
+"""Push a driver's itinerary over Channels when one of its inputs changes.
+
+The itinerary is only rebuilt when something it depends on changes: a booking
+assigned to the driver is accepted, cancelled or changes status, a stop is
+completed, or the driver has moved ITINERARY_RECOMPUTE_MOVE_METERS since the
+last build. Nothing is rebuilt for drivers without an open itinerary socket.
+Each socket registers its channel name with a key that expires after
+LISTENER_TTL unless its consumer's heartbeat refreshes it, so a worker that dies
+without a disconnect stops counting as a listener within that time.
+Subscribers get a full snapshot first and then diffs of the itinerary keys that
+changed.
+"""
+import logging
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .geo import haversine_km
+from . import cache_versions, locations, realtime
+from .spatial import CellSets
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('accepted', 'on_the_way', 'started')
+STATE_TTL = 6 * 60 * 60
+# Consumers refresh their listener key every LISTENER_HEARTBEAT_SECONDS
+LISTENER_TTL = 90
+LISTENER_HEARTBEAT_SECONDS = 30
+
+_listeners = CellSets()
+
+
+def itinerary_group(driver_id) -> str:
+    return f'driver_itinerary_{driver_id}'
+
+
+def _listeners_key(driver_id) -> str:
+    return f'driver_itin_listeners:{driver_id}'
+
+
+def _listener_key(driver_id, channel_name) -> str:
+    return f'driver_itin_listener:{driver_id}:{channel_name}'
+
+
+def _anchor_key(driver_id) -> str:
+    return f'driver_itin_anchor:{driver_id}'
+
+
+def _payload_key(driver_id) -> str:
+    return f'driver_itin_payload:{driver_id}'
+
+
+def _pending_key(driver_id) -> str:
+    return f'driver_itin_pending:{driver_id}'
+
+
+def build_itinerary_payload(driver_user) -> Dict[str, object]:
+    """Build the itinerary payload and remember where the driver was when it was built."""
+    from .models import Booking
+    from .utils import build_driver_itinerary, ensure_booking_stops
+
+    for booking in Booking.objects.filter(driver=driver_user, status__in=ACTIVE_STATUSES):
+        ensure_booking_stops(booking)
+
+    payload = build_driver_itinerary(driver_user)
+    coords = locations.get_coordinates(driver_user.id)
+    if coords:
+        cache.set(_anchor_key(driver_user.id), coords, timeout=STATE_TTL)
+    return payload
+
+
+def add_listener(driver_id, channel_name) -> None:
+    refresh_listener(driver_id, channel_name)
+    _listeners.add(_listeners_key(driver_id), channel_name)
+
+
+def refresh_listener(driver_id, channel_name) -> None:
+    """Heartbeat: keep one socket counted for another LISTENER_TTL seconds."""
+    cache.set(_listener_key(driver_id, channel_name), 1, timeout=LISTENER_TTL)
+
+
+def remove_listener(driver_id, channel_name) -> None:
+    cache.delete(_listener_key(driver_id, channel_name))
+    _listeners.discard(_listeners_key(driver_id), channel_name)
+    if not has_listeners(driver_id):
+        cache.delete(_payload_key(driver_id))
+
+
+def has_listeners(driver_id) -> bool:
+    """True while at least one socket's heartbeat is current; prunes the expired ones."""
+    key = _listeners_key(driver_id)
+    channel_names = _listeners.members_many([key]).get(key)
+    if not channel_names:
+        return False
+    alive = cache.get_many([_listener_key(driver_id, name) for name in channel_names])
+    expired = [name for name in channel_names if _listener_key(driver_id, name) not in alive]
+    if expired:
+        _listeners.discard(key, *expired)
+    return bool(alive)
+
+
+def itinerary_diff(previous: Optional[Dict[str, object]], current: Dict[str, object]) -> Dict[str, object]:
+    """Top-level itinerary keys that changed or disappeared."""
+    previous = previous or {}
+    changed = {key: value for key, value in current.items() if previous.get(key) != value}
+    removed = [key for key in previous if key not in current]
+    return {'changed': changed, 'removed': removed}
+
+
+def _send(driver_id, message) -> None:
+    realtime.group_send(itinerary_group(driver_id), {'type': 'itinerary.update', 'data': message})
+
+
+def publish_snapshot(driver_user, payload: Dict[str, object]) -> None:
+    """Send a full itinerary to every open socket and make it the base for later diffs."""
+    cache.set(_payload_key(driver_user.id), payload, timeout=STATE_TTL)
+    _send(driver_user.id, {'kind': 'snapshot', **payload})
+
+
+def push_itinerary(driver_id) -> Optional[Dict[str, object]]:
+    """Rebuild the itinerary and push whatever changed. Returns the message sent."""
+    from django.contrib.auth import get_user_model
+
+    if not has_listeners(driver_id):
+        return None
+    driver_user = get_user_model().objects.filter(id=driver_id).first()
+    if driver_user is None:
+        return None
+
+    payload = build_itinerary_payload(driver_user)
+    previous = cache.get(_payload_key(driver_id))
+    if previous is None:
+        publish_snapshot(driver_user, payload)
+        return {'kind': 'snapshot', **payload}
+
+    diff = itinerary_diff(previous.get('itinerary'), payload.get('itinerary') or {})
+    status_changed = previous.get('driverStatus') != payload.get('driverStatus')
+    if not diff['changed'] and not diff['removed'] and not status_changed:
+        return None
+
+    cache.set(_payload_key(driver_id), payload, timeout=STATE_TTL)
+    message = {'kind': 'diff', 'driverStatus': payload.get('driverStatus'), **diff}
+    _send(driver_id, message)
+    return message
+
+
+def mark_itinerary_dirty(driver_id) -> bool:
+    """Schedule an itinerary rebuild for a driver with open sockets. Returns True if queued.
+
+    Also retires cached `driver_itinerary` responses, sockets or not.
+    """
+    if not driver_id:
+        return False
+    cache_versions.bump_driver(driver_id)
+    if not has_listeners(driver_id):
+        return False
+
+    try:
+        from .tasks import push_driver_itinerary
+    except Exception:  # pragma: no cover - Celery is optional
+        push_driver_itinerary = None
+
+    window = max(0, int(getattr(settings, 'ITINERARY_PUSH_DEBOUNCE_SECONDS', 2)))
+    if window and not cache.add(_pending_key(driver_id), 1, timeout=window):
+        return False
+    try:
+        if push_driver_itinerary is None:
+            push_itinerary(driver_id)
+        else:
+            push_driver_itinerary.apply_async(args=[driver_id], countdown=window)
+    except Exception as exc:
+        cache.delete(_pending_key(driver_id))
+        logger.warning('Could not queue itinerary push for driver %s: %s', driver_id, exc)
+        return False
+    return True
+
+
+def on_driver_moved(driver_id, fix) -> bool:
+    """Mark the itinerary dirty once the driver is far enough from the last build point."""
+    if fix is None:
+        return False
+    anchor = cache.get(_anchor_key(driver_id))
+    threshold_m = float(getattr(settings, 'ITINERARY_RECOMPUTE_MOVE_METERS', 150))
+    if anchor is not None:
+        moved_m = haversine_km(anchor[0], anchor[1], fix.latitude, fix.longitude) * 1000
+        if moved_m < threshold_m:
+            return False
+    return mark_itinerary_dirty(driver_id)
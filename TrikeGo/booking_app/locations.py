@@ -0,0 +1,254 @@
+"""Driver location service: the one place driver positions are read and written.
+
+`DriverLocation` (one row per driver, unique on driver) is the only database
+storage. Driver pings land in the cache first: the latest fix per driver is kept
+under `driver_loc:<id>` and every reader goes through `get_location`,
+`get_coordinates` or the bulk `get_locations`. `flush_locations` (run periodically
+by Celery beat) writes the fixes that changed since the previous flush in a
+handful of bulk queries instead of one upsert per ping.
+
+With `DRIVER_LOCATION_WRITE_BEHIND` off (the default when Celery runs eagerly and
+there is no beat process) fixes are written through to the database immediately.
+"""
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .spatial import CellSets
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'driver_loc'
+# Set of drivers with buffered fixes; SADD/SREM on Redis, so concurrent pings and
+# flushes never overwrite each other's changes
+REGISTRY_KEY = f'{KEY_PREFIX}:registry'
+# Drivers re-register at most this often; a flush that drops a driver just as it
+# pings is repaired by its first ping after the flush
+KNOWN_TTL = 60
+
+_registry = CellSets()
+
+LocationFix = namedtuple('LocationFix', ['latitude', 'longitude', 'heading', 'speed', 'accuracy', 'timestamp'])
+
+
+def _entry_key(driver_id) -> str:
+    return f'{KEY_PREFIX}:{driver_id}'
+
+
+def _flushed_key(driver_id) -> str:
+    return f'{KEY_PREFIX}:flushed:{driver_id}'
+
+
+def _known_key(driver_id) -> str:
+    return f'{KEY_PREFIX}:known:{driver_id}'
+
+
+def _ttl() -> int:
+    return int(getattr(settings, 'DRIVER_LOCATION_STORE_TTL', 60 * 60))
+
+
+def write_behind_enabled() -> bool:
+    return bool(getattr(settings, 'DRIVER_LOCATION_WRITE_BEHIND', False))
+
+
+def _optional_float(value):
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_fix(entry) -> Optional[LocationFix]:
+    if not entry:
+        return None
+    return LocationFix(
+        entry['lat'],
+        entry['lon'],
+        entry.get('heading'),
+        entry.get('speed'),
+        entry.get('accuracy'),
+        datetime.fromtimestamp(entry['ts'], tz=dt_timezone.utc),
+    )
+
+
+def _entry_from_row(lat, lon, heading=None, speed=None, accuracy=None, timestamp=None):
+    ts = timestamp.timestamp() if timestamp else timezone.now().timestamp()
+    return {
+        'lat': float(lat),
+        'lon': float(lon),
+        'heading': _optional_float(heading),
+        'speed': _optional_float(speed),
+        'accuracy': _optional_float(accuracy),
+        'ts': ts,
+    }
+
+
+def _cache_reports_writes() -> bool:
+    """django-redis returns True from `cache.set`, or None when IGNORE_EXCEPTIONS
+    swallowed an error; the built-in backends return None either way."""
+    return type(cache).__module__.startswith('django_redis')
+
+
+def _register(driver_id) -> None:
+    if not cache.add(_known_key(driver_id), 1, timeout=KNOWN_TTL):
+        return
+    _registry.add(REGISTRY_KEY, driver_id)
+
+
+def record_location(driver_id, latitude, longitude, heading=None, speed=None, accuracy=None) -> LocationFix:
+    """Store the latest fix for a driver and return it."""
+    entry = _entry_from_row(latitude, longitude, heading, speed, accuracy)
+    if not write_behind_enabled():
+        _write_rows({driver_id: entry})
+        cache.set(_entry_key(driver_id), entry, timeout=_ttl())
+        cache.set(_flushed_key(driver_id), entry['ts'], timeout=_ttl())
+        return _to_fix(entry)
+
+    try:
+        stored = cache.set(_entry_key(driver_id), entry, timeout=_ttl())
+        if stored is None and _cache_reports_writes():
+            raise ConnectionError('cache did not store the fix')
+        _register(driver_id)
+    except Exception as exc:
+        # Never lose a fix because the cache is down
+        logger.warning('Location store unavailable, writing fix for driver %s directly: %s', driver_id, exc)
+        _write_rows({driver_id: entry})
+    return _to_fix(entry)
+
+
+def _load_from_db(driver_ids) -> Dict[int, dict]:
+    from booking_app.models import DriverLocation
+
+    rows = DriverLocation.objects.filter(driver_id__in=driver_ids).values_list(
+        'driver_id', 'latitude', 'longitude', 'heading', 'speed', 'accuracy', 'timestamp'
+    )
+    return {
+        driver_id: _entry_from_row(lat, lon, heading, speed, accuracy, ts)
+        for driver_id, lat, lon, heading, speed, accuracy, ts in rows
+    }
+
+
+def get_locations(driver_ids: Iterable[int]) -> Dict[int, LocationFix]:
+    """Latest fix for each of `driver_ids` that has one, keyed by driver id."""
+    driver_ids = list(dict.fromkeys(int(d) for d in driver_ids if d is not None))
+    if not driver_ids:
+        return {}
+
+    try:
+        cached = cache.get_many([_entry_key(d) for d in driver_ids])
+    except Exception:
+        cached = {}
+    entries = {d: cached[_entry_key(d)] for d in driver_ids if _entry_key(d) in cached}
+
+    missing = [d for d in driver_ids if d not in entries]
+    if missing:
+        loaded = _load_from_db(missing)
+        if loaded:
+            try:
+                # Prime the cache; these match the database so mark them as flushed
+                cache.set_many({_entry_key(d): e for d, e in loaded.items()}, timeout=_ttl())
+                cache.set_many({_flushed_key(d): e['ts'] for d, e in loaded.items()}, timeout=_ttl())
+            except Exception:
+                pass
+        entries.update(loaded)
+
+    return {d: _to_fix(e) for d, e in entries.items()}
+
+
+def get_location(driver_id) -> Optional[LocationFix]:
+    """Latest fix for one driver, or None when the driver has never reported one."""
+    if driver_id is None:
+        return None
+    return get_locations([driver_id]).get(int(driver_id))
+
+
+def get_coordinates(driver_id):
+    """Latest (lat, lon) for one driver, or None."""
+    fix = get_location(driver_id)
+    return (fix.latitude, fix.longitude) if fix else None
+
+
+def clear_location(driver_id) -> None:
+    """Forget a driver's position, e.g. when they go offline."""
+    from booking_app.models import DriverLocation
+
+    try:
+        cache.delete_many([_entry_key(driver_id), _flushed_key(driver_id)])
+    except Exception:
+        pass
+    DriverLocation.objects.filter(driver_id=driver_id).delete()
+
+
+def _write_rows(entries: Dict[int, dict]) -> int:
+    """Persist fixes with one query per kind of write."""
+    from booking_app.models import DriverLocation
+
+    if not entries:
+        return 0
+
+    def dec(value):
+        return Decimal(str(value)) if value is not None else None
+
+    with transaction.atomic():
+        existing = {
+            row.driver_id: row
+            for row in DriverLocation.objects.filter(driver_id__in=list(entries))
+        }
+        to_update, to_create = [], []
+        for driver_id, entry in entries.items():
+            row = existing.get(driver_id) or DriverLocation(driver_id=driver_id)
+            row.latitude = dec(entry['lat'])
+            row.longitude = dec(entry['lon'])
+            row.heading = dec(entry.get('heading'))
+            row.speed = dec(entry.get('speed'))
+            row.accuracy = dec(entry.get('accuracy'))
+            # bulk_update bypasses auto_now, so carry the fix time explicitly
+            row.timestamp = datetime.fromtimestamp(entry['ts'], tz=dt_timezone.utc)
+            (to_update if driver_id in existing else to_create).append(row)
+        if to_update:
+            DriverLocation.objects.bulk_update(
+                to_update, ['latitude', 'longitude', 'heading', 'speed', 'accuracy', 'timestamp']
+            )
+        if to_create:
+            DriverLocation.objects.bulk_create(to_create, ignore_conflicts=True)
+    return len(entries)
+
+
+def flush_locations() -> int:
+    """Write every fix that changed since the last flush. Returns the number written."""
+    registry = {int(d) for d in _registry.members_many([REGISTRY_KEY]).get(REGISTRY_KEY) or ()}
+    if not registry:
+        return 0
+
+    entry_keys = {_entry_key(d): d for d in registry}
+    flushed_keys = {_flushed_key(d): d for d in registry}
+    values = cache.get_many(list(entry_keys) + list(flushed_keys))
+
+    dirty = {}
+    gone = set()
+    for key, driver_id in entry_keys.items():
+        entry = values.get(key)
+        if entry is None:
+            gone.add(driver_id)
+            continue
+        flushed_ts = values.get(_flushed_key(driver_id))
+        if flushed_ts is None or entry['ts'] > flushed_ts:
+            dirty[driver_id] = entry
+
+    if dirty:
+        _write_rows(dirty)
+        cache.set_many({_flushed_key(d): e['ts'] for d, e in dirty.items()}, timeout=_ttl())
+
+    if gone:
+        _registry.discard(REGISTRY_KEY, *gone)
+        cache.delete_many([_known_key(d) for d in gone])
+    return len(dirty)
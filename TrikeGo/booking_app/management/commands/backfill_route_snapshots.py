@@ -0,0 +1,43 @@
+"""Bring existing RouteSnapshot rows in line with the current storage and retention.
+
+    python manage.py backfill_route_snapshots [--batch-size N] [--older-than-hours H] [--skip-prune]
+
+1. Rows stored with the full ORS response are rewritten as encoded polylines.
+2. Superseded snapshots past retention are archived into RouteTrace and deleted,
+   batch by batch until none are left.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from booking_app import route_retention
+
+
+class Command(BaseCommand):
+    help = 'Compact legacy route snapshots and archive superseded ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows per batch (default ROUTE_SNAPSHOT_PRUNE_BATCH)')
+        parser.add_argument('--older-than-hours', type=float, default=None,
+                            help='Retention for superseded snapshots (default ROUTE_SNAPSHOT_RETENTION_HOURS)')
+        parser.add_argument('--skip-prune', action='store_true',
+                            help='Only compact legacy rows')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        compacted, skipped = route_retention.compact_legacy_snapshots(batch_size=batch_size)
+        self.stdout.write(f'Compacted {compacted} legacy snapshots ({skipped} without a route line)')
+
+        if options['skip_prune']:
+            return
+        hours = options['older_than_hours']
+        if hours is None:
+            hours = float(getattr(settings, 'ROUTE_SNAPSHOT_RETENTION_HOURS', 24))
+        deleted = route_retention.prune_snapshots(
+            older_than=timedelta(hours=hours),
+            batch_size=batch_size,
+            max_batches=0,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Archived and deleted {deleted} superseded snapshots'))
@@ -0,0 +1,106 @@
+"""Convert an OSM XML extract into the CSR road graph used by local routing.
+
+    python manage.py build_road_graph cebu.osm roads.json.gz
+
+Only ways a tricycle can drive on are kept. Travel times come from the way's
+`maxspeed` when present, otherwise from a default speed per highway type.
+"""
+import re
+import xml.etree.ElementTree as ET
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking_app.geo import haversine_km
+from booking_app.road_graph import RoadGraph
+
+# Typical tricycle speeds (km/h); highway types not listed are not routable
+HIGHWAY_SPEEDS_KMH = {
+    'primary': 35, 'primary_link': 30,
+    'secondary': 30, 'secondary_link': 25,
+    'tertiary': 25, 'tertiary_link': 20,
+    'unclassified': 20, 'residential': 20,
+    'living_street': 10, 'service': 10, 'road': 15,
+    'trunk': 35, 'trunk_link': 30,
+}
+# Tricycles cannot top the speed of the road they share with cars
+MAX_SPEED_KMH = 40
+
+ONEWAY_FORWARD = {'yes', 'true', '1'}
+
+
+MPH_TO_KMH = 1.609
+
+
+def _speed(tags):
+    """Travel speed in km/h; unusable maxspeed values fall back to the highway default."""
+    default = HIGHWAY_SPEEDS_KMH[tags['highway']]
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', tags.get('maxspeed', '').lower())
+    if not match:
+        return default
+    speed = float(match.group(1))
+    if match.group(2):
+        speed *= MPH_TO_KMH
+    if speed <= 0:
+        return default
+    return min(speed, MAX_SPEED_KMH)
+
+
+def _direction(tags):
+    """(forward, backward) travel permitted along the way's node order."""
+    oneway = tags.get('oneway', '').lower()
+    if oneway == '-1':
+        return False, True
+    if oneway in ONEWAY_FORWARD or tags.get('junction') == 'roundabout':
+        return True, False
+    return True, True
+
+
+class Command(BaseCommand):
+    help = 'Build a local routing graph (CSR arrays) from an OSM XML extract.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='OSM XML file (.osm)')
+        parser.add_argument('output', help='Graph file to write (.json or .json.gz)')
+
+    def handle(self, *args, **options):
+        coords = {}
+        ways = []
+        try:
+            for _, elem in ET.iterparse(options['source'], events=('end',)):
+                if elem.tag == 'node':
+                    coords[elem.get('id')] = (float(elem.get('lat')), float(elem.get('lon')))
+                    elem.clear()
+                elif elem.tag == 'way':
+                    tags = {tag.get('k'): tag.get('v') for tag in elem.iter('tag')}
+                    if tags.get('highway') in HIGHWAY_SPEEDS_KMH:
+                        refs = [nd.get('ref') for nd in elem.iter('nd')]
+                        ways.append((refs, _speed(tags), _direction(tags)))
+                    elem.clear()
+        except (OSError, ET.ParseError) as exc:
+            raise CommandError(f'Could not read {options["source"]}: {exc}')
+
+        index = {}
+        nodes = []
+        edges = []
+        for refs, speed_kmh, (forward, backward) in ways:
+            refs = [ref for ref in refs if ref in coords]
+            for a, b in zip(refs, refs[1:]):
+                for ref in (a, b):
+                    if ref not in index:
+                        index[ref] = len(nodes)
+                        nodes.append(coords[ref])
+                u, v = index[a], index[b]
+                metres = haversine_km(*nodes[u], *nodes[v]) * 1000
+                seconds = metres / (speed_kmh / 3.6)
+                if forward:
+                    edges.append((u, v, metres, seconds))
+                if backward:
+                    edges.append((v, u, metres, seconds))
+
+        if not edges:
+            raise CommandError('No routable roads found in the extract.')
+        graph = RoadGraph.from_edges(nodes, edges)
+        graph.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {options["output"]}: {graph.node_count} nodes, {graph.edge_count} edges'
+        ))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_driver_positions(apps, schema_editor):
+    """Move positions only stored on Driver.current_* into DriverLocation."""
+    Driver = apps.get_model('user', 'Driver')
+    DriverLocation = apps.get_model('booking', 'DriverLocation')
+
+    located = set(DriverLocation.objects.values_list('driver_id', flat=True))
+    rows = [
+        DriverLocation(driver_id=user_id, latitude=lat, longitude=lon)
+        for user_id, lat, lon in Driver.objects.filter(
+            current_latitude__isnull=False,
+            current_longitude__isnull=False,
+        ).values_list('user_id', 'current_latitude', 'current_longitude')
+        if user_id not in located
+    ]
+    DriverLocation.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0015_remove_booking_booking_boo_rider_i_eb21d8_idx_and_more'),
+        ('user', '0020_rename_rider_passenger_alter_customuser_trikego_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_driver_positions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='driverlocation',
+            index=models.Index(fields=['timestamp'], name='booking_dri_timesta_idx'),
+        ),
+    ]
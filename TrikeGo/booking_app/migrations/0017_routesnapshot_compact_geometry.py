@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0016_driverlocation_single_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routesnapshot',
+            name='geometry',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='routesnapshot',
+            name='geometry_precision',
+            field=models.PositiveSmallIntegerField(default=5),
+        ),
+        migrations.AddField(
+            model_name='routesnapshot',
+            name='route_meta',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='routesnapshot',
+            name='route_data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
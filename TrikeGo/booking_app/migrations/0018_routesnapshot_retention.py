@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 13:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0017_routesnapshot_compact_geometry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('routes', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='routesnapshot',
+            index=models.Index(fields=['booking', 'is_active'], name='booking_rou_booking_3d7bc0_idx'),
+        ),
+        migrations.AddField(
+            model_name='routetrace',
+            name='booking',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='route_trace', to='booking.booking'),
+        ),
+    ]
@@ -3,6 +3,7 @@ import uuid
 from django.db import models
 #from user_app.models import CustomUser 
 from django.utils import timezone
+from django.utils.functional import cached_property
 from decimal import Decimal
 from discount_codes_app.models import DiscountCode
 from discount_codes_app.models import LoyaltyRedemption
@@ -234,6 +235,9 @@ class DriverLocation(models.Model):
     class Meta:
         verbose_name = "Driver Location"
         verbose_name_plural = "Driver Locations"
+        indexes = [
+            models.Index(fields=['timestamp'], name='booking_dri_timesta_idx'),
+        ]
     
     def __str__(self):
         return f"{self.driver.username} at ({self.latitude}, {self.longitude})"
@@ -242,7 +246,13 @@ class DriverLocation(models.Model):
 class RouteSnapshot(models.Model):
     """Store route snapshots for rerouting and history"""
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='routes')
-    route_data = models.JSONField()  # Store GeoJSON route data
+    # Full ORS GeoJSON response; only rows written before `geometry` existed still carry it
+    route_data = models.JSONField(null=True, blank=True)
+    # Route line as an encoded polyline of (lat, lon) at `geometry_precision` decimals
+    geometry = models.TextField(blank=True, default='')
+    geometry_precision = models.PositiveSmallIntegerField(default=5)
+    # Summary, per-leg distance/duration and way_points; no turn-by-turn steps
+    route_meta = models.JSONField(default=dict, blank=True)
     distance = models.DecimalField(max_digits=10, decimal_places=2)  # in km
     duration = models.IntegerField()  # in seconds
     created_at = models.DateTimeField(auto_now_add=True)
@@ -250,10 +260,88 @@ class RouteSnapshot(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # get_current_route and check_and_reroute look up the active route per booking
+            models.Index(fields=['booking', 'is_active']),
+        ]
     
     def __str__(self):
         return f"Route for Booking {self.booking.id} at {self.created_at}"
-    
+
+    @staticmethod
+    def compact_fields(route_data, simplify_m=0.0, precision=None):
+        """`geometry`, `geometry_precision` and `route_meta` values for an ORS GeoJSON response."""
+        from . import polyline
+
+        precision = precision or polyline.DEFAULT_PRECISION
+        feature = (route_data or {}).get('features', [{}])[0]
+        coords = (feature.get('geometry') or {}).get('coordinates') or []
+        points = polyline.simplify([(c[1], c[0]) for c in coords], simplify_m)
+        properties = feature.get('properties') or {}
+        meta = {
+            'summary': properties.get('summary') or {},
+            'segments': [
+                {'distance': s.get('distance'), 'duration': s.get('duration')}
+                for s in properties.get('segments') or []
+            ],
+        }
+        if simplify_m <= 0 and properties.get('way_points'):
+            # Vertex indexes are only meaningful while no vertex was dropped
+            meta['way_points'] = properties['way_points']
+        if feature.get('bbox') or (route_data or {}).get('bbox'):
+            meta['bbox'] = feature.get('bbox') or route_data.get('bbox')
+        return {
+            'geometry': polyline.encode(points, precision),
+            'geometry_precision': precision,
+            'route_meta': meta,
+        }
+
+    @cached_property
+    def coordinates(self):
+        """Route vertices as GeoJSON [lon, lat] pairs, decoded on first use."""
+        from . import polyline
+
+        if self.geometry:
+            return [[lon, lat] for lat, lon in polyline.decode(self.geometry, self.geometry_precision)]
+        try:
+            return self.route_data['features'][0]['geometry']['coordinates']
+        except (KeyError, IndexError, TypeError):
+            return []
+
+    def as_geojson(self):
+        """The route as a GeoJSON FeatureCollection in the ORS response shape."""
+        if not self.geometry and self.route_data:
+            return self.route_data
+        properties = dict(self.route_meta or {})
+        return {
+            'type': 'FeatureCollection',
+            'features': [{
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': self.coordinates},
+                'properties': properties,
+            }],
+        }
+
+    def as_polyline(self):
+        """The route as (encoded polyline, precision), encoding legacy rows on the fly."""
+        from . import polyline
+
+        if self.geometry:
+            return self.geometry, self.geometry_precision
+        points = [(c[1], c[0]) for c in self.coordinates]
+        return polyline.encode(points), polyline.DEFAULT_PRECISION
+
+
+class RouteTrace(models.Model):
+    """Compacted history of a booking's superseded routes (see booking_app.route_retention)."""
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='route_trace')
+    # Oldest first: {'created_at', 'distance', 'duration', 'polyline', 'precision'} per archived snapshot
+    routes = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Route trace for Booking {self.booking_id} ({len(self.routes)} routes)"
+
 class RatingAndFeedback(models.Model):
     """Stores the passenger's rating and feedback for a specific booking."""
     
@@ -0,0 +1,115 @@
+"""Encoded polyline codec (Google's algorithm) and route line simplification.
+
+Points are (lat, lon). Each coordinate is scaled by 10^precision, delta-encoded
+against the previous point and written as 5-bit chunks of printable ASCII, so
+a route of a few hundred vertices takes a few kilobytes instead of the tens of
+kilobytes of its GeoJSON. Precision 5 keeps about one metre of accuracy and is
+what Leaflet and Google polyline decoders expect by default.
+"""
+import math
+from typing import List, Sequence, Tuple
+
+from .geo import EARTH_RADIUS_KM
+
+DEFAULT_PRECISION = 5
+
+# Web Mercator ground resolution at zoom 0 on the equator, metres per 256px-tile pixel
+_EQUATOR_METERS_PER_PIXEL = 156543.03392
+
+Point = Tuple[float, float]
+
+
+def _encode_value(value: int, out: List[str]) -> None:
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode(points: Sequence[Sequence[float]], precision: int = DEFAULT_PRECISION) -> str:
+    """Encode (lat, lon) points as a polyline string."""
+    factor = 10 ** precision
+    out: List[str] = []
+    prev_lat = prev_lon = 0
+    for point in points:
+        lat = int(round(float(point[0]) * factor))
+        lon = int(round(float(point[1]) * factor))
+        _encode_value(lat - prev_lat, out)
+        _encode_value(lon - prev_lon, out)
+        prev_lat, prev_lon = lat, lon
+    return ''.join(out)
+
+
+def decode(encoded: str, precision: int = DEFAULT_PRECISION) -> List[Point]:
+    """Decode a polyline string into (lat, lon) points."""
+    factor = float(10 ** precision)
+    points: List[Point] = []
+    index = lat = lon = 0
+    length = len(encoded or '')
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / factor, lon / factor))
+    return points
+
+
+def _project(points: Sequence[Point]) -> List[Tuple[float, float]]:
+    """Equirectangular projection to metres around the first point; fine at city scale."""
+    lat0 = math.radians(points[0][0])
+    scale = EARTH_RADIUS_KM * 1000 * math.pi / 180
+    cos_lat0 = math.cos(lat0)
+    return [(p[1] * scale * cos_lat0, p[0] * scale) for p in points]
+
+
+def _offset_m(p, a, b) -> float:
+    """Distance in metres from p to segment ab (projected points)."""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length_sq))
+    return math.hypot(p[0] - (a[0] + t * dx), p[1] - (a[1] + t * dy))
+
+
+def simplify(points: Sequence[Point], tolerance_m: float) -> List[Point]:
+    """Douglas-Peucker: drop vertices closer than `tolerance_m` to the simplified line.
+
+    The first and last points are always kept.
+    """
+    points = list(points)
+    if tolerance_m <= 0 or len(points) < 3:
+        return points
+    projected = _project(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        worst, worst_offset = None, tolerance_m
+        for i in range(first + 1, last):
+            offset = _offset_m(projected[i], projected[first], projected[last])
+            if offset > worst_offset:
+                worst, worst_offset = i, offset
+        if worst is not None:
+            keep[worst] = True
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def tolerance_for_zoom(zoom: float, latitude: float = 0.0, pixels: float = 1.0) -> float:
+    """Simplification tolerance in metres that stays under `pixels` screen pixels at a map zoom."""
+    meters_per_pixel = _EQUATOR_METERS_PER_PIXEL * math.cos(math.radians(latitude)) / (2 ** float(zoom))
+    return max(0.0, meters_per_pixel * pixels)
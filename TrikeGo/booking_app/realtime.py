@@ -0,0 +1,130 @@
+"""Push booking state to WebSocket subscribers over the Channels layer.
+
+Passengers subscribe to `ws/booking/<id>/track/` (see consumers.BookingTrackingConsumer).
+Publishers compare the current tracking state with the last one sent for the
+booking and only broadcast the fields that changed, so unchanged driver pings and
+booking saves cost nothing on the wire.
+"""
+import logging
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .geo import haversine_km
+from . import locations
+
+logger = logging.getLogger(__name__)
+
+TRACKED_STATUSES = ('accepted', 'on_the_way', 'started')
+POSITION_FIELDS = ('driver_lat', 'driver_lon')
+STATE_TTL = 6 * 60 * 60
+
+try:
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+except Exception:  # pragma: no cover - channels is optional at runtime
+    async_to_sync = None
+    get_channel_layer = None
+
+
+def tracking_group(booking_id) -> str:
+    return f'booking_track_{booking_id}'
+
+
+def _state_key(booking_id) -> str:
+    return f'booking_track_state:{booking_id}'
+
+
+def group_send(group: str, message: Dict[str, object]) -> bool:
+    """Send to a Channels group; a missing or broken channel layer is not an error."""
+    if get_channel_layer is None:
+        return False
+    try:
+        layer = get_channel_layer()
+        if layer is None:
+            return False
+        async_to_sync(layer.group_send)(group, message)
+        return True
+    except Exception as exc:
+        logger.warning('Channel layer send to %s failed: %s', group, exc)
+        return False
+
+
+def tracking_state(booking, fix=None) -> Dict[str, object]:
+    """Everything the passenger's live view needs, in JSON-friendly form."""
+    if fix is None and booking.driver_id and booking.status in TRACKED_STATUSES:
+        fix = locations.get_location(booking.driver_id)
+    return {
+        'booking_id': booking.id,
+        'booking_status': booking.status,
+        'driver_id': booking.driver_id,
+        'driver_lat': round(fix.latitude, 6) if fix else None,
+        'driver_lon': round(fix.longitude, 6) if fix else None,
+        'heading': fix.heading if fix else None,
+        # Clients count down to this themselves, so it only changes on reroute
+        'estimated_arrival': booking.estimated_arrival.isoformat() if booking.estimated_arrival else None,
+        'estimated_distance_km': float(booking.estimated_distance) if booking.estimated_distance is not None else None,
+        'estimated_duration_min': booking.estimated_duration,
+    }
+
+
+def _moved_enough(previous, current) -> bool:
+    if previous.get('driver_lat') is None or current.get('driver_lat') is None:
+        return previous.get('driver_lat') != current.get('driver_lat')
+    min_move_m = float(getattr(settings, 'TRACKING_MIN_MOVE_METERS', 5))
+    moved_km = haversine_km(
+        previous['driver_lat'], previous['driver_lon'],
+        current['driver_lat'], current['driver_lon'],
+    )
+    return moved_km * 1000 >= min_move_m
+
+
+def state_delta(previous: Optional[Dict[str, object]], current: Dict[str, object]) -> Dict[str, object]:
+    """Fields of `current` that differ from `previous`; position only after a real move."""
+    if not previous:
+        return dict(current)
+    delta = {
+        key: value for key, value in current.items()
+        if key not in POSITION_FIELDS and previous.get(key) != value
+    }
+    if _moved_enough(previous, current):
+        delta.update({key: current[key] for key in POSITION_FIELDS})
+        if 'heading' not in delta and current.get('heading') != previous.get('heading'):
+            delta['heading'] = current.get('heading')
+    elif 'heading' in delta:
+        # Compass jitter while stationary is not worth a message
+        delta.pop('heading')
+    return delta
+
+
+def publish_tracking(booking, fix=None) -> Optional[Dict[str, object]]:
+    """Broadcast what changed for a booking since the last publish. Returns the delta sent."""
+    current = tracking_state(booking, fix)
+    key = _state_key(booking.id)
+    previous = cache.get(key)
+    delta = state_delta(previous, current)
+    if not delta:
+        return None
+
+    merged = dict(previous or {})
+    merged.update(delta)
+    cache.set(key, merged, timeout=STATE_TTL)
+    delta['booking_id'] = booking.id
+    group_send(tracking_group(booking.id), {'type': 'tracking.update', 'data': delta})
+    return delta
+
+
+def publish_driver_position(driver_id, fix) -> int:
+    """Push a new driver fix to passengers of that driver's active bookings."""
+    from .models import Booking
+
+    published = 0
+    bookings = Booking.objects.filter(driver_id=driver_id, status__in=TRACKED_STATUSES)
+    for booking in bookings:
+        try:
+            if publish_tracking(booking, fix):
+                published += 1
+        except Exception as exc:
+            logger.warning('Tracking publish failed for booking %s: %s', booking.id, exc)
+    return published
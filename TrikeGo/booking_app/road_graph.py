@@ -0,0 +1,180 @@
+"""Compact in-memory road network for local routing.
+
+The graph is stored in CSR (compressed sparse row) form: the edges leaving node
+`n` are `targets[offsets[n]:offsets[n + 1]]`, with matching travel `seconds` and
+`metres`. Node coordinates are (lat, lon). Everything lives in flat `array`
+buffers, so a city-sized extract takes a few megabytes and loads in one read.
+
+Graphs are built from OSM XML with `manage.py build_road_graph` and saved as
+(optionally gzipped) JSON.
+"""
+import gzip
+import heapq
+import json
+import math
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .geo import haversine_km
+
+# Snapping grid cell size in degrees (~550 m at the equator)
+GRID_DEGREES = 0.005
+
+Edge = Tuple[int, int, float, float]  # (from node, to node, metres, seconds)
+
+
+class RoadGraph:
+    def __init__(self, lat, lon, offsets, targets, seconds, metres):
+        self.lat = array('d', lat)
+        self.lon = array('d', lon)
+        self.offsets = array('l', offsets)
+        self.targets = array('l', targets)
+        self.seconds = array('d', seconds)
+        self.metres = array('d', metres)
+        if len(self.offsets) != len(self.lat) + 1:
+            raise ValueError('offsets must have one entry per node plus one')
+
+        # Fastest edge speed bounds the A* heuristic so it never overestimates
+        speeds = [m / s for m, s in zip(self.metres, self.seconds) if s > 0]
+        self.max_speed_mps = max(speeds) if speeds else 1.0
+        self._grid = self._build_grid()
+
+    @property
+    def node_count(self) -> int:
+        return len(self.lat)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    @classmethod
+    def from_edges(cls, nodes: Sequence[Tuple[float, float]], edges: Iterable[Edge]) -> 'RoadGraph':
+        """Build the CSR arrays from (lat, lon) nodes and directed edges."""
+        buckets: List[List[Tuple[int, float, float]]] = [[] for _ in nodes]
+        for source, target, metres, seconds in edges:
+            buckets[source].append((target, float(seconds), float(metres)))
+
+        offsets, targets, seconds, metres = [0], [], [], []
+        for outgoing in buckets:
+            for target, secs, dist in outgoing:
+                targets.append(target)
+                seconds.append(secs)
+                metres.append(dist)
+            offsets.append(len(targets))
+        return cls(
+            [float(n[0]) for n in nodes], [float(n[1]) for n in nodes],
+            offsets, targets, seconds, metres,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'RoadGraph':
+        opener = gzip.open if str(path).endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as fh:
+            data = json.load(fh)
+        return cls(data['lat'], data['lon'], data['offsets'], data['targets'], data['seconds'], data['metres'])
+
+    def save(self, path: str) -> None:
+        data = {
+            'lat': self.lat.tolist(),
+            'lon': self.lon.tolist(),
+            'offsets': self.offsets.tolist(),
+            'targets': self.targets.tolist(),
+            'seconds': [round(v, 2) for v in self.seconds],
+            'metres': [round(v, 1) for v in self.metres],
+        }
+        opener = gzip.open if str(path).endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as fh:
+            json.dump(data, fh, separators=(',', ':'))
+
+    def _cell(self, lat, lon) -> Tuple[int, int]:
+        return int(math.floor(lat / GRID_DEGREES)), int(math.floor(lon / GRID_DEGREES))
+
+    def _build_grid(self) -> Dict[Tuple[int, int], List[int]]:
+        grid: Dict[Tuple[int, int], List[int]] = {}
+        for node in range(self.node_count):
+            # Nodes without outgoing edges are dead ends a route could not leave
+            if self.offsets[node] == self.offsets[node + 1]:
+                continue
+            grid.setdefault(self._cell(self.lat[node], self.lon[node]), []).append(node)
+        return grid
+
+    def nearest(self, lat: float, lon: float, max_rings: int = 2) -> Optional[Tuple[int, float]]:
+        """Closest routable node to (lat, lon) as (node, metres), searching nearby grid cells."""
+        row, col = self._cell(lat, lon)
+        best = None
+        found_ring = None
+        for ring in range(max_rings + 1):
+            for r in range(row - ring, row + ring + 1):
+                for c in range(col - ring, col + ring + 1):
+                    if max(abs(r - row), abs(c - col)) != ring:
+                        continue
+                    for node in self._grid.get((r, c), ()):
+                        metres = haversine_km(lat, lon, self.lat[node], self.lon[node]) * 1000
+                        if best is None or metres < best[1]:
+                            best = (node, metres)
+            if best is not None:
+                # A node in the next ring can still be closer (cell corners); beyond that it cannot
+                if found_ring is not None:
+                    break
+                found_ring = ring
+        return best
+
+    def _heuristic(self, node: int, target: int) -> float:
+        metres = haversine_km(self.lat[node], self.lon[node], self.lat[target], self.lon[target]) * 1000
+        return metres / self.max_speed_mps
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[List[int], float, float]]:
+        """A* on travel time. Returns (nodes, seconds, metres) or None when unreachable."""
+        if source == target:
+            return [source], 0.0, 0.0
+        offsets, targets, seconds, metres = self.offsets, self.targets, self.seconds, self.metres
+        best = {source: 0.0}
+        dist = {source: 0.0}
+        parent = {source: -1}
+        heap = [(self._heuristic(source, target), 0.0, source)]
+        closed = set()
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node in closed:
+                continue
+            if node == target:
+                path = []
+                while node != -1:
+                    path.append(node)
+                    node = parent[node]
+                path.reverse()
+                return path, cost, dist[target]
+            closed.add(node)
+            for i in range(offsets[node], offsets[node + 1]):
+                nxt = targets[i]
+                candidate = cost + seconds[i]
+                if candidate < best.get(nxt, math.inf):
+                    best[nxt] = candidate
+                    dist[nxt] = dist[node] + metres[i]
+                    parent[nxt] = node
+                    heapq.heappush(heap, (candidate + self._heuristic(nxt, target), candidate, nxt))
+        return None
+
+    def travel_times(self, source: int, wanted: Iterable[int]) -> Dict[int, Tuple[float, float]]:
+        """One-to-many Dijkstra: (seconds, metres) from `source` to each reachable node of `wanted`."""
+        remaining = set(wanted)
+        found: Dict[int, Tuple[float, float]] = {}
+        offsets, targets, seconds, metres = self.offsets, self.targets, self.seconds, self.metres
+        best = {source: 0.0}
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap and remaining:
+            cost, node = heapq.heappop(heap)
+            if cost > best.get(node, math.inf):
+                continue
+            if node in remaining:
+                remaining.discard(node)
+                found[node] = (cost, dist[node])
+            for i in range(offsets[node], offsets[node + 1]):
+                nxt = targets[i]
+                candidate = cost + seconds[i]
+                if candidate < best.get(nxt, math.inf):
+                    best[nxt] = candidate
+                    dist[nxt] = dist[node] + metres[i]
+                    heapq.heappush(heap, (candidate, nxt))
+        return found
@@ -0,0 +1,108 @@
+"""Shared, persistent cache for openrouteservice directions responses.
+
+`RoutingService.calculate_route` is called with the same pickup/destination pairs
+over and over (route info polling, ride acceptance, rerouting, the Celery warm-up
+task). Responses are stored in the configured Django cache so every worker and
+process shares them, keyed on rounded coordinates plus the routing profile.
+"""
+import json
+import logging
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+logger = logging.getLogger(__name__)
+
+STAT_NAMES = ('hits', 'misses', 'stores', 'skipped')
+
+
+class RouteCache:
+    """Cache ORS route results keyed on rounded start/end coordinates and profile."""
+
+    key_prefix = 'ors_route'
+    stats_prefix = 'ors_route_stats'
+
+    def __init__(self, alias=None, ttl=None, precision=None, max_bytes=None):
+        self.alias = alias or getattr(settings, 'ORS_ROUTE_CACHE_ALIAS', 'default')
+        self.ttl = int(ttl if ttl is not None else getattr(settings, 'ORS_ROUTE_CACHE_TTL', 6 * 60 * 60))
+        self.precision = int(precision if precision is not None else getattr(settings, 'ORS_ROUTE_CACHE_PRECISION', 4))
+        self.max_bytes = int(max_bytes if max_bytes is not None else getattr(settings, 'ORS_ROUTE_CACHE_MAX_BYTES', 512 * 1024))
+
+    @property
+    def cache(self):
+        try:
+            return caches[self.alias]
+        except InvalidCacheBackendError:
+            return caches['default']
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def make_key(self, start_coords: Tuple[float, float], end_coords: Tuple[float, float], profile: str) -> str:
+        """Build the cache key for a (lon, lat) -> (lon, lat) route request."""
+        p = self.precision
+        return (
+            f"{self.key_prefix}:{profile}:"
+            f"{float(start_coords[0]):.{p}f},{float(start_coords[1]):.{p}f}:"
+            f"{float(end_coords[0]):.{p}f},{float(end_coords[1]):.{p}f}"
+        )
+
+    def get(self, start_coords, end_coords, profile='driving-car') -> Optional[Dict[str, object]]:
+        if not self.enabled:
+            return None
+        key = self.make_key(start_coords, end_coords, profile)
+        try:
+            cached = self.cache.get(key)
+        except Exception as exc:
+            logger.warning('Route cache read failed for %s: %s', key, exc)
+            cached = None
+        self._incr('hits' if cached is not None else 'misses')
+        return cached
+
+    def set(self, start_coords, end_coords, profile, route_info) -> bool:
+        """Store a successful route result. Returns False when it was not cached."""
+        if not self.enabled or not route_info:
+            return False
+        try:
+            size = len(json.dumps(route_info.get('route_data'), separators=(',', ':')))
+        except (TypeError, ValueError):
+            size = self.max_bytes + 1
+        if self.max_bytes and size > self.max_bytes:
+            self._incr('skipped')
+            return False
+
+        key = self.make_key(start_coords, end_coords, profile)
+        try:
+            self.cache.set(key, route_info, timeout=self.ttl)
+        except Exception as exc:
+            logger.warning('Route cache write failed for %s: %s', key, exc)
+            return False
+        self._incr('stores')
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Return the shared hit/miss/store/skip counters."""
+        keys = {name: f'{self.stats_prefix}:{name}' for name in STAT_NAMES}
+        try:
+            values = self.cache.get_many(list(keys.values()))
+        except Exception:
+            values = {}
+        return {name: int(values.get(key) or 0) for name, key in keys.items()}
+
+    def reset_stats(self) -> None:
+        try:
+            self.cache.delete_many([f'{self.stats_prefix}:{name}' for name in STAT_NAMES])
+        except Exception:
+            pass
+
+    def _incr(self, name: str) -> None:
+        key = f'{self.stats_prefix}:{name}'
+        try:
+            # add() is a no-op when the counter exists, so incr() never sees a missing key
+            self.cache.add(key, 0, timeout=None)
+            self.cache.incr(key)
+        except Exception:
+            pass
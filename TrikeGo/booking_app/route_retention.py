@@ -0,0 +1,143 @@
+"""Retention for RouteSnapshot rows.
+
+Every reroute deactivates the previous snapshot and writes a new one, so a long
+trip leaves a trail of rows nobody reads again. `prune_snapshots` keeps, per
+booking, the active snapshot and the most recent one (the final route of a
+finished trip). Other snapshots older than ROUTE_SNAPSHOT_RETENTION_HOURS are
+appended to the booking's RouteTrace as a simplified polyline and deleted in
+batches of ROUTE_SNAPSHOT_PRUNE_BATCH rows, each in its own transaction.
+
+`compact_legacy_snapshots` rewrites rows stored before snapshots had a
+`geometry` column (full ORS GeoJSON in `route_data`) into the compact form.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from . import polyline
+from .deviation import forget_snapshot
+from .models import RouteSnapshot, RouteTrace
+
+logger = logging.getLogger(__name__)
+
+
+def _batch_size(batch_size) -> int:
+    return max(1, int(batch_size if batch_size is not None else getattr(settings, 'ROUTE_SNAPSHOT_PRUNE_BATCH', 200)))
+
+
+def prunable_snapshots(older_than: Optional[timedelta] = None):
+    """Inactive snapshots past retention that are not their booking's latest."""
+    if older_than is None:
+        older_than = timedelta(hours=float(getattr(settings, 'ROUTE_SNAPSHOT_RETENTION_HOURS', 24)))
+    latest = (
+        RouteSnapshot.objects
+        .filter(booking=OuterRef('booking'))
+        .order_by('-created_at', '-id')
+        .values('id')[:1]
+    )
+    return (
+        RouteSnapshot.objects
+        .filter(is_active=False, created_at__lt=timezone.now() - older_than)
+        .annotate(latest_id=Subquery(latest))
+        .exclude(id=F('latest_id'))
+    )
+
+
+def _trace_entry(snapshot, simplify_m: float):
+    encoded, precision = snapshot.as_polyline()
+    if simplify_m > 0:
+        encoded = polyline.encode(polyline.simplify(polyline.decode(encoded, precision), simplify_m), precision)
+    return {
+        'created_at': snapshot.created_at.isoformat(),
+        'distance': float(snapshot.distance),
+        'duration': snapshot.duration,
+        'polyline': encoded,
+        'precision': precision,
+    }
+
+
+def _archive_batch(snapshots, simplify_m: float) -> int:
+    by_booking = defaultdict(list)
+    for snapshot in snapshots:
+        by_booking[snapshot.booking_id].append(_trace_entry(snapshot, simplify_m))
+
+    with transaction.atomic():
+        for booking_id in by_booking:
+            RouteTrace.objects.get_or_create(booking_id=booking_id)
+        traces = list(RouteTrace.objects.select_for_update().filter(booking_id__in=list(by_booking)))
+        for trace in traces:
+            trace.routes = sorted(list(trace.routes or []) + by_booking[trace.booking_id], key=lambda r: r['created_at'])
+            trace.updated_at = timezone.now()
+        RouteTrace.objects.bulk_update(traces, ['routes', 'updated_at'])
+        deleted, _ = RouteSnapshot.objects.filter(id__in=[s.id for s in snapshots]).delete()
+
+    for snapshot in snapshots:
+        forget_snapshot(snapshot.id)
+    return deleted
+
+
+def prune_snapshots(
+    older_than: Optional[timedelta] = None,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None,
+) -> int:
+    """Archive and delete prunable snapshots in batches. Returns the number deleted.
+
+    At most `max_batches` batches run per call (ROUTE_SNAPSHOT_PRUNE_MAX_BATCHES by
+    default) so one beat run stays short; 0 runs until nothing is left.
+    """
+    size = _batch_size(batch_size)
+    if max_batches is None:
+        max_batches = int(getattr(settings, 'ROUTE_SNAPSHOT_PRUNE_MAX_BATCHES', 50))
+    simplify_m = float(getattr(settings, 'ROUTE_TRACE_SIMPLIFY_METERS', 10))
+
+    deleted = 0
+    batches = 0
+    while not max_batches or batches < max_batches:
+        batch = list(
+            prunable_snapshots(older_than)
+            .order_by('booking_id', 'created_at')[:size]
+        )
+        if not batch:
+            break
+        deleted += _archive_batch(batch, simplify_m)
+        batches += 1
+    if deleted:
+        logger.info('Archived %s route snapshots in %s batches', deleted, batches)
+    return deleted
+
+
+def compact_legacy_snapshots(batch_size: Optional[int] = None) -> Tuple[int, int]:
+    """Move full-GeoJSON rows to the encoded polyline form. Returns (compacted, skipped)."""
+    size = _batch_size(batch_size)
+    simplify_m = float(getattr(settings, 'ROUTE_SNAPSHOT_SIMPLIFY_METERS', 2))
+    compacted = skipped = 0
+    last_id = 0
+    while True:
+        batch = list(
+            RouteSnapshot.objects
+            .filter(id__gt=last_id, geometry='', route_data__isnull=False)
+            .order_by('id')[:size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+        updated = []
+        for snapshot in batch:
+            fields = RouteSnapshot.compact_fields(snapshot.route_data, simplify_m=simplify_m)
+            if not fields['geometry']:
+                skipped += 1
+                continue
+            for name, value in fields.items():
+                setattr(snapshot, name, value)
+            snapshot.route_data = None
+            updated.append(snapshot)
+        RouteSnapshot.objects.bulk_update(updated, ['geometry', 'geometry_precision', 'route_meta', 'route_data'])
+        compacted += len(updated)
+    return compacted, skipped
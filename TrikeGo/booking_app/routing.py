@@ -1,4 +1,7 @@
 from django.urls import path
+from . import consumers
 
-# Placeholder for booking-specific websocket routes (extend later if needed)
-websocket_urlpatterns = []
+websocket_urlpatterns = [
+    path('ws/booking/<int:booking_id>/track/', consumers.BookingTrackingConsumer.as_asgi()),
+    path('ws/driver/itinerary/', consumers.DriverItineraryConsumer.as_asgi()),
+]
@@ -0,0 +1,218 @@
+"""Routing backends behind `RoutingService`.
+
+A backend answers two questions in the openrouteservice response shapes, so
+`RoutingService` parses every backend the same way:
+
+* `directions(coordinates, profile, **options)`: a GeoJSON FeatureCollection
+  whose feature has `segments` (one per leg), `summary` and `way_points`;
+* `matrix(locations, profile, metrics)`: a dict with a square list per metric,
+  `durations` in seconds and/or `distances` in metres.
+
+Coordinates are (lon, lat) like the rest of `RoutingService`.
+
+ROUTING_BACKEND selects the backend: 'ors' (default), 'local' for the in-process
+road graph at ROUTING_GRAPH_PATH, or a dotted path to a RoutingBackend subclass.
+"""
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .road_graph import RoadGraph
+
+logger = logging.getLogger(__name__)
+
+# Speed assumed between a point and the road node it snaps to (alleys, driveways)
+ACCESS_SPEED_KMH = 15.0
+
+
+class RouteNotFound(Exception):
+    """The backend cannot route between the given points."""
+
+
+class OutOfCoverage(RouteNotFound):
+    """A point is too far from the local road graph to snap onto it."""
+
+
+class RoutingBackend:
+    name = 'base'
+
+    def directions(self, coordinates, profile='driving-car', **options) -> Dict[str, object]:
+        raise NotImplementedError
+
+    def matrix(self, locations, profile='driving-car', metrics=('duration',)) -> Dict[str, object]:
+        raise NotImplementedError
+
+
+class ORSBackend(RoutingBackend):
+    """openrouteservice over the service's pooled session and circuit breaker."""
+
+    name = 'ors'
+
+    def __init__(self, service):
+        self.service = service
+
+    def directions(self, coordinates, profile='driving-car', **options):
+        # Looked up per call so the client can be swapped (tests, reconfiguration)
+        return self.service._call(
+            self.service.client.directions,
+            coordinates=[list(coord) for coord in coordinates],
+            profile=profile,
+            format='geojson',
+            **options
+        )
+
+    def matrix(self, locations, profile='driving-car', metrics=('duration',)):
+        return self.service._call(
+            self.service.client.distance_matrix,
+            locations=[list(coord) for coord in locations],
+            profile=profile,
+            metrics=list(metrics),
+        )
+
+
+class LocalGraphBackend(RoutingBackend):
+    """In-process A* routing on a RoadGraph; no network I/O.
+
+    Points further than `max_snap_m` from the graph raise OutOfCoverage, or go to
+    `fallback` (normally ORS) when one is given. The graph has a single travel
+    profile, so `profile` is ignored.
+    """
+
+    name = 'local'
+
+    def __init__(self, graph: RoadGraph, max_snap_m=None, fallback: Optional[RoutingBackend] = None):
+        self.graph = graph
+        self.max_snap_m = float(max_snap_m if max_snap_m is not None else getattr(settings, 'ROUTING_GRAPH_MAX_SNAP_METERS', 300))
+        self.fallback = fallback
+
+    def _snap(self, coord):
+        lon, lat = float(coord[0]), float(coord[1])
+        snapped = self.graph.nearest(lat, lon)
+        if snapped is None or snapped[1] > self.max_snap_m:
+            raise OutOfCoverage(f'({lat}, {lon}) is outside the road graph')
+        return snapped
+
+    @staticmethod
+    def _access_seconds(metres) -> float:
+        return metres / (ACCESS_SPEED_KMH / 3.6)
+
+    def _leg(self, start, end):
+        """[lon, lat] coordinates, metres and seconds from start to end."""
+        graph = self.graph
+        start_node, start_m = self._snap(start)
+        end_node, end_m = self._snap(end)
+        found = graph.shortest_path(start_node, end_node)
+        if found is None:
+            raise RouteNotFound(f'no road path from node {start_node} to {end_node}')
+        nodes, seconds, metres = found
+        coords = [[float(start[0]), float(start[1])]]
+        coords.extend([graph.lon[n], graph.lat[n]] for n in nodes)
+        coords.append([float(end[0]), float(end[1])])
+        metres += start_m + end_m
+        seconds += self._access_seconds(start_m + end_m)
+        return coords, metres, seconds
+
+    def directions(self, coordinates, profile='driving-car', **options):
+        try:
+            return self._directions(coordinates)
+        except OutOfCoverage:
+            if self.fallback is None:
+                raise
+            return self.fallback.directions(coordinates, profile, **options)
+
+    def _directions(self, coordinates):
+        if len(coordinates) < 2:
+            raise RouteNotFound('at least two coordinates are needed')
+        geometry: List[List[float]] = []
+        way_points = [0]
+        segments = []
+        for start, end in zip(coordinates, coordinates[1:]):
+            coords, metres, seconds = self._leg(start, end)
+            # Consecutive legs share their joining waypoint
+            geometry.extend(coords if not geometry else coords[1:])
+            way_points.append(len(geometry) - 1)
+            segments.append({'distance': round(metres, 1), 'duration': round(seconds, 1), 'steps': []})
+        summary = {
+            'distance': round(sum(s['distance'] for s in segments), 1),
+            'duration': round(sum(s['duration'] for s in segments), 1),
+        }
+        return {
+            'type': 'FeatureCollection',
+            'features': [{
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': geometry},
+                'properties': {'segments': segments, 'summary': summary, 'way_points': way_points},
+            }],
+            'metadata': {'engine': {'name': self.name}},
+        }
+
+    def matrix(self, locations, profile='driving-car', metrics=('duration',)):
+        try:
+            snapped = [self._snap(coord) for coord in locations]
+        except OutOfCoverage:
+            if self.fallback is None:
+                raise
+            return self.fallback.matrix(locations, profile, metrics)
+
+        nodes = [node for node, _ in snapped]
+        access_m = [metres for _, metres in snapped]
+        durations: List[List[Optional[float]]] = []
+        distances: List[List[Optional[float]]] = []
+        for i, source in enumerate(nodes):
+            reached = self.graph.travel_times(source, nodes)
+            duration_row, distance_row = [], []
+            for j, target in enumerate(nodes):
+                if i == j:
+                    duration_row.append(0.0)
+                    distance_row.append(0.0)
+                elif target in reached:
+                    seconds, metres = reached[target]
+                    extra_m = access_m[i] + access_m[j]
+                    duration_row.append(round(seconds + self._access_seconds(extra_m), 1))
+                    distance_row.append(round(metres + extra_m, 1))
+                else:
+                    duration_row.append(None)
+                    distance_row.append(None)
+            durations.append(duration_row)
+            distances.append(distance_row)
+        result = {}
+        if 'duration' in metrics:
+            result['durations'] = durations
+        if 'distance' in metrics:
+            result['distances'] = distances
+        return result
+
+
+_graph_lock = threading.Lock()
+_graphs: Dict[str, RoadGraph] = {}
+
+
+def load_graph(path: str) -> RoadGraph:
+    """Load a road graph once per process."""
+    with _graph_lock:
+        if path not in _graphs:
+            graph = RoadGraph.load(path)
+            logger.info('Loaded road graph %s: %s nodes, %s edges', path, graph.node_count, graph.edge_count)
+            _graphs[path] = graph
+        return _graphs[path]
+
+
+def get_backend(service, name: Optional[str] = None) -> RoutingBackend:
+    """The backend named by ROUTING_BACKEND; ORS when the local graph cannot be loaded."""
+    name = name or getattr(settings, 'ROUTING_BACKEND', 'ors') or 'ors'
+    ors = ORSBackend(service)
+    if name == 'ors':
+        return ors
+    if name == 'local':
+        path = getattr(settings, 'ROUTING_GRAPH_PATH', '')
+        try:
+            graph = load_graph(path)
+        except Exception as exc:
+            logger.warning('Local routing unavailable (%s); using ORS', exc)
+            return ors
+        fallback = ors if getattr(settings, 'ROUTING_LOCAL_FALLBACK', True) else None
+        return LocalGraphBackend(graph, fallback=fallback)
+    return import_string(name)(service)
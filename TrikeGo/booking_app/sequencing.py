@@ -0,0 +1,341 @@
+"""Pickup-and-delivery ordering for a driver's pending stops.
+
+`solve` orders stops so that every drop-off comes after its pickup and the
+passengers on board never exceed the vehicle capacity, while keeping the total
+travel cost from the driver's position low:
+
+* up to EXACT_MAX_STOPS stops: exact dynamic programming over visited subsets;
+* more stops: cheapest insertion of whole requests, then or-opt and 2-opt moves.
+
+Costs come from a square matrix over [start] + stop coordinates. The default is
+haversine kilometres; pass `cost_matrix` to order by road travel times instead.
+Coordinates are (lat, lon).
+"""
+from collections import namedtuple
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+from .geo import distance_matrix
+
+PICKUP = 'PICKUP'
+DROPOFF = 'DROPOFF'
+
+# 2^8 subsets x 9 positions x 8 extensions (~18k steps) is cheap enough for every itinerary read
+EXACT_MAX_STOPS = 8
+MAX_IMPROVE_ROUNDS = 50
+OR_OPT_MAX_SEGMENT = 3
+
+INF = float('inf')
+
+Point = Tuple[float, float]
+CostMatrix = Callable[[List[Point]], Sequence[Sequence[float]]]
+
+# `group` ties a pickup to its drop-off (the booking id); `load` is the passenger count.
+SequenceStop = namedtuple('SequenceStop', ['coord', 'kind', 'group', 'load'])
+
+
+def haversine_matrix(points: List[Point]) -> List[List[float]]:
+    return distance_matrix(points, points)
+
+
+class _Problem:
+    """Index bookkeeping shared by both solvers. Matrix node 0 is the start, stop i is node i + 1."""
+
+    def __init__(self, stops, start, capacity, cost_matrix):
+        self.stops = list(stops)
+        self.n = len(self.stops)
+        self.capacity = capacity
+
+        pickups = {s.group: i for i, s in enumerate(self.stops) if s.kind == PICKUP}
+        dropoffs = {s.group: i for i, s in enumerate(self.stops) if s.kind == DROPOFF}
+        # For a drop-off, the index of its pickup when that pickup is still pending
+        self.pickup_of = [
+            pickups.get(s.group) if s.kind == DROPOFF else None for s in self.stops
+        ]
+        self.dropoff_of = [
+            dropoffs.get(s.group) if s.kind == PICKUP else None for s in self.stops
+        ]
+        # Passengers whose pickup is done are already on board
+        self.initial_load = sum(
+            int(s.load) for i, s in enumerate(self.stops)
+            if s.kind == DROPOFF and self.pickup_of[i] is None
+        )
+        self.delta = [int(s.load) if s.kind == PICKUP else -int(s.load) for s in self.stops]
+
+        coords = [s.coord for s in self.stops]
+        if start is not None:
+            matrix = cost_matrix([start] + coords)
+            self.m = [list(map(float, row)) for row in matrix]
+        else:
+            # No known start: the first stop is free
+            matrix = cost_matrix(coords)
+            self.m = [[0.0] * (self.n + 1)] + [[0.0] + list(map(float, row)) for row in matrix]
+
+    def fits(self, load) -> bool:
+        return self.capacity is None or load <= self.capacity
+
+    def feasible(self, route) -> bool:
+        load = self.initial_load
+        if not self.fits(load):
+            return False
+        seen = set()
+        for i in route:
+            pickup = self.pickup_of[i]
+            if pickup is not None and pickup not in seen:
+                return False
+            load += self.delta[i]
+            if not self.fits(load):
+                return False
+            seen.add(i)
+        return True
+
+    def cost(self, route) -> float:
+        total = 0.0
+        prev = 0
+        for i in route:
+            total += self.m[prev][i + 1]
+            prev = i + 1
+        return total
+
+
+def _solve_exact(problem: _Problem) -> Optional[List[int]]:
+    n = problem.n
+    m = problem.m
+    size = 1 << n
+    cost = [[INF] * (n + 1) for _ in range(size)]
+    parent = [[-1] * (n + 1) for _ in range(size)]
+    load = [0] * size
+    load[0] = problem.initial_load
+    cost[0][0] = 0.0
+    if not problem.fits(load[0]):
+        return None
+
+    for mask in range(size):
+        if mask:
+            low = (mask & -mask).bit_length() - 1
+            load[mask] = load[mask & (mask - 1)] + problem.delta[low]
+        row = cost[mask]
+        current_load = load[mask]
+        for last in range(n + 1):
+            base = row[last]
+            if base == INF:
+                continue
+            for j in range(n):
+                bit = 1 << j
+                if mask & bit:
+                    continue
+                pickup = problem.pickup_of[j]
+                if pickup is not None and not mask & (1 << pickup):
+                    continue
+                if problem.delta[j] > 0 and not problem.fits(current_load + problem.delta[j]):
+                    continue
+                candidate = base + m[last][j + 1]
+                nxt = mask | bit
+                if candidate < cost[nxt][j + 1]:
+                    cost[nxt][j + 1] = candidate
+                    parent[nxt][j + 1] = last
+
+    full = size - 1
+    best_last = min(range(1, n + 1), key=lambda last: cost[full][last])
+    if cost[full][best_last] == INF:
+        return None
+
+    route = []
+    mask, last = full, best_last
+    while last > 0:
+        route.append(last - 1)
+        mask, last = mask & ~(1 << (last - 1)), parent[mask][last]
+    route.reverse()
+    return route
+
+
+def _insertion_options(problem: _Problem, route: List[int], pickup, dropoff):
+    """Yield (extra_cost, new_route) for each feasible placement of a request."""
+    m = problem.m
+    nodes = [0] + [i + 1 for i in route]
+    loads = [problem.initial_load]
+    for i in route:
+        loads.append(loads[-1] + problem.delta[i])
+    size = len(route)
+
+    def link(a, b, c):
+        # Cost of visiting b between a and c (c may be None at the end of the route)
+        if c is None:
+            return m[a][b]
+        return m[a][b] + m[b][c] - m[a][c]
+
+    def after(k):
+        return nodes[k + 1] if k < size else None
+
+    if pickup is not None and dropoff is not None:
+        p, d = pickup + 1, dropoff + 1
+        extra = problem.delta[pickup]
+        for i in range(size + 1):
+            peak = loads[i]
+            for j in range(i, size + 1):
+                if j > i:
+                    peak = max(peak, loads[j])
+                if not problem.fits(peak + extra):
+                    break
+                if j == i:
+                    nxt = after(i)
+                    added = m[nodes[i]][p] + m[p][d] + (m[d][nxt] - m[nodes[i]][nxt] if nxt is not None else 0.0)
+                else:
+                    added = link(nodes[i], p, nodes[i + 1]) + link(nodes[j], d, after(j))
+                yield added, route[:i] + [pickup] + route[i:j] + [dropoff] + route[j:]
+    elif dropoff is not None:
+        d = dropoff + 1
+        for i in range(size + 1):
+            yield link(nodes[i], d, after(i)), route[:i] + [dropoff] + route[i:]
+    else:
+        p = pickup + 1
+        extra = problem.delta[pickup]
+        for i in range(size + 1):
+            if not problem.fits(max(loads[i:]) + extra):
+                continue
+            yield link(nodes[i], p, after(i)), route[:i] + [pickup] + route[i:]
+
+
+def _requests(problem: _Problem) -> List[Tuple[Optional[int], Optional[int]]]:
+    """(pickup, dropoff) index pairs; either side may be None."""
+    requests = []
+    for i in range(problem.n):
+        if problem.stops[i].kind == PICKUP:
+            requests.append((i, problem.dropoff_of[i]))
+        elif problem.pickup_of[i] is None:
+            requests.append((None, i))
+    return requests
+
+
+def _cheapest_insertion(problem: _Problem) -> Optional[List[int]]:
+    requests = _requests(problem)
+    route: List[int] = []
+    while requests:
+        best = None
+        for request in requests:
+            for added, candidate in _insertion_options(problem, route, *request):
+                if best is None or added < best[0]:
+                    best = (added, candidate, request)
+        if best is None:
+            return None
+        route = best[1]
+        requests.remove(best[2])
+    return route
+
+
+def _improve(problem: _Problem, route: List[int]) -> List[int]:
+    """Or-opt segment moves and 2-opt reversals, first improvement, until no move helps."""
+    best_cost = problem.cost(route)
+    size = len(route)
+    for _ in range(MAX_IMPROVE_ROUNDS):
+        improved = False
+
+        for length in range(1, min(OR_OPT_MAX_SEGMENT, size - 1) + 1):
+            for i in range(size - length + 1):
+                segment = route[i:i + length]
+                rest = route[:i] + route[i + length:]
+                for k in range(len(rest) + 1):
+                    if k == i:
+                        continue
+                    candidate = rest[:k] + segment + rest[k:]
+                    candidate_cost = problem.cost(candidate)
+                    if candidate_cost < best_cost - 1e-9 and problem.feasible(candidate):
+                        route, best_cost, improved = candidate, candidate_cost, True
+                        break
+                if improved:
+                    break
+            if improved:
+                break
+
+        if not improved:
+            for i in range(size - 1):
+                for j in range(i + 2, size + 1):
+                    candidate = route[:i] + route[i:j][::-1] + route[j:]
+                    candidate_cost = problem.cost(candidate)
+                    if candidate_cost < best_cost - 1e-9 and problem.feasible(candidate):
+                        route, best_cost, improved = candidate, candidate_cost, True
+                        break
+                if improved:
+                    break
+
+        if not improved:
+            break
+    return route
+
+
+def _solve_heuristic(problem: _Problem) -> Optional[List[int]]:
+    route = _cheapest_insertion(problem)
+    if route is None:
+        return None
+    return _improve(problem, route)
+
+
+def solve(
+    stops: Sequence[SequenceStop],
+    start: Optional[Point] = None,
+    capacity: Optional[int] = None,
+    cost_matrix: Optional[CostMatrix] = None,
+) -> List[int]:
+    """Return the visiting order of `stops` as a list of indexes into `stops`.
+
+    A drop-off whose pickup is not in `stops` is treated as already on board.
+    If `capacity` cannot be honoured at all (e.g. more passengers already on
+    board than seats), the order is solved again without it.
+    """
+    if not stops:
+        return []
+    problem = _Problem(stops, start, capacity, cost_matrix or haversine_matrix)
+    solver = _solve_exact if problem.n <= EXACT_MAX_STOPS else _solve_heuristic
+    route = solver(problem)
+    if route is None and capacity is not None:
+        problem.capacity = None
+        route = solver(problem)
+    return route
+
+
+def route_cost(
+    stops: Sequence[SequenceStop],
+    order: Sequence[int],
+    start: Optional[Point] = None,
+    cost_matrix: Optional[CostMatrix] = None,
+) -> float:
+    """Total cost of visiting `stops` in `order` from `start`."""
+    if not stops:
+        return 0.0
+    return _Problem(stops, start, None, cost_matrix or haversine_matrix).cost(order)
+
+
+def insert(
+    stops: Sequence[SequenceStop],
+    order: Sequence[int],
+    new: Iterable[int],
+    start: Optional[Point] = None,
+    capacity: Optional[int] = None,
+    cost_matrix: Optional[CostMatrix] = None,
+) -> List[int]:
+    """Add the stops at indexes `new` to an existing `order` at their cheapest positions.
+
+    The relative order of the stops already in `order` is kept. Each new request
+    (pickup with its drop-off, or a lone drop-off) is inserted in turn.
+    """
+    new = set(new)
+    route = [i for i in order if i not in new]
+    if not new:
+        return route
+    problem = _Problem(stops, start, capacity, cost_matrix or haversine_matrix)
+
+    placed = set(route)
+    for request in _requests(problem):
+        members = [i for i in request if i is not None]
+        if not new.issuperset(members):
+            continue
+        options = list(_insertion_options(problem, route, *request))
+        if not options and capacity is not None:
+            problem.capacity = None
+            options = list(_insertion_options(problem, route, *request))
+            problem.capacity = capacity
+        route = min(options, key=lambda option: option[0])[1]
+        placed.update(members)
+
+    # A drop-off whose pickup was already placed just goes after everything else
+    route.extend(i for i in sorted(new) if i not in placed)
+    return route
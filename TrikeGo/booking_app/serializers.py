@@ -0,0 +1,33 @@
+from typing import Any, Dict
+
+from rest_framework import serializers
+
+from .models import RouteSnapshot
+
+GEOMETRY_FORMATS = ('geojson', 'polyline')
+
+
+class RouteSnapshotSerializer(serializers.ModelSerializer):
+    """A route with its line as GeoJSON (`route_data`) or an encoded polyline.
+
+    Pass `geometry_format='polyline'` in the serializer context for the compact
+    form; the default keeps the GeoJSON shape existing clients read.
+    """
+
+    distance = serializers.FloatField()
+
+    class Meta:
+        model = RouteSnapshot
+        fields = ('id', 'distance', 'duration', 'created_at')
+        read_only_fields = fields
+
+    def to_representation(self, instance: RouteSnapshot) -> Dict[str, Any]:
+        data = super().to_representation(instance)
+        if self.context.get('geometry_format') == 'polyline':
+            encoded, precision = instance.as_polyline()
+            data['polyline'] = encoded
+            data['precision'] = precision
+            data['route_meta'] = instance.route_meta or {}
+        else:
+            data['route_data'] = instance.as_geojson()
+        return data
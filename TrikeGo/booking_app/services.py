@@ -1,15 +1,153 @@
 import openrouteservice
 from django.conf import settings
 from .models import RouteSnapshot, DriverLocation
+from .route_cache import RouteCache
+from .deviation import check_deviation, forget_snapshot, geometry_for_snapshot
+from .geo import haversine_km
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .routing_backends import get_backend
 from decimal import Decimal
-import math
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Rate limiting and transient server errors are worth another attempt
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Average tricycle speed assumed when ORS cannot give a road estimate
+FALLBACK_SPEED_KMH = 20.0
+
+
+def build_http_session():
+    """Keep-alive session with a bounded connection pool and retry/backoff."""
+    retries = int(getattr(settings, 'ORS_HTTP_RETRIES', 2))
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        # A read timeout is not retried: a slow ORS would hold the worker for several timeouts
+        read=0,
+        status=retries,
+        backoff_factor=float(getattr(settings, 'ORS_HTTP_BACKOFF', 0.5)),
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'POST'}),
+        # ORS can ask for a minute-long wait on 429; the backoff above bounds it instead
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    pool_size = int(getattr(settings, 'ORS_HTTP_POOL_SIZE', 10))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class PooledClient(openrouteservice.Client):
+    """openrouteservice client that sends its requests through a session we own.
+
+    `Client.request` issues every call with the session the client was built
+    with; taking it as an argument lets RoutingService share one pooled,
+    retrying session across threads.
+    """
+
+    def __init__(self, session, **kwargs):
+        super().__init__(**kwargs)
+        self._session = session
+
+
+def _is_client_error(exc):
+    """Bad requests and unroutable points say nothing about ORS health."""
+    if not isinstance(exc, openrouteservice.exceptions.ApiError):
+        return False
+    status = getattr(exc, 'status', None)
+    return isinstance(status, int) and 400 <= status < 500 and status != 429
+
 
 class RoutingService:
-    def __init__(self):
+    """openrouteservice access shared by the whole process.
+
+    `RoutingService()` always returns the same thread-safe instance, so every
+    caller reuses one pooled keep-alive HTTP session instead of opening a new
+    TLS connection per request.
+
+    Settings that shape the instance (ROUTING_BACKEND and the ROUTING_GRAPH_*
+    options, the ORS_HTTP_* timeouts, retries and pool size, the ORS_BREAKER_*
+    thresholds) are read once, when the singleton is first created; changing
+    them needs a process restart.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._configure()
+                    cls._instance = instance
+        return cls._instance
+
+    def _configure(self):
         self.api_key = settings.OPENROUTESERVICE_API_KEY
-        self.client = openrouteservice.Client(key=self.api_key)
         self.base_url = 'https://api.openrouteservice.org'
+        self.timeout = (
+            float(getattr(settings, 'ORS_HTTP_CONNECT_TIMEOUT', 3)),
+            float(getattr(settings, 'ORS_HTTP_READ_TIMEOUT', 10)),
+        )
+        self.session = build_http_session()
+        # Retries happen in the session; the client's own 503 loop is capped at one read timeout
+        self.client = PooledClient(
+            self.session,
+            key=self.api_key,
+            timeout=self.timeout,
+            retry_timeout=int(self.timeout[1]),
+            retry_over_query_limit=False,
+        )
+        self.breaker = CircuitBreaker('ors')
+        # Directions and matrices go through the configured backend (ORS or a local road graph)
+        self.backend = get_backend(self)
+
+    @property
+    def degraded(self):
+        """True while the circuit breaker is open and routes are straight-line estimates."""
+        return self.breaker.state == 'open'
+
+    def _call(self, func, *args, **kwargs):
+        """Call ORS through the circuit breaker; raises CircuitOpenError while it is open."""
+        return self.breaker.call(func, *args, is_client_error=_is_client_error, **kwargs)
+
+    def _estimated_route(self, start_coords, end_coords):
+        """Straight-line route in the ORS response shape, flagged as degraded."""
+        distance_m = self._haversine_distance(
+            start_coords[1], start_coords[0],
+            end_coords[1], end_coords[0]
+        )
+        duration = int(distance_m / 1000 / FALLBACK_SPEED_KMH * 3600)
+        route = {
+            'type': 'FeatureCollection',
+            'features': [{
+                'type': 'Feature',
+                'geometry': {'type': 'LineString', 'coordinates': [list(start_coords), list(end_coords)]},
+                'properties': {
+                    'segments': [{'distance': distance_m, 'duration': duration}],
+                    'summary': {'distance': distance_m, 'duration': duration},
+                },
+            }],
+        }
+        return {
+            'route_data': route,
+            'distance': round(distance_m / 1000, 2),
+            'duration': duration,
+            'too_close': False,
+            'degraded': True,
+        }
+
+    @property
+    def route_cache(self):
+        # Built per use so cache settings are read at call time, not at first instantiation
+        return RouteCache()
     
     def geocode_address(self, query, focus_point=None):
         """
@@ -36,7 +174,7 @@ class RoutingService:
                 params['focus.point.lon'] = focus_point[0]
                 params['focus.point.lat'] = focus_point[1]
             
-            response = requests.get(url, params=params)
+            response = self._call(self.session.get, url, params=params, timeout=self.timeout)
             data = response.json()
             
             results = []
@@ -75,7 +213,7 @@ class RoutingService:
                 'size': 1
             }
             
-            response = requests.get(url, params=params)
+            response = self._call(self.session.get, url, params=params, timeout=self.timeout)
             data = response.json()
             
             if data.get('features'):
@@ -131,49 +269,178 @@ class RoutingService:
                     'duration': int(distance_m / 1.4),  # Walking speed ~1.4 m/s
                     'too_close': True
                 }
-            
+
+            cached = self.route_cache.get(start_coords, end_coords, profile)
+            if cached is not None:
+                return cached
+
             coords = [start_coords, end_coords]
             
             # Request route with traffic consideration
-            route = self.client.directions(
-                coordinates=coords,
-                profile=profile,
-                format='geojson',
-                geometry='true',
-                instructions='true',
-                elevation='false',
-                # Note: Real-time traffic requires premium ORS subscription
-                # For now, we use standard routing which considers typical traffic patterns
-            )
+            try:
+                route = self.backend.directions(
+                    coords,
+                    profile,
+                    geometry='true',
+                    instructions='true',
+                    elevation='false',
+                    # Note: Real-time traffic requires premium ORS subscription
+                    # For now, we use standard routing which considers typical traffic patterns
+                )
+            except CircuitOpenError:
+                return self._estimated_route(start_coords, end_coords)
             
             # Extract route information
             distance = route['features'][0]['properties']['segments'][0]['distance'] / 1000
             duration = route['features'][0]['properties']['segments'][0]['duration']
             
-            return {
+            route_info = {
                 'route_data': route,
                 'distance': round(distance, 2),
                 'duration': int(duration),
                 'too_close': False
             }
+            self.route_cache.set(start_coords, end_coords, profile, route_info)
+            return route_info
         except Exception as e:
             print(f"Routing error: {e}")
             return None
     
+    def calculate_multi_route(self, waypoints, profile='driving-car'):
+        """
+        Route through several waypoints with a single directions request
+
+        Args:
+            waypoints: list of (longitude, latitude), at least two
+            profile: ORS routing profile
+
+        Returns:
+            dict with route_data, distance (km), duration (seconds) and legs: one
+            dict per consecutive waypoint pair with points ([lat, lon] list),
+            distance (km) and duration (seconds); None if the request fails
+        """
+        if len(waypoints) < 2:
+            return None
+        try:
+            route = self.backend.directions(
+                waypoints,
+                profile,
+                geometry='true',
+                instructions='false',
+                elevation='false',
+            )
+            feature = route['features'][0]
+            properties = feature['properties']
+            coordinates = feature['geometry']['coordinates']
+            # Index of each input waypoint within the geometry
+            way_points = properties.get('way_points') or []
+            segments = properties.get('segments') or []
+            if len(way_points) != len(waypoints) or len(segments) != len(waypoints) - 1:
+                return None
+
+            legs = []
+            for idx, segment in enumerate(segments):
+                leg_coords = coordinates[way_points[idx]:way_points[idx + 1] + 1]
+                legs.append({
+                    'points': [[float(c[1]), float(c[0])] for c in leg_coords],
+                    'distance': float(segment.get('distance') or 0.0) / 1000,
+                    'duration': float(segment.get('duration') or 0.0),
+                })
+
+            summary = properties.get('summary') or {}
+            return {
+                'route_data': route,
+                'distance': round(float(summary.get('distance') or 0.0) / 1000, 2),
+                'duration': int(summary.get('duration') or 0),
+                'legs': legs,
+            }
+        except Exception as e:
+            print(f"Multi-stop routing error: {e}")
+            return None
+
+    def duration_matrix(self, locations, profile='driving-car'):
+        """
+        Travel times between every pair of locations with a single matrix request
+
+        Args:
+            locations: list of (longitude, latitude)
+
+        Returns:
+            square list of durations in seconds (None where ORS found no route),
+            or None if the request fails
+        """
+        if len(locations) < 2:
+            return None
+        try:
+            result = self.backend.matrix(locations, profile)
+            durations = result.get('durations') or []
+            if len(durations) != len(locations):
+                return None
+            return [
+                [float(value) if value is not None else None for value in row]
+                for row in durations
+            ]
+        except Exception as e:
+            print(f"Matrix error: {e}")
+            return None
+
+    def travel_matrix(self, locations, profile='driving-car'):
+        """
+        Travel times and road distances between every pair of locations in one request
+
+        Args:
+            locations: list of (longitude, latitude)
+
+        Returns:
+            dict with square 'durations' (seconds) and 'distances' (km) lists, None
+            where no route was found, or None if the request fails
+        """
+        if len(locations) < 2:
+            return None
+        try:
+            result = self.backend.matrix(locations, profile, metrics=('duration', 'distance'))
+            durations = result.get('durations') or []
+            distances = result.get('distances') or []
+            if len(durations) != len(locations) or len(distances) != len(locations):
+                return None
+            return {
+                'durations': [
+                    [float(value) if value is not None else None for value in row]
+                    for row in durations
+                ],
+                'distances': [
+                    [float(value) / 1000 if value is not None else None for value in row]
+                    for row in distances
+                ],
+            }
+        except Exception as e:
+            print(f"Matrix error: {e}")
+            return None
+
     def save_route_snapshot(self, booking, route_info):
         """Save route snapshot to database"""
-        if route_info and not route_info.get('too_close'):
+        # Degraded estimates are straight lines; tracking deviation against them would only reroute
+        if route_info and not route_info.get('too_close') and not route_info.get('degraded'):
             # Deactivate previous routes
-            RouteSnapshot.objects.filter(booking=booking, is_active=True).update(is_active=False)
+            previous = RouteSnapshot.objects.filter(booking=booking, is_active=True)
+            for snapshot_id in previous.values_list('id', flat=True):
+                forget_snapshot(snapshot_id)
+            previous.update(is_active=False)
             
             # Create new route snapshot
+            # Stored as an encoded polyline plus summary; the full response is not kept
             snapshot = RouteSnapshot.objects.create(
                 booking=booking,
-                route_data=route_info['route_data'],
+                **RouteSnapshot.compact_fields(
+                    route_info['route_data'],
+                    simplify_m=float(getattr(settings, 'ROUTE_SNAPSHOT_SIMPLIFY_METERS', 2)),
+                ),
                 distance=Decimal(str(route_info['distance'])),
                 duration=route_info['duration'],
                 is_active=True
             )
+            # Build the deviation geometry now rather than on the first location update
+            geometry_for_snapshot(snapshot)
             return snapshot
         return None
     
@@ -189,41 +456,26 @@ class RoutingService:
         Returns:
             bool: True if rerouting is needed
         """
-        if not current_route or not current_route.route_data:
+        if not current_route:
             return True
         
         try:
-            # Get route coordinates
-            route_coords = current_route.route_data['features'][0]['geometry']['coordinates']
-            driver_point = (float(driver_location.longitude), float(driver_location.latitude))
-            
-            # Find minimum distance to route
-            min_distance = float('inf')
-            for coord in route_coords:
-                distance = self._haversine_distance(
-                    driver_point[1], driver_point[0],
-                    coord[1], coord[0]
-                )
-                min_distance = min(min_distance, distance)
-            
-            return min_distance > threshold_meters
+            result = check_deviation(
+                current_route,
+                float(driver_location.latitude),
+                float(driver_location.longitude),
+                threshold_meters,
+            )
+            if result is None:
+                return True
+            return result.off_route
         except Exception as e:
             print(f"Error checking route deviation: {e}")
             return False
     
     def _haversine_distance(self, lat1, lon1, lat2, lon2):
         """Calculate distance between two points in meters"""
-        R = 6371000  # Earth's radius in meters
-        
-        phi1 = math.radians(lat1)
-        phi2 = math.radians(lat2)
-        delta_phi = math.radians(lat2 - lat1)
-        delta_lambda = math.radians(lon2 - lon1)
-        
-        a = math.sin(delta_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        
-        return R * c
+        return haversine_km(lat1, lon1, lat2, lon2) * 1000
     
     def get_eta(self, driver_location, destination_coords):
         """
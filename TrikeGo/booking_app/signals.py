@@ -0,0 +1,94 @@
+"""Model signal handlers that keep derived booking state (indexes, caches) in step."""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from user_app.models import Driver, Passenger, Tricycle
+
+from .models import Booking, BookingStop, RouteSnapshot
+from . import cache_versions, geocoding, itinerary_state, itinerary_stream, realtime, spatial
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('accepted', 'on_the_way', 'started')
+
+
+@receiver(post_init, sender=Booking)
+def booking_loaded(sender, instance, **kwargs):
+    # Remember the assigned driver so an unassignment still refreshes their itinerary
+    instance._loaded_driver_id = instance.driver_id
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, created=False, **kwargs):
+    spatial.sync_booking(instance)
+    cache_versions.bump_on_commit(cache_versions.BOOKING, instance.id)
+    if created:
+        geocoding.remember_booking(instance)
+    transaction.on_commit(lambda: _publish_tracking(instance))
+
+    loaded_driver_id = getattr(instance, '_loaded_driver_id', None)
+    if loaded_driver_id and (loaded_driver_id != instance.driver_id or instance.status not in ACTIVE_STATUSES):
+        # Cancelled, reassigned or finished: drop its stops from the old driver's cached order
+        itinerary_state.remove_booking(loaded_driver_id, instance.id)
+
+    driver_ids = {instance.driver_id, loaded_driver_id} - {None}
+    instance._loaded_driver_id = instance.driver_id
+    cache_versions.bump_on_commit(cache_versions.DRIVER, *driver_ids)
+    for driver_id in driver_ids:
+        transaction.on_commit(lambda driver_id=driver_id: _refresh_itinerary(driver_id))
+
+
+def _refresh_itinerary(driver_id):
+    try:
+        itinerary_stream.mark_itinerary_dirty(driver_id)
+    except Exception as exc:
+        logger.warning('Itinerary refresh failed for driver %s: %s', driver_id, exc)
+
+
+def _publish_tracking(booking):
+    try:
+        realtime.publish_tracking(booking)
+    except Exception as exc:
+        logger.warning('Tracking publish failed for booking %s: %s', booking.id, exc)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    spatial.pending_pickup_index.remove(instance.id)
+    cache_versions.bump_booking(instance.id)
+
+
+# Everything below only retires cached route_info / itinerary responses
+
+@receiver(post_save, sender=BookingStop)
+@receiver(post_delete, sender=BookingStop)
+def booking_stop_changed(sender, instance, **kwargs):
+    cache_versions.bump_on_commit(cache_versions.BOOKING, instance.booking_id)
+    driver_id = Booking.objects.filter(id=instance.booking_id).values_list('driver_id', flat=True).first()
+    if driver_id:
+        cache_versions.bump_on_commit(cache_versions.DRIVER, driver_id)
+
+
+@receiver(post_save, sender=RouteSnapshot)
+def route_snapshot_saved(sender, instance, **kwargs):
+    cache_versions.bump_on_commit(cache_versions.BOOKING, instance.booking_id)
+
+
+@receiver(post_save, sender=Driver)
+@receiver(post_save, sender=Tricycle)
+def driver_profile_saved(sender, instance, **kwargs):
+    driver = instance.driver if sender is Tricycle else instance
+    driver_id = getattr(driver, 'user_id', None)
+    if not driver_id:
+        return
+    cache_versions.bump_on_commit(cache_versions.DRIVER, driver_id)
+    cache_versions.bump_driver_bookings(driver_id)
+
+
+@receiver(post_save, sender=Passenger)
+def passenger_profile_saved(sender, instance, **kwargs):
+    if instance.user_id:
+        cache_versions.bump_passenger_bookings(instance.user_id)
@@ -0,0 +1,474 @@
+"""Geohash grid index for online drivers and pending booking pickups.
+
+Members are bucketed by geohash cell in the configured Django cache (locmem or Redis),
+so "who is near this point" only touches the handful of cells that cover the search
+radius instead of scanning every driver or booking. The index is maintained
+incrementally from location pings and booking state changes, and rebuilt from the
+database whenever the cache has been flushed and every SPATIAL_INDEX_REBUILD_SECONDS.
+"""
+import logging
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .geo import EARTH_RADIUS_KM, haversine_km
+
+logger = logging.getLogger(__name__)
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Refuse to enumerate more cells than this; callers fall back to a database query.
+MAX_QUERY_CELLS = 2500
+
+# A rebuild that dies without releasing its lock blocks others for at most this long
+REBUILD_LOCK_SECONDS = 60
+
+
+def geohash_encode(lat: float, lon: float, precision: int = 6) -> str:
+    """Encode a latitude/longitude pair as a geohash string."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value = (value << 1) | 1
+                lon_lo = mid
+            else:
+                value <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Return (south, west, north, east) bounds of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                if bit:
+                    lon_lo = mid
+                else:
+                    lon_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+def cell_size_degrees(precision: int) -> Tuple[float, float]:
+    """Return the (lat, lon) height/width in degrees of a geohash cell at `precision`."""
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def cells_covering(lat: float, lon: float, radius_km: float, precision: int = 6) -> Optional[Set[str]]:
+    """Return the set of geohash cells intersecting a circle's bounding box.
+
+    Returns None when the radius is too large to enumerate cheaply.
+    """
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    d_lon = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180.0)
+
+    cell_lat, cell_lon = cell_size_degrees(precision)
+    south, north = max(lat - d_lat, -90.0), min(lat + d_lat, 90.0)
+    west, east = lon - d_lon, lon + d_lon
+
+    rows = int(math.floor(north / cell_lat) - math.floor(south / cell_lat)) + 1
+    cols = int(math.floor(east / cell_lon) - math.floor(west / cell_lon)) + 1
+    if rows * cols > MAX_QUERY_CELLS:
+        return None
+
+    cells: Set[str] = set()
+    lat_start = (math.floor(south / cell_lat) + 0.5) * cell_lat
+    lon_start = (math.floor(west / cell_lon) + 0.5) * cell_lon
+    for r in range(rows):
+        c_lat = min(lat_start + r * cell_lat, 90.0 - cell_lat / 2)
+        for c in range(cols):
+            c_lon = lon_start + c * cell_lon
+            c_lon = ((c_lon + 180.0) % 360.0) - 180.0
+            cells.add(geohash_encode(c_lat, c_lon, precision))
+    return cells
+
+
+class CellSets:
+    """Sets of member ids stored under cache keys, updated without read-modify-write races.
+
+    On django-redis these are native Redis sets (SADD/SREM are atomic). Other
+    backends keep a Python set per key and serialise updates with a lock, which
+    covers locmem (one process); the periodic rebuild repairs anything a shared
+    non-Redis backend loses between processes.
+    """
+
+    _lock = threading.Lock()
+
+    def _redis(self):
+        if not type(cache).__module__.startswith('django_redis'):
+            return None
+        try:
+            from django_redis import get_redis_connection
+            return get_redis_connection('default')
+        except Exception:
+            return None
+
+    def add(self, key: str, *members) -> None:
+        client = self._redis()
+        if client is not None:
+            client.sadd(cache.make_key(key), *[str(member) for member in members])
+            return
+        with self._lock:
+            found = cache.get(key) or set()
+            found.update(str(member) for member in members)
+            cache.set(key, found, timeout=None)
+
+    def discard(self, key: str, *members) -> None:
+        """Remove members; a set left empty is deleted (Redis does this by itself)."""
+        client = self._redis()
+        if client is not None:
+            client.srem(cache.make_key(key), *[str(member) for member in members])
+            return
+        with self._lock:
+            found = cache.get(key) or set()
+            found.difference_update(str(member) for member in members)
+            if found:
+                cache.set(key, found, timeout=None)
+            else:
+                cache.delete(key)
+
+    def members_many(self, keys: List[str]) -> Dict[str, Set[str]]:
+        client = self._redis()
+        if client is not None:
+            pipe = client.pipeline()
+            for key in keys:
+                pipe.smembers(cache.make_key(key))
+            return {
+                key: {m.decode() if isinstance(m, bytes) else m for m in found}
+                for key, found in zip(keys, pipe.execute())
+            }
+        return {key: set(found) for key, found in cache.get_many(keys).items()}
+
+    def delete_many(self, keys: List[str]) -> None:
+        client = self._redis()
+        if client is not None:
+            if keys:
+                client.delete(*[cache.make_key(key) for key in keys])
+            return
+        cache.delete_many(keys)
+
+
+_cell_sets = CellSets()
+
+
+class GeoGridIndex:
+    """A geohash-bucketed point index stored in the Django cache.
+
+    Each member has its own key holding ``[cell, lat, lon, updated_ts]``, and each
+    cell is a set of member ids (see `CellSets`), so concurrent writers never
+    overwrite each other. A cell set may briefly list a member that has moved on;
+    queries only trust members whose own key still names that cell.
+
+    The warm flag expires after SPATIAL_INDEX_REBUILD_SECONDS so the next query
+    rebuilds the index from the database, repairing anything the cache lost. A
+    rebuild only adds and prunes, so queries running alongside it never see an
+    empty index.
+    """
+
+    def __init__(self, namespace: str, precision: Optional[int] = None, max_age: Optional[int] = None):
+        self.namespace = namespace
+        self.precision = int(precision or getattr(settings, 'SPATIAL_INDEX_PRECISION', 6))
+        # Entries older than max_age seconds are ignored by queries (None = never stale)
+        self.max_age = max_age
+
+    def _cell_key(self, cell: str) -> str:
+        return f'{self.namespace}:cell:{cell}'
+
+    def _member_key(self, member_id) -> str:
+        return f'{self.namespace}:member:{member_id}'
+
+    @property
+    def _warm_key(self) -> str:
+        return f'{self.namespace}:warm'
+
+    @property
+    def _rebuild_lock_key(self) -> str:
+        return f'{self.namespace}:rebuilding'
+
+    @property
+    def _cell_registry_key(self) -> str:
+        return f'{self.namespace}:cells'
+
+    def is_warm(self) -> bool:
+        return bool(cache.get(self._warm_key))
+
+    def mark_warm(self) -> None:
+        timeout = int(getattr(settings, 'SPATIAL_INDEX_REBUILD_SECONDS', 300)) or None
+        cache.set(self._warm_key, True, timeout=timeout)
+
+    def upsert(self, member_id, lat: float, lon: float) -> None:
+        """Insert or move a member to the given coordinates."""
+        try:
+            lat_f, lon_f = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return
+        cell = geohash_encode(lat_f, lon_f, self.precision)
+        previous = cache.get(self._member_key(member_id))
+        cache.set(self._member_key(member_id), [cell, lat_f, lon_f, time.time()], timeout=None)
+        if not previous or previous[0] != cell:
+            _cell_sets.add(self._cell_key(cell), member_id)
+            _cell_sets.add(self._cell_registry_key, self._cell_key(cell))
+        if previous and previous[0] != cell:
+            _cell_sets.discard(self._cell_key(previous[0]), member_id)
+
+    def remove(self, member_id) -> None:
+        previous = cache.get(self._member_key(member_id))
+        cache.delete(self._member_key(member_id))
+        if previous:
+            _cell_sets.discard(self._cell_key(previous[0]), member_id)
+
+    def query(self, lat: float, lon: float, radius_km: float, limit: Optional[int] = None) -> Optional[List[Tuple[int, float]]]:
+        """Return ``[(member_id, distance_km), ...]`` within `radius_km`, nearest first.
+
+        Returns None when the radius is too large for the grid; callers should fall back
+        to an unfiltered query in that case.
+        """
+        cells = cells_covering(float(lat), float(lon), float(radius_km), self.precision)
+        if cells is None:
+            return None
+
+        cell_members = _cell_sets.members_many([self._cell_key(cell) for cell in cells])
+        candidates: Dict[str, Set[str]] = {}
+        for key, members in cell_members.items():
+            for member_id in members:
+                candidates.setdefault(member_id, set()).add(key)
+        if not candidates:
+            return []
+        entries = cache.get_many([self._member_key(member_id) for member_id in candidates])
+        cutoff = time.time() - self.max_age if self.max_age else None
+        results: List[Tuple[int, float]] = []
+        for member_id, cell_keys in candidates.items():
+            entry = entries.get(self._member_key(member_id))
+            if not entry or self._cell_key(entry[0]) not in cell_keys:
+                continue
+            _, m_lat, m_lon, updated = entry
+            if cutoff is not None and updated < cutoff:
+                continue
+            distance = haversine_km(float(lat), float(lon), m_lat, m_lon)
+            if distance <= radius_km:
+                results.append((int(member_id), distance))
+
+        results.sort(key=lambda item: item[1])
+        if limit is not None:
+            results = results[:limit]
+        return results
+
+    def rebuild(self, entries: Iterable[Tuple[int, float, float]], started: Optional[float] = None) -> Optional[int]:
+        """Bring the index in line with `(member_id, lat, lon)` entries read from the database.
+
+        `started` is when the entries were read: members upserted since then are
+        newer than the entries and are left alone. The entries are written before
+        members that are no longer listed are pruned. Returns None without doing
+        anything while another rebuild is running.
+        """
+        if not cache.add(self._rebuild_lock_key, True, timeout=REBUILD_LOCK_SECONDS):
+            return None
+        try:
+            if started is None:
+                started = time.time()
+            fresh: Dict[str, list] = {}
+            now = time.time()
+            for member_id, lat, lon in entries:
+                if lat is None or lon is None:
+                    continue
+                lat_f, lon_f = float(lat), float(lon)
+                fresh[str(member_id)] = [geohash_encode(lat_f, lon_f, self.precision), lat_f, lon_f, now]
+
+            current = cache.get_many([self._member_key(member_id) for member_id in fresh])
+            members: Dict[str, list] = {}
+            cells: Dict[str, Set[str]] = {}
+            for member_id, entry in fresh.items():
+                existing = current.get(self._member_key(member_id))
+                if existing and existing[3] >= started:
+                    continue
+                members[self._member_key(member_id)] = entry
+                cells.setdefault(self._cell_key(entry[0]), set()).add(member_id)
+            if members:
+                cache.set_many(members, timeout=None)
+                for key, ids in cells.items():
+                    _cell_sets.add(key, *ids)
+                _cell_sets.add(self._cell_registry_key, *cells)
+            self._prune(set(fresh), started)
+            self.mark_warm()
+            return len(fresh)
+        finally:
+            cache.delete(self._rebuild_lock_key)
+
+    def _prune(self, keep: Set[str], started: float) -> None:
+        """Drop members missing from `keep` that were not upserted since `started`."""
+        registry = self._cell_registry_key
+        cell_keys = list(_cell_sets.members_many([registry]).get(registry) or [])
+        if not cell_keys:
+            return
+        cell_members = _cell_sets.members_many(cell_keys)
+        member_ids = {member_id for found in cell_members.values() for member_id in found}
+        entries = cache.get_many([self._member_key(member_id) for member_id in member_ids])
+        stale = set()
+        for member_id in member_ids:
+            entry = entries.get(self._member_key(member_id))
+            if member_id not in keep and entry and entry[3] < started:
+                stale.add(member_id)
+        if stale:
+            cache.delete_many([self._member_key(member_id) for member_id in stale])
+
+        empty = []
+        for key in cell_keys:
+            found = cell_members.get(key) or set()
+            drop = set()
+            for member_id in found:
+                entry = entries.get(self._member_key(member_id))
+                if member_id in stale or not entry or self._cell_key(entry[0]) != key:
+                    drop.add(member_id)
+            if drop:
+                _cell_sets.discard(key, *drop)
+            if drop == found:
+                empty.append(key)
+        if empty:
+            _cell_sets.discard(registry, *empty)
+
+    def clear(self) -> None:
+        keys = list(_cell_sets.members_many([self._cell_registry_key]).get(self._cell_registry_key) or [])
+        if keys:
+            member_keys = [
+                self._member_key(member_id)
+                for found in _cell_sets.members_many(keys).values()
+                for member_id in found
+            ]
+            cache.delete_many(member_keys)
+            _cell_sets.delete_many(keys)
+        _cell_sets.delete_many([self._cell_registry_key])
+        cache.delete(self._warm_key)
+
+
+driver_index = GeoGridIndex(
+    'geo_drivers',
+    max_age=int(getattr(settings, 'SPATIAL_INDEX_DRIVER_MAX_AGE', 600)),
+)
+pending_pickup_index = GeoGridIndex('geo_pickups')
+
+
+# ---- Maintenance hooks ----
+
+def index_driver_location(driver_user_id: int, lat, lon) -> None:
+    """Record a driver's latest position in the driver index."""
+    try:
+        driver_index.upsert(driver_user_id, lat, lon)
+    except Exception as exc:
+        logger.warning('Could not index driver %s location: %s', driver_user_id, exc)
+
+
+def remove_driver(driver_user_id: int) -> None:
+    """Drop a driver from the index (went offline or logged out)."""
+    try:
+        driver_index.remove(driver_user_id)
+    except Exception as exc:
+        logger.warning('Could not remove driver %s from index: %s', driver_user_id, exc)
+
+
+def sync_booking(booking) -> None:
+    """Keep the pending pickup index in step with a booking's status."""
+    try:
+        is_pending = booking.status == 'pending' and booking.driver_id is None
+        if is_pending and booking.pickup_latitude is not None and booking.pickup_longitude is not None:
+            pending_pickup_index.upsert(booking.id, booking.pickup_latitude, booking.pickup_longitude)
+        else:
+            pending_pickup_index.remove(booking.id)
+    except Exception as exc:
+        logger.warning('Could not sync booking %s with pickup index: %s', getattr(booking, 'id', None), exc)
+
+
+def rebuild_driver_index() -> Optional[int]:
+    from booking_app import locations
+    from user_app.models import Driver
+
+    started = time.time()
+    online_ids = Driver.objects.filter(status__in=['Online', 'In_trip']).values_list('user_id', flat=True)
+    entries = [
+        (driver_id, fix.latitude, fix.longitude)
+        for driver_id, fix in locations.get_locations(online_ids).items()
+    ]
+    return driver_index.rebuild(entries, started=started)
+
+
+def rebuild_pending_index() -> Optional[int]:
+    from booking_app.models import Booking
+
+    started = time.time()
+    entries = Booking.objects.filter(
+        status='pending',
+        driver__isnull=True,
+        pickup_latitude__isnull=False,
+        pickup_longitude__isnull=False,
+    ).values_list('id', 'pickup_latitude', 'pickup_longitude')
+    return pending_pickup_index.rebuild(entries, started=started)
+
+
+# ---- Queries ----
+#
+# CellSets talks to Redis directly, outside the cache's IGNORE_EXCEPTIONS, so a
+# cache outage surfaces here. Callers treat None like a radius too large for the
+# grid and fall back to an unfiltered database query. They do the same while another
+# worker is rebuilding a cold index.
+
+def drivers_within(lat, lon, radius_km: float) -> Optional[List[Tuple[int, float]]]:
+    """Return ``[(driver_user_id, distance_km)]`` for indexed drivers within `radius_km`."""
+    try:
+        if not driver_index.is_warm() and rebuild_driver_index() is None:
+            return None
+        return driver_index.query(lat, lon, radius_km)
+    except Exception as exc:
+        logger.warning('Driver index unavailable, falling back to the database: %s', exc)
+        return None
+
+
+def pending_pickups_near(lat, lon, radius_km: float, limit: Optional[int] = None) -> Optional[List[Tuple[int, float]]]:
+    """Return ``[(booking_id, distance_km)]`` for pending pickups within `radius_km`."""
+    try:
+        if not pending_pickup_index.is_warm() and rebuild_pending_index() is None:
+            return None
+        return pending_pickup_index.query(lat, lon, radius_km, limit=limit)
+    except Exception as exc:
+        logger.warning('Pickup index unavailable, falling back to the database: %s', exc)
+        return None
@@ -1,12 +1,68 @@
 from celery import shared_task
+from django.conf import settings
 from .services import RoutingService
 from .models import Booking
+from . import cache_versions, locations, route_retention, zone_table
 from django.core.cache import cache
-import os
+import logging
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+REROUTE_ACTIVE_STATUSES = ('accepted', 'on_the_way', 'started')
+
+
+def _reroute_pending_key(booking_id):
+    return f'reroute_pending:{booking_id}'
+
+
+def schedule_reroute(booking_id):
+    """Queue a debounced reroute check for a booking.
+
+    The first ping in a window claims the pending marker and schedules the task for
+    the end of the window; later pings in the same window are dropped because the
+    task reads the latest driver location when it runs. Returns True when a task
+    was queued.
+    """
+    window = max(0, int(getattr(settings, 'REROUTE_DEBOUNCE_SECONDS', 5)))
+    key = _reroute_pending_key(booking_id)
+    if window and not cache.add(key, 1, timeout=window):
+        return False
+    try:
+        reroute_booking.apply_async(args=[booking_id], countdown=window)
+    except Exception as exc:
+        cache.delete(key)
+        logger.warning('Could not queue reroute for booking %s: %s', booking_id, exc)
+        return False
+    return True
+
+
+@shared_task
+def reroute_booking(booking_id):
+    """Reroute a booking if its driver has drifted from the active route."""
+    from .api_views import check_and_reroute
+
+    booking = Booking.objects.filter(id=booking_id, status__in=REROUTE_ACTIVE_STATUSES).first()
+    if not booking or not booking.driver_id:
+        return False
+    location = locations.get_location(booking.driver_id)
+    if not location:
+        return False
+    try:
+        check_and_reroute(booking, location)
+    except Exception as exc:
+        logger.warning('Reroute failed for booking %s: %s', booking_id, exc)
+        return False
+    return True
 
 
 @shared_task
 def compute_and_cache_route(booking_id):
+    """Route a booking in the background and keep the result as its snapshot.
+
+    Saving the snapshot bumps the booking's cache version (booking_app.signals),
+    so the next route_info poll rebuilds instead of reading a separate cache key.
+    """
     try:
         booking = Booking.objects.get(id=booking_id)
         routing_service = RoutingService()
@@ -18,8 +74,7 @@ def compute_and_cache_route(booking_id):
             route_info = routing_service.calculate_route(start, end)
         else:
             try:
-                from booking_app.models import DriverLocation
-                dl = DriverLocation.objects.filter(driver=booking.driver).first()
+                dl = locations.get_location(booking.driver_id)
                 if dl:
                     start = (float(dl.longitude), float(dl.latitude))
                     end = (float(booking.pickup_longitude), float(booking.pickup_latitude))
@@ -35,17 +90,6 @@ def compute_and_cache_route(booking_id):
                 routing_service.save_route_snapshot(booking, route_info)
             except Exception:
                 pass
-
-            payload = {
-                'status': 'success',
-                'route_payload': {
-                    'route_data': route_info.get('route_data'),
-                    'distance': route_info.get('distance'),
-                    'duration': route_info.get('duration')
-                }
-            }
-            cache_key = f'route_info_{booking_id}_{booking.status}_{booking.driver_id or "none"}'
-            cache.set(cache_key, payload, timeout=int(os.environ.get('ROUTE_CACHE_TTL', 15)))
             return True
     except Booking.DoesNotExist:
         return False
@@ -53,3 +97,78 @@ def compute_and_cache_route(booking_id):
         return False
 
     return False
+
+
+@shared_task
+def flush_driver_locations():
+    """Persist buffered driver GPS fixes; scheduled by CELERY_BEAT_SCHEDULE."""
+    try:
+        return locations.flush_locations()
+    except Exception as exc:
+        logger.warning('Driver location flush failed: %s', exc)
+        return 0
+
+
+@shared_task
+def push_driver_itinerary(driver_id):
+    """Rebuild a driver's itinerary and push the changes to their open sockets."""
+    from .itinerary_stream import push_itinerary
+
+    try:
+        return bool(push_itinerary(driver_id))
+    except Exception as exc:
+        logger.warning('Itinerary push failed for driver %s: %s', driver_id, exc)
+        return False
+
+
+@shared_task
+def prune_route_snapshots():
+    """Archive superseded route snapshots; scheduled by CELERY_BEAT_SCHEDULE."""
+    try:
+        return route_retention.prune_snapshots()
+    except Exception as exc:
+        logger.warning('Route snapshot pruning failed: %s', exc)
+        return 0
+
+
+@shared_task
+def refresh_zone_table():
+    """Rebuild the zone-to-zone travel table; scheduled by CELERY_BEAT_SCHEDULE."""
+    try:
+        return zone_table.refresh_table()
+    except Exception as exc:
+        logger.warning('Zone table refresh failed: %s', exc)
+        return 0
+
+
+@shared_task
+def refine_booking_estimate(booking_id):
+    """Replace a zone-table quote with a routed estimate while the booking is still pending."""
+    try:
+        booking = Booking.objects.get(id=booking_id)
+    except Booking.DoesNotExist:
+        return False
+    if booking.status != 'pending' or booking.pickup_latitude is None or booking.destination_latitude is None:
+        return False
+
+    start = (float(booking.pickup_longitude), float(booking.pickup_latitude))
+    end = (float(booking.destination_longitude), float(booking.destination_latitude))
+    route_info = RoutingService().calculate_route(start, end)
+    if not route_info or route_info.get('too_close') or route_info.get('degraded'):
+        return False
+
+    booking.estimated_distance = Decimal(str(route_info['distance']))
+    booking.estimated_duration = route_info['duration'] // 60
+    booking.calculate_fare(discount_code_str=booking.discount_code.code if booking.discount_code else None)
+    # Only touch a booking nobody has accepted in the meantime
+    updated = Booking.objects.filter(id=booking.id, status='pending').update(
+        estimated_distance=booking.estimated_distance,
+        estimated_duration=booking.estimated_duration,
+        fare=booking.fare,
+        discount_amount=booking.discount_amount,
+        discount_code=booking.discount_code,
+    )
+    if updated:
+        # Queryset update: no post_save, so the cached route_info has to be retired here
+        cache_versions.bump_on_commit(cache_versions.BOOKING, booking.id)
+    return bool(updated)
@@ -0,0 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from booking_app.models import Booking, DriverLocation
+from booking_app.utils import insertion_detour_km
+
+User = get_user_model()
+
+
+class InsertionDetourTest(TestCase):
+    def test_idle_driver_detour_is_distance_to_pickup(self):
+        route = [(14.5995, 120.9842)]
+        detour = insertion_detour_km(route, (14.6020, 120.9842), (14.6200, 120.9842))
+        self.assertAlmostEqual(detour, 0.278, places=2)
+
+    def test_pickup_on_current_path_costs_nothing(self):
+        route = [(14.5995, 120.9842), (14.6200, 120.9842)]
+        detour = insertion_detour_km(route, (14.6050, 120.9842), (14.6150, 120.9842))
+        self.assertAlmostEqual(detour, 0.0, places=3)
+
+
+class AvailableRidesFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+        self.passenger = User.objects.create_user(username='pax', password='p', trikego_user='P')
+        DriverLocation.objects.create(driver=self.driver, latitude=14.5995, longitude=120.9842)
+        self.client.force_login(self.driver)
+        self.url = reverse('drivers:available_rides_api')
+
+    def _booking(self, lat, lon):
+        return Booking.objects.create(
+            passenger=self.passenger,
+            pickup_address='A', destination_address='B',
+            pickup_latitude=lat, pickup_longitude=lon,
+            destination_latitude=lat + 0.01, destination_longitude=lon,
+        )
+
+    def test_proximity_sort_ranks_nearest_pickup_first(self):
+        far = self._booking(14.6300, 120.9842)
+        near = self._booking(14.6010, 120.9842)
+        data = self.client.get(self.url, {'sort': 'proximity'}).json()
+        self.assertEqual([ride['id'] for ride in data['rides']], [near.id, far.id])
+        self.assertLess(data['rides'][0]['detour_km'], data['rides'][1]['detour_km'])
+
+    def test_cursor_pages_do_not_overlap(self):
+        bookings = [self._booking(14.6000 + i * 0.001, 120.9842) for i in range(3)]
+        first = self.client.get(self.url, {'limit': 2}).json()
+        self.assertTrue(first['has_more'])
+        second = self.client.get(self.url, {'limit': 2, 'cursor': first['next_cursor']}).json()
+        self.assertFalse(second['has_more'])
+        ids = [ride['id'] for ride in first['rides'] + second['rides']]
+        self.assertEqual(ids, [b.id for b in bookings])
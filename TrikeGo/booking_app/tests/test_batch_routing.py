@@ -0,0 +1,144 @@
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from booking_app import utils
+from booking_app.services import RoutingService
+
+
+def _stop(idx, lat, lon):
+    return SimpleNamespace(
+        latitude=lat, longitude=lon, stop_type='PICKUP' if idx % 2 == 0 else 'DROPOFF',
+        booking_id=1, stop_uid=f'stop-{idx}',
+    )
+
+
+def _directions(coordinates, **kwargs):
+    # Two geometry points per leg, with the waypoints at the leg boundaries
+    geometry = []
+    way_points = []
+    for idx, coord in enumerate(coordinates):
+        if idx:
+            prev = coordinates[idx - 1]
+            geometry.append([(prev[0] + coord[0]) / 2, (prev[1] + coord[1]) / 2])
+        way_points.append(len(geometry))
+        geometry.append(coord)
+    segments = [{'distance': 1000.0, 'duration': 180.0} for _ in coordinates[1:]]
+    return {'features': [{
+        'geometry': {'coordinates': geometry},
+        'properties': {
+            'way_points': way_points,
+            'segments': segments,
+            'summary': {'distance': 1000.0 * len(segments), 'duration': 180.0 * len(segments)},
+        },
+    }]}
+
+
+class BatchRoutingTest(SimpleTestCase):
+    start = (14.5995, 120.9842)
+    stops = [_stop(0, 14.6010, 120.9842), _stop(1, 14.6100, 120.9900), _stop(2, 14.6200, 120.9950)]
+
+    def _service(self):
+        service = RoutingService()
+        service.breaker.reset()
+        patcher = mock.patch.object(service, 'client')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        service.client.directions.side_effect = _directions
+        return service
+
+    def test_multi_route_splits_geometry_into_legs(self):
+        service = self._service()
+        info = service.calculate_multi_route([(120.98, 14.59), (120.99, 14.60), (121.00, 14.61)])
+        self.assertEqual(len(info['legs']), 2)
+        self.assertEqual(info['legs'][1]['points'][0], [14.60, 120.99])
+        self.assertEqual(info['legs'][1]['points'][-1], [14.61, 121.00])
+        self.assertEqual(info['legs'][0]['duration'], 180.0)
+        self.assertEqual(info['distance'], 2.0)
+
+    def test_itinerary_polyline_uses_one_request(self):
+        service = self._service()
+        with mock.patch.object(utils, 'RoutingService', return_value=service), \
+                mock.patch.object(service, 'calculate_route') as per_leg:
+            polyline, precise, segments = utils._build_route_polyline(self.start, self.stops)
+        self.assertEqual(service.client.directions.call_count, 1)
+        per_leg.assert_not_called()
+        self.assertTrue(precise)
+        self.assertEqual(len(segments), 3)
+        self.assertEqual(segments[2]['durationSec'], 180.0)
+
+    def test_failed_batch_falls_back_per_leg(self):
+        service = self._service()
+        service.client.directions.side_effect = RuntimeError('rate limited')
+        with mock.patch.object(utils, 'RoutingService', return_value=service), \
+                mock.patch.object(service, 'calculate_route', return_value=None) as per_leg:
+            _, precise, segments = utils._build_route_polyline(self.start, self.stops)
+        self.assertEqual(per_leg.call_count, 3)
+        self.assertFalse(precise)
+        self.assertEqual(len(segments), 3)
+
+    def test_road_time_matrix_fills_unroutable_pairs(self):
+        points = [self.start, (14.6010, 120.9842)]
+        with mock.patch.object(RoutingService, 'duration_matrix', return_value=[[0.0, None], [95.0, 0.0]]):
+            matrix = utils.road_time_matrix(points)
+        self.assertEqual(matrix[1][0], 95.0)
+        # ~167 m at 20 km/h
+        self.assertAlmostEqual(matrix[0][1], 30.0, delta=1.0)
+
+
+def _slow_route(delays):
+    def calculate_route(start, end, profile='driving-car'):
+        time.sleep(delays.get(round(end[1], 4), 0))
+        return {
+            'distance': 1.0,
+            'duration': 120,
+            'route_data': {'features': [{'geometry': {'coordinates': [list(start), list(end)]}}]},
+        }
+    return calculate_route
+
+
+@override_settings(ORS_SEGMENT_WORKERS=4, ORS_SEGMENT_DEADLINE_SECONDS=0.5)
+class ConcurrentSegmentTest(SimpleTestCase):
+    start = BatchRoutingTest.start
+    stops = BatchRoutingTest.stops
+
+    def setUp(self):
+        self.addCleanup(self._drain)
+
+    def _drain(self):
+        # Let calls abandoned at the deadline finish so they do not hold workers for the next test
+        while utils._abandoned_segment_calls:
+            time.sleep(0.05)
+
+    def _build(self, delays):
+        service = RoutingService()
+        with mock.patch.object(service, 'calculate_multi_route', return_value=None), \
+                mock.patch.object(service, 'calculate_route', side_effect=_slow_route(delays)):
+            began = time.monotonic()
+            result = utils._build_route_polyline(self.start, self.stops)
+        return result, time.monotonic() - began
+
+    def test_legs_are_routed_in_parallel(self):
+        (_, precise, segments), elapsed = self._build({14.601: 0.2, 14.61: 0.2, 14.62: 0.2})
+        self.assertTrue(precise)
+        self.assertTrue(all(segment['precise'] for segment in segments))
+        self.assertLess(elapsed, 0.45)
+
+    def test_slow_leg_falls_back_at_deadline(self):
+        (_, _, segments), elapsed = self._build({14.62: 2.0})
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual([segment['precise'] for segment in segments], [True, True, False])
+        self.assertGreater(segments[2]['durationSec'], 0)
+        self.assertEqual([segment['abandoned'] for segment in segments], [False, False, True])
+
+    @override_settings(ORS_SEGMENT_WORKERS=2)
+    def test_abandoned_calls_do_not_starve_later_builds(self):
+        # Both workers are still stuck in the first build's calls
+        (_, _, segments), _ = self._build({14.601: 1.0, 14.61: 1.0, 14.62: 1.0})
+        self.assertEqual(sum(segment['abandoned'] for segment in segments), 3)
+
+        (_, _, segments), elapsed = self._build({})
+        self.assertLess(elapsed, 0.2)
+        self.assertTrue(all(segment['abandoned'] for segment in segments))
@@ -0,0 +1,88 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.test import SimpleTestCase
+
+from booking_app.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from booking_app.services import RoutingService
+
+
+def _boom():
+    raise RuntimeError('ORS down')
+
+
+def _bad_request():
+    raise ValueError('unroutable point')
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker('test', window_seconds=60, min_calls=3, failure_ratio=0.5,
+                                      slow_seconds=1, open_seconds=0.05)
+
+    def test_trips_on_error_rate_and_recovers_through_probe(self):
+        self.breaker.call(lambda: 'ok')
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                self.breaker.call(_boom)
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: 'ok')
+
+        time.sleep(0.06)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        # Only one probe at a time
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success(0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+        stats = self.breaker.stats()
+        self.assertEqual((stats['trips'], stats['recoveries'], stats['rejected']), (1, 1, 2))
+
+    def test_slow_calls_count_as_failures_and_failed_probe_reopens(self):
+        for _ in range(3):
+            self.breaker.record_success(2.0)
+        self.assertEqual(self.breaker.state, OPEN)
+        time.sleep(0.06)
+        with self.assertRaises(RuntimeError):
+            self.breaker.call(_boom)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_client_errors_do_not_trip(self):
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                self.breaker.call(_bad_request, is_client_error=lambda exc: isinstance(exc, ValueError))
+        self.assertEqual(self.breaker.state, CLOSED)
+
+
+class DegradedRoutingTest(SimpleTestCase):
+    start, end = (120.9842, 14.5995), (120.9900, 14.6050)
+
+    def setUp(self):
+        cache.clear()
+        caches['routes'].clear()
+        self.service = RoutingService()
+        breaker = CircuitBreaker('ors-test', min_calls=2, failure_ratio=0.5, open_seconds=60)
+        for target, value in (('breaker', breaker), ('client', mock.Mock())):
+            patcher = mock.patch.object(self.service, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.service.client.directions.side_effect = RuntimeError('503')
+
+    def test_open_breaker_serves_flagged_straight_line_estimates(self):
+        self.assertIsNone(self.service.calculate_route(self.start, self.end))
+        self.assertIsNone(self.service.calculate_route(self.start, self.end))
+        self.assertTrue(self.service.degraded)
+
+        calls = self.service.client.directions.call_count
+        route = self.service.calculate_route(self.start, self.end)
+        self.assertEqual(self.service.client.directions.call_count, calls)
+        self.assertTrue(route['degraded'])
+        self.assertAlmostEqual(route['distance'], 0.88, places=1)
+        # 20 km/h
+        self.assertAlmostEqual(route['duration'], route['distance'] / 20 * 3600, delta=20)
+        self.assertEqual(len(route['route_data']['features'][0]['geometry']['coordinates']), 2)
+        self.assertIsNone(self.service.duration_matrix([self.start, self.end]))
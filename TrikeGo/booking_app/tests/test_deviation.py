@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from booking_app import deviation
+from booking_app.deviation import RouteGeometry, check_deviation
+from booking_app.services import RoutingService
+
+# Straight east-west road with two vertices ~1.08 km apart
+LONG_SEGMENT = [[120.9800, 14.6000], [120.9900, 14.6000]]
+
+
+def _snapshot(pk, coords):
+    return SimpleNamespace(pk=pk, route_data={'features': [{'geometry': {'coordinates': coords}}]})
+
+
+class RouteGeometryTest(SimpleTestCase):
+    def test_distance_is_measured_to_segment_not_vertex(self):
+        geometry = RouteGeometry(LONG_SEGMENT)
+        # Midway between the vertices, ~22 m north of the road
+        match = geometry.locate(14.6002, 120.9850, radius_m=100)
+        self.assertIsNotNone(match)
+        self.assertAlmostEqual(match.distance_m, 22.2, delta=1.0)
+        self.assertAlmostEqual(match.along_m, geometry.length_m / 2, delta=5.0)
+
+    def test_far_point_is_not_matched(self):
+        geometry = RouteGeometry(LONG_SEGMENT)
+        self.assertIsNone(geometry.locate(14.6100, 120.9850, radius_m=100))
+
+    def test_hint_prefers_forward_progress_on_doubled_back_route(self):
+        # Out and back along the same street: segments 0 and 1 overlap
+        geometry = RouteGeometry([[120.9800, 14.6000], [120.9900, 14.6000], [120.9800, 14.6000]])
+        self.assertEqual(geometry.locate(14.6000, 120.9850, 50, hint=1).segment, 1)
+
+
+class CheckDeviationTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        deviation._geometry_cache.clear()
+
+    def test_progress_is_tracked_between_checks(self):
+        coords = [[120.9800 + i * 0.001, 14.6000] for i in range(30)]
+        snapshot = _snapshot(501, coords)
+        first = check_deviation(snapshot, 14.6000, 120.9825)
+        second = check_deviation(snapshot, 14.6000, 120.9905)
+        self.assertFalse(first.off_route)
+        self.assertEqual(first.segment, 2)
+        self.assertEqual(second.segment, 10)
+        self.assertEqual(cache.get('route_progress:501'), 10)
+        self.assertLess(second.remaining_m, first.remaining_m)
+
+    def test_should_reroute_uses_segment_distance(self):
+        service = RoutingService.__new__(RoutingService)
+        snapshot = _snapshot(502, LONG_SEGMENT)
+        on_road = SimpleNamespace(latitude=14.6002, longitude=120.9850)
+        off_road = SimpleNamespace(latitude=14.6030, longitude=120.9850)
+        # The vertex-only check used to flag this point as ~540 m off route
+        self.assertFalse(service.should_reroute(on_road, snapshot))
+        self.assertTrue(service.should_reroute(off_road, snapshot))
+        self.assertTrue(service.should_reroute(on_road, None))
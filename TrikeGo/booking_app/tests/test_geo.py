@@ -0,0 +1,61 @@
+import random
+from unittest import mock, skipIf
+
+from django.test import SimpleTestCase
+
+from booking_app import geo
+
+
+def _random_points(rng, count):
+    # Roughly Metro Manila / Cebu, plus a few far-away points
+    points = [(rng.uniform(10.0, 15.0), rng.uniform(120.0, 124.5)) for _ in range(count)]
+    points += [(-33.8688, 151.2093), (51.5074, -0.1278), (0.0, 0.0)]
+    return points
+
+
+class GeoKernelEquivalenceTest(SimpleTestCase):
+    def setUp(self):
+        self.rng = random.Random(327)
+
+    def test_haversine_known_distance(self):
+        # Manila -> Cebu City, ~570 km great-circle
+        self.assertAlmostEqual(geo.haversine_km(14.5995, 120.9842, 10.3157, 123.8854), 571.5, delta=1.0)
+        self.assertEqual(geo.haversine_km(14.5995, 120.9842, 14.5995, 120.9842), 0.0)
+
+    @skipIf(geo.np is None, 'numpy not installed')
+    def test_distances_to_many_numpy_matches_python(self):
+        origin = (14.5995, 120.9842)
+        points = _random_points(self.rng, 200)
+        fast = geo._distances_to_many_np(origin, points)
+        slow = geo._distances_to_many_py(origin, points)
+        self.assertEqual(len(fast), len(slow))
+        for a, b in zip(fast, slow):
+            self.assertAlmostEqual(a, b, places=6)
+
+    @skipIf(geo.np is None, 'numpy not installed')
+    def test_distance_matrix_numpy_matches_python(self):
+        points_a = _random_points(self.rng, 20)
+        points_b = _random_points(self.rng, 35)
+        fast = geo._distance_matrix_np(points_a, points_b)
+        slow = geo._distance_matrix_py(points_a, points_b)
+        self.assertEqual((len(fast), len(fast[0])), (len(points_a), len(points_b)))
+        for row_fast, row_slow in zip(fast, slow):
+            for a, b in zip(row_fast, row_slow):
+                self.assertAlmostEqual(a, b, places=6)
+
+    def test_public_api_without_numpy(self):
+        origin = (14.5995, 120.9842)
+        points = _random_points(self.rng, 50)
+        with_numpy = (geo.distances_to_many(origin, points), geo.nearest(origin, points))
+        with mock.patch.object(geo, 'np', None):
+            without = (geo.distances_to_many(origin, points), geo.nearest(origin, points))
+            self.assertEqual(geo.distance_matrix([origin], points)[0], without[0])
+        for a, b in zip(with_numpy[0], without[0]):
+            self.assertAlmostEqual(a, b, places=6)
+        self.assertEqual(with_numpy[1][0], without[1][0])
+
+    def test_empty_inputs(self):
+        self.assertEqual(geo.distances_to_many((0.0, 0.0), []), [])
+        self.assertEqual(geo.distance_matrix([], [(0.0, 0.0)]), [])
+        self.assertEqual(geo.distance_matrix([(0.0, 0.0)], []), [[]])
+        self.assertIsNone(geo.nearest((0.0, 0.0), []))
@@ -0,0 +1,104 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from booking_app import geocoding
+from booking_app.models import Booking
+from booking_app.services import RoutingService
+
+User = get_user_model()
+
+SM_CEBU = {'formatted': 'SM City Cebu, Cebu City, Philippines', 'name': 'SM City Cebu', 'lat': 10.3114, 'lon': 123.9180}
+
+
+class PrefixIndexTest(TestCase):
+    def test_prefix_search_matches_label_and_name_once(self):
+        index = geocoding.PrefixIndex(max_entries=10)
+        index.add(SM_CEBU)
+        index.add({'formatted': 'Ayala Center Cebu', 'name': 'Ayala Center', 'lat': 10.318, 'lon': 123.905})
+
+        self.assertEqual([p['name'] for p in index.search('sm  CITY')], ['SM City Cebu'])
+        self.assertEqual([p['name'] for p in index.search('ayala')], ['Ayala Center'])
+        self.assertEqual(index.search('cebu'), [])
+
+    def test_oldest_places_are_evicted(self):
+        index = geocoding.PrefixIndex(max_entries=2)
+        for i in range(3):
+            index.add({'formatted': f'Place {i}', 'name': f'Place {i}', 'lat': 10.0 + i, 'lon': 123.0})
+        self.assertEqual(len(index), 2)
+        self.assertEqual([p['formatted'] for p in index.search('place')], ['Place 1', 'Place 2'])
+
+
+@override_settings(GEOCODE_LOCAL_MIN_RESULTS=1, GEOCODE_UPSTREAM_PER_MINUTE=2)
+class GeocodingCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        geocoding.place_index.clear()
+        self.service = RoutingService()
+        patcher = mock.patch.object(self.service, 'geocode_address', return_value=[SM_CEBU])
+        self.geocode_address = patcher.start()
+        self.addCleanup(patcher.stop)
+        reverse_patcher = mock.patch.object(self.service, 'reverse_geocode', return_value=dict(SM_CEBU))
+        self.reverse_geocode = reverse_patcher.start()
+        self.addCleanup(reverse_patcher.stop)
+
+    def test_normalised_queries_share_one_upstream_call(self):
+        first, source = geocoding.geocode('SM City,  Cebu')
+        second, second_source = geocoding.geocode('sm city cebu')
+
+        self.assertEqual((source, second_source), ('upstream', 'cache'))
+        self.assertEqual(first, second)
+        self.assertEqual(self.geocode_address.call_count, 1)
+
+    def test_resolved_places_answer_later_prefixes_locally(self):
+        geocoding.autocomplete('sm city cebu')
+        places, source = geocoding.autocomplete('SM Ci')
+
+        self.assertEqual(source, 'local')
+        self.assertEqual(places[0]['name'], 'SM City Cebu')
+        self.assertEqual(self.geocode_address.call_count, 1)
+
+    def test_past_booking_addresses_seed_the_index(self):
+        passenger = User.objects.create_user(username='pax', password='p', trikego_user='P')
+        Booking.objects.create(
+            passenger=passenger, pickup_address='Colon Street, Cebu City', destination_address='IT Park',
+            pickup_latitude=10.2965, pickup_longitude=123.9010,
+            destination_latitude=10.3297, destination_longitude=123.9066,
+        )
+        geocoding.place_index.clear()
+        geocoding.seed_index(force=True)
+
+        places, source = geocoding.autocomplete('colon st')
+        self.assertEqual(source, 'local')
+        self.assertEqual(places[0]['formatted'], 'Colon Street, Cebu City')
+        self.geocode_address.assert_not_called()
+
+    @mock.patch('booking_app.geocoding.time.time', return_value=600.0)
+    def test_upstream_quota_is_shared(self, _time):
+        for query in ('alpha place', 'bravo place'):
+            geocoding.geocode(query)
+        places, source = geocoding.geocode('charlie place')
+
+        self.assertEqual((places, source), ([], 'quota'))
+        self.assertEqual(self.geocode_address.call_count, 2)
+
+    def test_reverse_lookups_share_a_rounded_bucket(self):
+        geocoding.reverse(10.31141, 123.91801)
+        place = geocoding.reverse(10.31139, 123.91799)
+
+        self.assertEqual(place['formatted'], SM_CEBU['formatted'])
+        self.assertEqual(place['lat'], 10.31139)
+        self.assertEqual(self.reverse_geocode.call_count, 1)
+
+    def test_autocomplete_endpoint_returns_ors_shaped_features(self):
+        user = User.objects.create_user(username='pax2', password='p', trikego_user='P')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('booking:geocode_autocomplete'), {'text': 'SM City'})
+        self.assertEqual(response.status_code, 200)
+        feature = response.json()['features'][0]
+        self.assertEqual(feature['geometry']['coordinates'], [SM_CEBU['lon'], SM_CEBU['lat']])
+        self.assertEqual(feature['properties']['label'], SM_CEBU['formatted'])
@@ -0,0 +1,92 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from booking_app import itinerary_geometry, polyline
+
+User = get_user_model()
+
+# Two legs along streets with redundant midpoints; the second turns a corner
+LEG_ONE = [[14.6000, 120.9800], [14.6000, 120.9810], [14.6000, 120.9820], [14.6000, 120.9830]]
+LEG_TWO = [[14.6000, 120.9830], [14.6025, 120.9830], [14.6050, 120.9830], [14.6050, 120.9850]]
+
+
+def _itinerary():
+    return {
+        'stops': [{'coordinates': [14.6000, 120.9830]}, {'coordinates': [14.6050, 120.9850]}],
+        'driverStartCoordinate': [14.6000, 120.9800],
+        'fullRoutePolyline': LEG_ONE + LEG_TWO[1:],
+        'fullRouteIsPrecise': True,
+        'fullRouteSegments': [
+            {'type': 'PICKUP', 'points': LEG_ONE, 'stopId': 'a', 'distanceKm': 0.33, 'durationSec': 60.0},
+            {'type': 'DROPOFF', 'points': LEG_TWO, 'stopId': 'b', 'distanceKm': 0.77, 'durationSec': 120.0},
+        ],
+    }
+
+
+class ShapeItineraryTest(SimpleTestCase):
+    def test_defaults_leave_the_payload_alone(self):
+        itinerary = _itinerary()
+        self.assertIs(itinerary_geometry.shape_itinerary(itinerary), itinerary)
+
+    def test_simplification_keeps_stops(self):
+        shaped = itinerary_geometry.shape_itinerary(_itinerary(), tolerance_m=5)
+        self.assertEqual(shaped['fullRoutePolyline'], [LEG_ONE[0], LEG_ONE[-1], LEG_TWO[2], LEG_TWO[-1]])
+        self.assertEqual(shaped['fullRouteSegments'][0]['points'], [LEG_ONE[0], LEG_ONE[-1]])
+        self.assertEqual(shaped['fullRouteSegments'][1]['points'], [LEG_TWO[0], LEG_TWO[2], LEG_TWO[-1]])
+
+    def test_segment_refs_index_into_the_encoded_line(self):
+        shaped = itinerary_geometry.shape_itinerary(_itinerary(), 5, geometry='polyline', segments='ref')
+        line = [list(p) for p in polyline.decode(shaped['fullRoutePolyline'], shaped['polylinePrecision'])]
+        self.assertEqual(len(line), 4)
+        legs = shaped['fullRouteSegments']
+        self.assertNotIn('points', legs[0])
+        self.assertEqual([leg['pointRange'] for leg in legs], [[0, 1], [1, 3]])
+        first, last = legs[1]['pointRange']
+        self.assertEqual(line[first:last + 1], [LEG_TWO[0], LEG_TWO[2], LEG_TWO[-1]])
+        self.assertEqual(legs[1]['distanceKm'], 0.77)
+
+    def test_zoom_tolerance_shrinks_as_the_map_zooms_in(self):
+        far = itinerary_geometry.tolerance_from_params(zoom=12, latitude=14.6)
+        near = itinerary_geometry.tolerance_from_params(zoom=17, latitude=14.6)
+        self.assertAlmostEqual(far / near, 32, places=3)
+        self.assertEqual(itinerary_geometry.tolerance_from_params(tolerance='8', zoom=12), 8.0)
+        self.assertEqual(itinerary_geometry.tolerance_from_params(), 0.0)
+
+
+class DriverItineraryGeometryParamsTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+        self.client.force_login(self.driver)
+        self.url = reverse('booking:driver_itinerary')
+        patcher = mock.patch(
+            'booking_app.itinerary_stream.build_itinerary_payload',
+            side_effect=lambda user: {'status': 'success', 'driverStatus': 'In_trip', 'itinerary': _itinerary()},
+        )
+        self.build = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_compact_request(self):
+        data = self.client.get(self.url, {'geometry': 'polyline', 'segments': 'ref', 'tolerance': '5'}).json()
+        itinerary = data['itinerary']
+        self.assertIsInstance(itinerary['fullRoutePolyline'], str)
+        self.assertEqual(itinerary['fullRouteSegments'][1]['pointRange'], [1, 3])
+        self.assertEqual(itinerary['segmentMode'], 'ref')
+
+    def test_plain_request_is_unchanged(self):
+        itinerary = self.client.get(self.url).json()['itinerary']
+        self.assertEqual(itinerary['fullRoutePolyline'], LEG_ONE + LEG_TWO[1:])
+        self.assertNotIn('geometryFormat', itinerary)
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get(self.url, {'geometry': 'wkt'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'segments': 'nested'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'zoom': 'far'}).status_code, 400)
+
+    def test_bad_numbers_are_rejected_before_building(self):
+        self.build.side_effect = lambda user: {'status': 'success', 'driverStatus': 'Online', 'itinerary': None}
+        self.assertEqual(self.client.get(self.url, {'tolerance': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'zoom': 'nan'}).status_code, 400)
+        self.build.assert_not_called()
@@ -0,0 +1,84 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from booking_app import itinerary_state, locations, sequencing
+from booking_app.models import Booking, BookingStop
+from booking_app.services import RoutingService
+from booking_app.utils import build_driver_itinerary, ensure_booking_stops, plan_driver_stops
+
+User = get_user_model()
+
+
+def _fake_route(start, end, profile='driving-car'):
+    return {
+        'distance': 1.0,
+        'duration': 120,
+        'route_data': {'features': [{'geometry': {'coordinates': [list(start), list(end)]}}]},
+    }
+
+
+class IncrementalItineraryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+        locations.record_location(self.driver.id, 14.5995, 120.9842)
+        self.first = self._accept(14.6010)
+        self.second = self._accept(14.6050)
+
+    def _accept(self, lat):
+        passenger = User.objects.create_user(username=f'pax{lat}', password='p', trikego_user='P')
+        booking = Booking.objects.create(
+            passenger=passenger, driver=self.driver, status='accepted',
+            pickup_address='A', destination_address='B',
+            pickup_latitude=lat, pickup_longitude=120.9842,
+            destination_latitude=lat + 0.01, destination_longitude=120.9900,
+        )
+        ensure_booking_stops(booking)
+        return booking
+
+    def _cached_stop_ids(self):
+        return [stop_id for stop_id, _ in itinerary_state.get_order(self.driver.id)]
+
+    def test_new_booking_is_inserted_into_cached_order(self):
+        before = self._cached_stop_ids()
+        self.assertEqual(len(before), 4)
+
+        with mock.patch.object(sequencing, 'solve', wraps=sequencing.solve) as solve:
+            third = self._accept(14.6030)
+            order = plan_driver_stops(self.driver, persist=False)
+        solve.assert_not_called()
+
+        after = self._cached_stop_ids()
+        self.assertEqual([s.id for s in order], after)
+        self.assertEqual([stop_id for stop_id in after if stop_id in before], before)
+        new_ids = set(BookingStop.objects.filter(booking=third).values_list('id', flat=True))
+        self.assertEqual(set(after) - set(before), new_ids)
+
+    def test_completed_and_cancelled_stops_leave_the_order(self):
+        pickup = BookingStop.objects.get(booking=self.first, stop_type='PICKUP')
+        itinerary_state.pop_stop(self.driver.id, pickup.id)
+        self.assertNotIn(pickup.id, self._cached_stop_ids())
+
+        self.second.status = 'pending'
+        self.second.driver = None
+        self.second.save()
+        remaining = itinerary_state.get_order(self.driver.id)
+        self.assertEqual({booking_id for _, booking_id in remaining}, {self.first.id})
+
+    @mock.patch.object(RoutingService, 'calculate_multi_route', return_value=None)
+    @mock.patch.object(RoutingService, 'calculate_route', side_effect=_fake_route)
+    def test_stop_to_stop_legs_are_routed_once(self, calculate_route, calculate_multi_route):
+        build_driver_itinerary(self.driver)
+        self.assertEqual(calculate_route.call_count, 4)
+
+        calculate_route.reset_mock()
+        build_driver_itinerary(self.driver)
+        calculate_route.assert_not_called()
+
+        # Only the driver's own leg changes when they move
+        locations.record_location(self.driver.id, 14.5990, 120.9842)
+        build_driver_itinerary(self.driver)
+        self.assertEqual(calculate_route.call_count, 1)
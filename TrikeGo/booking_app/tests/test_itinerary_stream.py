@@ -0,0 +1,97 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from booking_app import itinerary_stream, locations
+from booking_app.models import Booking
+from booking_app.services import RoutingService
+
+User = get_user_model()
+
+
+@override_settings(ITINERARY_PUSH_DEBOUNCE_SECONDS=0, ITINERARY_RECOMPUTE_MOVE_METERS=150)
+class ItineraryStreamTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+        self.passenger = User.objects.create_user(username='pax', password='p', trikego_user='P')
+        locations.record_location(self.driver.id, 14.5995, 120.9842)
+        # Keep ORS (and the breaker state the payload reports) out of the diffs
+        service = RoutingService()
+        service.breaker.reset()
+        for name in ('calculate_route', 'calculate_multi_route'):
+            patcher = mock.patch.object(service, name, return_value=None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _book(self):
+        return Booking.objects.create(
+            passenger=self.passenger, driver=self.driver, status='accepted',
+            pickup_address='A', destination_address='B',
+            pickup_latitude=14.6010, pickup_longitude=120.9842,
+            destination_latitude=14.6100, destination_longitude=120.9900,
+        )
+
+    def test_diff_reports_changed_and_removed_keys(self):
+        diff = itinerary_stream.itinerary_diff(
+            {'stops': [1], 'totalStops': 1, 'old': True},
+            {'stops': [1], 'totalStops': 2},
+        )
+        self.assertEqual(diff, {'changed': {'totalStops': 2}, 'removed': ['old']})
+
+    @mock.patch.object(itinerary_stream, 'build_itinerary_payload')
+    def test_nothing_rebuilt_without_listeners(self, build):
+        self.assertFalse(itinerary_stream.mark_itinerary_dirty(self.driver.id))
+        self.assertIsNone(itinerary_stream.push_itinerary(self.driver.id))
+        build.assert_not_called()
+
+    @mock.patch.object(itinerary_stream, 'build_itinerary_payload')
+    def test_lost_disconnect_stops_counting_once_the_heartbeat_lapses(self, build):
+        itinerary_stream.add_listener(self.driver.id, 'chan-1')
+        itinerary_stream.add_listener(self.driver.id, 'chan-2')
+        itinerary_stream.remove_listener(self.driver.id, 'chan-2')
+        self.assertTrue(itinerary_stream.has_listeners(self.driver.id))
+
+        # chan-1's worker died: nothing refreshes its key until it expires
+        cache.delete(itinerary_stream._listener_key(self.driver.id, 'chan-1'))
+        self.assertFalse(itinerary_stream.has_listeners(self.driver.id))
+        self.assertFalse(itinerary_stream.mark_itinerary_dirty(self.driver.id))
+        build.assert_not_called()
+
+        itinerary_stream.add_listener(self.driver.id, 'chan-3')
+        self.assertTrue(itinerary_stream.has_listeners(self.driver.id))
+
+    @mock.patch.object(itinerary_stream.realtime, 'group_send')
+    def test_booking_changes_push_diffs(self, group_send):
+        itinerary_stream.add_listener(self.driver.id, 'chan-1')
+        itinerary_stream.publish_snapshot(self.driver, itinerary_stream.build_itinerary_payload(self.driver))
+        self.assertEqual(group_send.call_args[0][1]['data']['kind'], 'snapshot')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._book()
+        message = group_send.call_args[0][1]['data']
+        self.assertEqual(message['kind'], 'diff')
+        self.assertEqual(message['changed']['totalBookings'], 1)
+        self.assertEqual(len(message['changed']['stops']), 2)
+        self.assertEqual(group_send.call_args[0][0], f'driver_itinerary_{self.driver.id}')
+
+        # A rebuild with nothing new sends nothing
+        calls = group_send.call_count
+        self.assertIsNone(itinerary_stream.push_itinerary(self.driver.id))
+        self.assertEqual(group_send.call_count, calls)
+
+    @mock.patch.object(itinerary_stream, 'mark_itinerary_dirty', return_value=True)
+    def test_small_moves_do_not_trigger_rebuild(self, mark_dirty):
+        itinerary_stream.add_listener(self.driver.id, 'chan-1')
+        itinerary_stream.build_itinerary_payload(self.driver)
+
+        near = locations.record_location(self.driver.id, 14.6000, 120.9842)
+        self.assertFalse(itinerary_stream.on_driver_moved(self.driver.id, near))
+        far = locations.record_location(self.driver.id, 14.6030, 120.9842)
+        self.assertTrue(itinerary_stream.on_driver_moved(self.driver.id, far))
+        mark_dirty.assert_called_once_with(self.driver.id)
+
+        itinerary_stream.remove_listener(self.driver.id, 'chan-1')
+        self.assertFalse(itinerary_stream.has_listeners(self.driver.id))
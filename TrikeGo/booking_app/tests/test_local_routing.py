@@ -0,0 +1,137 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from booking_app.management.commands.build_road_graph import _speed
+from booking_app.road_graph import RoadGraph
+from booking_app.routing_backends import LocalGraphBackend, OutOfCoverage
+from booking_app.services import RoutingService
+
+
+def _grid_graph():
+    """3x3 grid ~110 m apart; the middle row is a slow street."""
+    nodes = [(14.600 + 0.001 * r, 120.980 + 0.001 * c) for r in range(3) for c in range(3)]
+    edges = []
+    for r in range(3):
+        for c in range(3):
+            node = r * 3 + c
+            for dr, dc in ((0, 1), (1, 0)):
+                rr, cc = r + dr, c + dc
+                if rr < 3 and cc < 3:
+                    other = rr * 3 + cc
+                    slow = r == 1 and dr == 0
+                    seconds = 100.0 if slow else 10.0
+                    edges.append((node, other, 110.0, seconds))
+                    edges.append((other, node, 110.0, seconds))
+    return RoadGraph.from_edges(nodes, edges)
+
+
+OSM_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="14.6000" lon="120.9800"/>
+  <node id="2" lat="14.6000" lon="120.9810"/>
+  <node id="3" lat="14.6010" lon="120.9810"/>
+  <node id="4" lat="14.6010" lon="120.9820"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/></way>
+  <way id="11"><nd ref="3"/><nd ref="4"/><tag k="highway" v="tertiary"/><tag k="oneway" v="yes"/></way>
+  <way id="12"><nd ref="1"/><nd ref="4"/><tag k="highway" v="footway"/></way>
+</osm>
+"""
+
+
+class RoadGraphTest(SimpleTestCase):
+    def test_csr_layout_and_astar_avoid_the_slow_street(self):
+        graph = _grid_graph()
+        self.assertEqual(graph.node_count, 9)
+        self.assertEqual(graph.offsets[-1], graph.edge_count)
+
+        nodes, seconds, metres = graph.shortest_path(3, 5)
+        self.assertNotIn(4, nodes[1:-1])
+        self.assertEqual(seconds, 40.0)
+        self.assertEqual(metres, 440.0)
+
+    def test_nearest_snaps_to_the_closest_node(self):
+        node, metres = _grid_graph().nearest(14.6011, 120.9809)
+        self.assertEqual(node, 4)
+        self.assertLess(metres, 20)
+
+    def test_save_and_load_round_trip(self):
+        graph = _grid_graph()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph.json.gz')
+            graph.save(path)
+            loaded = RoadGraph.load(path)
+        self.assertEqual(list(loaded.targets), list(graph.targets))
+        self.assertEqual(loaded.shortest_path(0, 8)[1], graph.shortest_path(0, 8)[1])
+
+
+class LocalBackendTest(SimpleTestCase):
+    def setUp(self):
+        caches['routes'].clear()
+        self.addCleanup(caches['routes'].clear)
+        self.backend = LocalGraphBackend(_grid_graph(), max_snap_m=100)
+        self.service = RoutingService()
+        patcher = mock.patch.object(self.service, 'backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_calculate_route_uses_the_local_graph(self):
+        with mock.patch.object(self.service, 'client') as client:
+            route = self.service.calculate_route((120.980, 14.600), (120.982, 14.602))
+        client.directions.assert_not_called()
+        self.assertEqual(route['duration'], 40)
+        self.assertEqual(route['distance'], 0.44)
+        self.assertEqual(route['route_data']['features'][0]['geometry']['coordinates'][0], [120.980, 14.600])
+
+    def test_multi_route_legs_split_on_way_points(self):
+        result = self.service.calculate_multi_route([(120.980, 14.600), (120.982, 14.600), (120.982, 14.602)])
+        self.assertEqual(len(result['legs']), 2)
+        self.assertEqual(result['legs'][0]['points'][-1], result['legs'][1]['points'][0])
+        self.assertEqual(result['duration'], 40)
+
+    def test_duration_matrix(self):
+        matrix = self.service.duration_matrix([(120.980, 14.600), (120.982, 14.602)])
+        self.assertEqual(matrix[0][0], 0.0)
+        self.assertEqual(matrix[0][1], 40.0)
+
+        travel = self.service.travel_matrix([(120.980, 14.600), (120.982, 14.602)])
+        self.assertEqual(travel['distances'][0][1], 0.44)
+
+    def test_points_outside_the_graph_fall_back(self):
+        with self.assertRaises(OutOfCoverage):
+            self.backend.directions([(121.5, 15.0), (120.980, 14.600)])
+
+        fallback = mock.Mock()
+        fallback.directions.return_value = {'fallback': True}
+        backend = LocalGraphBackend(_grid_graph(), max_snap_m=100, fallback=fallback)
+        self.assertEqual(backend.directions([(121.5, 15.0), (120.980, 14.600)]), {'fallback': True})
+
+
+class BuildRoadGraphCommandTest(SimpleTestCase):
+    def test_builds_routable_graph_from_osm_xml(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'area.osm')
+            output = os.path.join(tmp, 'graph.json')
+            with open(source, 'w') as fh:
+                fh.write(OSM_XML)
+            call_command('build_road_graph', source, output, stdout=StringIO())
+            graph = RoadGraph.load(output)
+
+        # Footway skipped; residential both ways (2 x 2) plus the one-way tertiary
+        self.assertEqual(graph.node_count, 4)
+        self.assertEqual(graph.edge_count, 5)
+        self.assertIsNotNone(graph.shortest_path(0, 3))
+        self.assertIsNone(graph.shortest_path(3, 0))
+
+    def test_maxspeed_parsing(self):
+        self.assertEqual(_speed({'highway': 'residential', 'maxspeed': '30'}), 30)
+        self.assertAlmostEqual(_speed({'highway': 'residential', 'maxspeed': '15 mph'}), 24.135)
+        self.assertEqual(_speed({'highway': 'primary', 'maxspeed': '60 mph'}), 40)
+        # Zero or unparseable limits fall back to the highway default
+        self.assertEqual(_speed({'highway': 'residential', 'maxspeed': '0'}), 20)
+        self.assertEqual(_speed({'highway': 'residential', 'maxspeed': 'signals'}), 20)
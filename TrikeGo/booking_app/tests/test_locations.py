@@ -0,0 +1,84 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from booking_app import locations
+from booking_app.models import DriverLocation
+from booking_app.spatial import CellSets
+
+User = get_user_model()
+
+
+@override_settings(DRIVER_LOCATION_WRITE_BEHIND=True)
+class WriteBehindLocationStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+
+    def test_pings_are_buffered_until_flush(self):
+        locations.record_location(self.driver.id, 14.5995, 120.9842)
+        locations.record_location(self.driver.id, 14.6000, 120.9850, heading=90, speed=20)
+        self.assertFalse(DriverLocation.objects.filter(driver=self.driver).exists())
+        self.assertEqual(locations.get_coordinates(self.driver.id), (14.6000, 120.9850))
+
+        self.assertEqual(locations.flush_locations(), 1)
+        row = DriverLocation.objects.get(driver=self.driver)
+        self.assertAlmostEqual(float(row.latitude), 14.6000)
+        self.assertAlmostEqual(float(row.heading), 90.0)
+
+        # Nothing changed since the last flush
+        self.assertEqual(locations.flush_locations(), 0)
+        locations.record_location(self.driver.id, 14.6010, 120.9850)
+        self.assertEqual(locations.flush_locations(), 1)
+        self.assertAlmostEqual(float(DriverLocation.objects.get(driver=self.driver).latitude), 14.6010)
+
+    def test_reads_fall_back_to_database(self):
+        DriverLocation.objects.create(driver=self.driver, latitude=14.5995, longitude=120.9842)
+        other = User.objects.create_user(username='drv2', password='p', trikego_user='D')
+        fixes = locations.get_locations([self.driver.id, other.id])
+        self.assertEqual(list(fixes), [self.driver.id])
+        self.assertEqual(fixes[self.driver.id].latitude, 14.5995)
+
+    def test_bulk_read_uses_one_cache_round_trip(self):
+        other = User.objects.create_user(username='drv2', password='p', trikego_user='D')
+        locations.record_location(self.driver.id, 14.5995, 120.9842)
+        locations.record_location(other.id, 14.6100, 120.9900)
+        with self.assertNumQueries(0):
+            fixes = locations.get_locations([self.driver.id, other.id])
+        self.assertEqual(fixes[other.id].longitude, 120.9900)
+
+    def test_clear_location_forgets_driver(self):
+        locations.record_location(self.driver.id, 14.5995, 120.9842)
+        locations.flush_locations()
+        locations.clear_location(self.driver.id)
+        self.assertIsNone(locations.get_location(self.driver.id))
+        self.assertEqual(locations.flush_locations(), 0)
+
+    def test_registry_uses_atomic_set_commands_on_redis(self):
+        client = mock.Mock()
+        with mock.patch.object(CellSets, '_redis', return_value=client):
+            locations.record_location(self.driver.id, 14.5995, 120.9842)
+            client.pipeline.return_value.execute.return_value = [{str(self.driver.id).encode()}]
+            cache.delete(locations._entry_key(self.driver.id))
+            locations.flush_locations()
+        registry = cache.make_key(locations.REGISTRY_KEY)
+        client.sadd.assert_called_once_with(registry, str(self.driver.id))
+        client.srem.assert_called_once_with(registry, str(self.driver.id))
+
+    def test_fix_is_written_through_when_the_cache_drops_it(self):
+        # django-redis with IGNORE_EXCEPTIONS returns None instead of raising
+        with mock.patch.object(locations, '_cache_reports_writes', return_value=True), \
+                mock.patch.object(cache, 'set', return_value=None):
+            locations.record_location(self.driver.id, 14.5995, 120.9842)
+        self.assertAlmostEqual(float(DriverLocation.objects.get(driver=self.driver).latitude), 14.5995)
+
+
+@override_settings(DRIVER_LOCATION_WRITE_BEHIND=False)
+class WriteThroughLocationStoreTest(TestCase):
+    def test_fix_is_written_immediately(self):
+        cache.clear()
+        driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+        locations.record_location(driver.id, 14.5995, 120.9842)
+        self.assertTrue(DriverLocation.objects.filter(driver=driver).exists())
@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from booking_app import locations, realtime
+from booking_app.consumers import BookingTrackingConsumer
+from booking_app.models import Booking
+
+User = get_user_model()
+
+
+@override_settings(TRACKING_MIN_MOVE_METERS=5)
+class TrackingPublishTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+        self.passenger = User.objects.create_user(username='pax', password='p', trikego_user='P')
+        self.booking = Booking.objects.create(
+            passenger=self.passenger, driver=self.driver, status='accepted',
+            pickup_address='A', destination_address='B',
+            pickup_latitude=14.6010, pickup_longitude=120.9842,
+            destination_latitude=14.6100, destination_longitude=120.9900,
+        )
+        locations.record_location(self.driver.id, 14.5995, 120.9842)
+
+    @mock.patch.object(realtime, 'group_send')
+    def test_only_changes_are_pushed(self, group_send):
+        first = realtime.publish_tracking(self.booking)
+        self.assertEqual(first['booking_status'], 'accepted')
+        self.assertEqual(first['driver_lat'], 14.5995)
+
+        # Nothing changed, and a 1 m GPS wobble is below the move threshold
+        self.assertIsNone(realtime.publish_tracking(self.booking))
+        wobble = locations.record_location(self.driver.id, 14.59951, 120.9842)
+        self.assertEqual(realtime.publish_driver_position(self.driver.id, wobble), 0)
+
+        moved = locations.record_location(self.driver.id, 14.6005, 120.9842)
+        realtime.publish_driver_position(self.driver.id, moved)
+        delta = group_send.call_args[0][1]['data']
+        self.assertEqual(set(delta), {'booking_id', 'driver_lat', 'driver_lon'})
+
+        self.booking.status = 'on_the_way'
+        delta = realtime.publish_tracking(self.booking)
+        self.assertEqual(set(delta), {'booking_id', 'booking_status'})
+        self.assertEqual(group_send.call_count, 3)
+        self.assertEqual(group_send.call_args[0][0], f'booking_track_{self.booking.id}')
+
+    def test_consumer_snapshot_limited_to_participants(self):
+        consumer = BookingTrackingConsumer()
+        consumer.booking_id = self.booking.id
+        snapshot = consumer._snapshot_for(self.passenger.id)
+        self.assertEqual(snapshot['driver_lon'], 120.9842)
+        stranger = User.objects.create_user(username='other', password='p', trikego_user='P')
+        self.assertIsNone(consumer._snapshot_for(stranger.id))
@@ -0,0 +1,55 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from booking_app import locations, tasks
+from booking_app.models import Booking, DriverLocation
+
+User = get_user_model()
+
+
+@override_settings(REROUTE_DEBOUNCE_SECONDS=5)
+class ReroutePipelineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+        self.passenger = User.objects.create_user(username='pax', password='p', trikego_user='P')
+        self.booking = Booking.objects.create(
+            passenger=self.passenger, driver=self.driver, status='accepted',
+            pickup_address='A', destination_address='B',
+            pickup_latitude=14.6010, pickup_longitude=120.9842,
+            destination_latitude=14.6100, destination_longitude=120.9900,
+        )
+
+    def test_pings_in_window_are_coalesced(self):
+        with mock.patch.object(tasks.reroute_booking, 'apply_async') as apply_async:
+            self.assertTrue(tasks.schedule_reroute(self.booking.id))
+            self.assertFalse(tasks.schedule_reroute(self.booking.id))
+            self.assertFalse(tasks.schedule_reroute(self.booking.id))
+        apply_async.assert_called_once_with(args=[self.booking.id], countdown=5)
+
+    def test_location_ping_only_enqueues(self):
+        self.client.force_login(self.driver)
+        with mock.patch('booking_app.api_views.check_and_reroute') as check, \
+                mock.patch.object(tasks.reroute_booking, 'apply_async') as apply_async:
+            for lat in (14.5995, 14.5996, 14.5997):
+                response = self.client.post(
+                    reverse('booking:update_driver_location'),
+                    {'latitude': lat, 'longitude': 120.9842},
+                    content_type='application/json',
+                )
+                self.assertEqual(response.status_code, 200)
+        check.assert_not_called()
+        self.assertEqual(apply_async.call_count, 1)
+        self.assertEqual(locations.get_location(self.driver.id).latitude, 14.5997)
+
+    def test_task_uses_latest_location(self):
+        DriverLocation.objects.create(driver=self.driver, latitude=14.5995, longitude=120.9842)
+        with mock.patch('booking_app.api_views.check_and_reroute') as check:
+            self.assertTrue(tasks.reroute_booking(self.booking.id))
+        booking, location = check.call_args[0]
+        self.assertEqual(booking.id, self.booking.id)
+        self.assertEqual(float(location.latitude), 14.5995)
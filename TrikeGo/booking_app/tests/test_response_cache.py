@@ -0,0 +1,162 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from booking_app import cache_versions, locations
+from booking_app.models import Booking
+from booking_app.services import RoutingService
+from booking_app.utils import ensure_booking_stops
+from user_app.models import Passenger
+
+User = get_user_model()
+
+ROUTED = {'route_data': {'features': []}, 'distance': 1.2, 'duration': 300, 'too_close': False}
+
+
+@override_settings(RESPONSE_CACHE_TTL=120)
+class RouteInfoETagTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.passenger = User.objects.create_user(username='pax', password='p', trikego_user='P')
+        Passenger.objects.create(user=self.passenger)
+        self.booking = Booking.objects.create(
+            passenger=self.passenger, pickup_address='A', destination_address='B',
+            pickup_latitude=14.6010, pickup_longitude=120.9842,
+            destination_latitude=14.6100, destination_longitude=120.9900,
+        )
+        # Stops normally exist before anyone polls; creating them bumps the version
+        ensure_booking_stops(self.booking)
+        self.url = reverse('user:get_route_info', args=[self.booking.id])
+        self.client.force_login(self.passenger)
+        patcher = mock.patch.object(RoutingService(), 'calculate_route', return_value=ROUTED)
+        self.calculate_route = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unchanged_poll_is_a_304_without_rebuilding(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        self.assertFalse([q for q in ctx.captured_queries if 'booking_app_booking' in q['sql']])
+        self.assertEqual(self.calculate_route.call_count, 1)
+
+        # Without the header the cached body is served
+        third = self.client.get(self.url)
+        self.assertEqual(third.json(), first.json())
+        self.assertEqual(self.calculate_route.call_count, 1)
+
+    def test_state_change_bumps_the_version(self):
+        etag = self.client.get(self.url)['ETag']
+        self.booking.status = 'cancelled'
+        self.booking.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['booking_status'], 'cancelled')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_other_users_do_not_get_the_cached_body(self):
+        self.client.get(self.url)
+        stranger = User.objects.create_user(username='other', password='p', trikego_user='P')
+        Passenger.objects.create(user=stranger)
+        self.client.force_login(stranger)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class DriverItineraryETagTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+        locations.record_location(self.driver.id, 14.5995, 120.9842)
+        self.client.force_login(self.driver)
+        self.url = reverse('booking:driver_itinerary')
+
+    def test_304_until_the_driver_version_moves(self):
+        with mock.patch('booking_app.itinerary_stream.build_itinerary_payload', wraps=lambda user: {
+            'status': 'success', 'driverStatus': 'Online', 'itinerary': {'stops': []},
+        }) as build:
+            etag = self.client.get(self.url)['ETag']
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            # Shape parameters are cached separately
+            self.assertEqual(self.client.get(self.url, {'geometry': 'polyline'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+            self.assertEqual(build.call_count, 2)
+
+            cache_versions.bump_driver(self.driver.id)
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(build.call_count, 3)
+
+    def test_evicted_counter_starts_from_the_clock(self):
+        first = cache_versions.current_version(cache_versions.DRIVER, self.driver.id)
+        cache.delete(cache_versions.version_key(cache_versions.DRIVER, self.driver.id))
+        cache_versions.bump_driver(self.driver.id)
+        self.assertGreater(first, 1)
+        self.assertGreaterEqual(cache_versions.current_version(cache_versions.DRIVER, self.driver.id), first)
+
+
+class CacheInvalidationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.driver = User.objects.create_user(username='drv2', password='p', trikego_user='D')
+        self.passenger = User.objects.create_user(username='pax2', password='p', trikego_user='P')
+        self.booking = Booking.objects.create(
+            passenger=self.passenger, driver=self.driver, status='accepted',
+            pickup_address='A', destination_address='B',
+            pickup_latitude=14.6010, pickup_longitude=120.9842,
+            destination_latitude=14.6100, destination_longitude=120.9900,
+        )
+
+    def _versions(self):
+        return (
+            cache_versions.current_version(cache_versions.BOOKING, self.booking.id),
+            cache_versions.current_version(cache_versions.DRIVER, self.driver.id),
+        )
+
+    def test_stop_changes_bump_booking_and_driver(self):
+        before = self._versions()
+        ensure_booking_stops(self.booking)
+        after = self._versions()
+        self.assertGreater(after[0], before[0])
+        self.assertGreater(after[1], before[1])
+
+    def test_snapshot_save_bumps_the_booking(self):
+        before = self._versions()[0]
+        RoutingService().save_route_snapshot(self.booking, {
+            'route_data': {'features': [{'geometry': {'coordinates': [[120.98, 14.60], [120.99, 14.61]]}, 'properties': {}}]},
+            'distance': 1.0, 'duration': 60, 'too_close': False,
+        })
+        self.assertGreater(self._versions()[0], before)
+
+    def test_location_updates_bump_open_bookings(self):
+        before = self._versions()[0]
+        self.client.force_login(self.driver)
+        with mock.patch('booking_app.api_views.schedule_reroute'):
+            self.client.post(
+                reverse('booking:update_driver_location'),
+                {'latitude': 14.6, 'longitude': 120.98}, content_type='application/json',
+            )
+        moved = self._versions()[0]
+        self.assertGreater(moved, before)
+
+        Passenger.objects.create(user=self.passenger)
+        self.assertGreater(self._versions()[0], moved)
+
+    def test_background_routing_writes_no_side_cache(self):
+        from booking_app.tasks import compute_and_cache_route
+
+        locations.record_location(self.driver.id, 14.5995, 120.9842)
+        with mock.patch.object(RoutingService(), 'calculate_route', return_value=ROUTED):
+            compute_and_cache_route(self.booking.id)
+        self.assertFalse([key for key in cache._cache if 'route_info_' in key])
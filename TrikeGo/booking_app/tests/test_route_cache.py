@@ -0,0 +1,61 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from booking_app.route_cache import RouteCache
+from booking_app.services import RoutingService
+
+
+def _ors_response(distance_m=1500.0, duration_s=300.0):
+    return {
+        'features': [{
+            'geometry': {'coordinates': [[120.9842, 14.5995], [120.9900, 14.6050]]},
+            'properties': {'segments': [{'distance': distance_m, 'duration': duration_s}]},
+        }]
+    }
+
+
+@override_settings(ORS_ROUTE_CACHE_ALIAS='routes', ORS_ROUTE_CACHE_TTL=60, ORS_ROUTE_CACHE_PRECISION=4)
+class RouteCacheTest(TestCase):
+    def setUp(self):
+        caches['routes'].clear()
+        self.service = RoutingService()
+        self.service.breaker.reset()
+        patcher = mock.patch.object(self.service, 'client')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service.client.directions.return_value = _ors_response()
+
+    def test_repeated_route_served_from_cache(self):
+        start, end = (120.9842, 14.5995), (120.9900, 14.6050)
+        first = self.service.calculate_route(start, end)
+        second = self.service.calculate_route(start, end)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.service.client.directions.call_count, 1)
+        stats = self.service.route_cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['stores'], 1)
+
+    def test_key_rounds_coordinates_and_includes_profile(self):
+        cache = RouteCache()
+        a = cache.make_key((120.98421, 14.59951), (120.99, 14.605), 'driving-car')
+        b = cache.make_key((120.98424, 14.59954), (120.99, 14.605), 'driving-car')
+        c = cache.make_key((120.98421, 14.59951), (120.99, 14.605), 'cycling-regular')
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_failed_routes_are_not_cached(self):
+        self.service.client.directions.side_effect = RuntimeError('quota exceeded')
+        start, end = (120.9842, 14.5995), (120.9900, 14.6050)
+        self.assertIsNone(self.service.calculate_route(start, end))
+        self.assertIsNone(self.service.calculate_route(start, end))
+        self.assertEqual(self.service.client.directions.call_count, 2)
+
+    def test_oversized_payload_skipped(self):
+        cache = RouteCache(max_bytes=10)
+        stored = cache.set((1.0, 1.0), (2.0, 2.0), 'driving-car', {'route_data': _ors_response()})
+        self.assertFalse(stored)
+        self.assertEqual(cache.stats()['skipped'], 1)
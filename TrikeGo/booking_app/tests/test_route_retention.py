@@ -0,0 +1,94 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from booking_app import polyline, route_retention
+from booking_app.models import Booking, RouteSnapshot, RouteTrace
+
+User = get_user_model()
+
+COORDS = [[120.9800, 14.6000], [120.9810, 14.6000], [120.9820, 14.6000], [120.9830, 14.6000], [120.9830, 14.6050]]
+
+
+def _ors_response():
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': COORDS},
+            'properties': {'summary': {'distance': 880.0, 'duration': 120.0}},
+        }],
+    }
+
+
+@override_settings(ROUTE_SNAPSHOT_RETENTION_HOURS=24, ROUTE_TRACE_SIMPLIFY_METERS=10)
+class RouteRetentionTest(TestCase):
+    def setUp(self):
+        passenger = User.objects.create_user(username='pax', password='p', trikego_user='P')
+        self.booking = Booking.objects.create(
+            passenger=passenger, status='completed', pickup_address='A', destination_address='B',
+            pickup_latitude=14.6000, pickup_longitude=120.9800,
+            destination_latitude=14.6050, destination_longitude=120.9830,
+        )
+
+    def _snapshot(self, hours_ago, is_active=False, legacy=False):
+        fields = {'route_data': _ors_response()} if legacy else RouteSnapshot.compact_fields(_ors_response())
+        snapshot = RouteSnapshot.objects.create(
+            booking=self.booking, distance=Decimal('0.88'), duration=120, is_active=is_active, **fields,
+        )
+        RouteSnapshot.objects.filter(id=snapshot.id).update(created_at=timezone.now() - timedelta(hours=hours_ago))
+        return snapshot
+
+    def test_keeps_active_and_latest_and_archives_the_rest(self):
+        old = [self._snapshot(hours) for hours in (50, 49, 48)]
+        active = self._snapshot(47, is_active=True)
+        recent = self._snapshot(1)
+        latest = self._snapshot(0.5)
+
+        self.assertEqual(route_retention.prune_snapshots(batch_size=2), 3)
+
+        remaining = set(RouteSnapshot.objects.values_list('id', flat=True))
+        self.assertEqual(remaining, {active.id, recent.id, latest.id})
+        self.assertFalse(RouteSnapshot.objects.filter(id__in=[s.id for s in old]).exists())
+
+        trace = RouteTrace.objects.get(booking=self.booking)
+        self.assertEqual(len(trace.routes), 3)
+        self.assertEqual([r['created_at'] for r in trace.routes], sorted(r['created_at'] for r in trace.routes))
+        # Archived lines are simplified down to the corner
+        points = polyline.decode(trace.routes[0]['polyline'], trace.routes[0]['precision'])
+        self.assertEqual(len(points), 3)
+
+    def test_final_snapshot_of_a_finished_trip_survives_retention(self):
+        superseded = self._snapshot(72)
+        final = self._snapshot(48)
+
+        self.assertEqual(route_retention.prune_snapshots(), 1)
+        self.assertEqual(list(RouteSnapshot.objects.values_list('id', flat=True)), [final.id])
+        self.assertEqual(len(RouteTrace.objects.get(booking=self.booking).routes), 1)
+        self.assertFalse(RouteSnapshot.objects.filter(id=superseded.id).exists())
+
+    def test_max_batches_bounds_one_run(self):
+        for hours in (50, 49, 48, 47):
+            self._snapshot(hours)
+        self.assertEqual(route_retention.prune_snapshots(batch_size=1, max_batches=2), 2)
+        self.assertEqual(route_retention.prune_snapshots(batch_size=1, max_batches=0), 1)
+
+    def test_backfill_compacts_legacy_rows_and_prunes(self):
+        legacy = self._snapshot(50, legacy=True)
+        self._snapshot(49, legacy=True)
+        latest = self._snapshot(48, legacy=True)
+
+        out = StringIO()
+        call_command('backfill_route_snapshots', '--batch-size', '1', stdout=out)
+
+        self.assertIn('Compacted 3 legacy snapshots', out.getvalue())
+        self.assertIn('Archived and deleted 2', out.getvalue())
+        latest.refresh_from_db()
+        self.assertIsNone(latest.route_data)
+        self.assertTrue(latest.geometry)
+        self.assertFalse(RouteSnapshot.objects.filter(id=legacy.id).exists())
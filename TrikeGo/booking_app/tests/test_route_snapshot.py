@@ -0,0 +1,97 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from booking_app import polyline
+from booking_app.deviation import check_deviation
+from booking_app.models import Booking, RouteSnapshot
+from booking_app.services import RoutingService
+
+User = get_user_model()
+
+# A straight street with redundant midpoints plus one real corner
+COORDS = [[120.9800, 14.6000], [120.9810, 14.6000], [120.9820, 14.6000], [120.9830, 14.6000], [120.9830, 14.6050]]
+
+
+def _ors_response(coords=COORDS):
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': coords},
+            'properties': {
+                'segments': [{'distance': 880.0, 'duration': 120.0, 'steps': [{'instruction': 'Head east'}]}],
+                'summary': {'distance': 880.0, 'duration': 120.0},
+                'way_points': [0, len(coords) - 1],
+            },
+        }],
+    }
+
+
+class PolylineTest(SimpleTestCase):
+    def test_matches_reference_encoding(self):
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        encoded = polyline.encode(points)
+        self.assertEqual(encoded, '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(polyline.decode(encoded), points)
+
+    def test_simplify_keeps_corners_and_ends(self):
+        points = [(lat, lon) for lon, lat in COORDS]
+        self.assertEqual(polyline.simplify(points, 2.0), [points[0], points[3], points[4]])
+        self.assertEqual(polyline.simplify(points, 0), points)
+
+
+class RouteSnapshotStorageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+        self.passenger = User.objects.create_user(username='pax', password='p', trikego_user='P')
+        self.booking = Booking.objects.create(
+            passenger=self.passenger, driver=self.driver, status='accepted',
+            pickup_address='A', destination_address='B',
+            pickup_latitude=14.6050, pickup_longitude=120.9830,
+            destination_latitude=14.6100, destination_longitude=120.9900,
+        )
+
+    @override_settings(ROUTE_SNAPSHOT_SIMPLIFY_METERS=2)
+    def _save(self):
+        route_info = {'route_data': _ors_response(), 'distance': 0.88, 'duration': 120, 'too_close': False}
+        return RoutingService().save_route_snapshot(self.booking, route_info)
+
+    def test_snapshot_stores_polyline_without_the_response(self):
+        snapshot = RouteSnapshot.objects.get(id=self._save().id)
+
+        self.assertIsNone(snapshot.route_data)
+        self.assertEqual(snapshot.coordinates, [COORDS[0], COORDS[3], COORDS[4]])
+        self.assertEqual(snapshot.route_meta['summary'], {'distance': 880.0, 'duration': 120.0})
+        self.assertNotIn('steps', snapshot.route_meta['segments'][0])
+
+        result = check_deviation(snapshot, 14.6001, 120.9815)
+        self.assertFalse(result.off_route)
+
+    def test_legacy_rows_still_serve_both_formats(self):
+        legacy = RouteSnapshot.objects.create(
+            booking=self.booking, route_data=_ors_response(), distance=Decimal('0.88'), duration=120,
+        )
+        self.assertEqual(legacy.coordinates, COORDS)
+        encoded, precision = legacy.as_polyline()
+        self.assertEqual(len(polyline.decode(encoded, precision)), len(COORDS))
+
+    def test_current_route_endpoint_formats(self):
+        self._save()
+        self.client.force_login(self.passenger)
+        url = reverse('booking:get_current_route', args=[self.booking.id])
+
+        geojson = self.client.get(url).json()
+        self.assertEqual(geojson['route_data']['features'][0]['geometry']['coordinates'][-1], COORDS[-1])
+        self.assertEqual(geojson['distance'], 0.88)
+
+        compact = self.client.get(url, {'geometry': 'polyline'}).json()
+        self.assertNotIn('route_data', compact)
+        decoded = polyline.decode(compact['polyline'], compact['precision'])
+        self.assertEqual(decoded[-1], (COORDS[-1][1], COORDS[-1][0]))
+
+        self.assertEqual(self.client.get(url, {'geometry': 'wkt'}).status_code, 400)
@@ -0,0 +1,39 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from booking_app.services import RETRY_STATUSES, RoutingService
+
+
+class RoutingServiceTest(SimpleTestCase):
+    def test_one_instance_per_process(self):
+        seen = []
+        threads = [threading.Thread(target=lambda: seen.append(RoutingService())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(service) for service in seen}), 1)
+        self.assertIs(seen[0], RoutingService())
+
+    def test_client_shares_pooled_session_with_retries(self):
+        service = RoutingService()
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'features': []}
+        with mock.patch.object(service.session, 'post', return_value=response) as post:
+            service.client.directions(((120.98, 14.59), (120.99, 14.60)), format='geojson')
+        self.assertEqual(post.call_args.kwargs['timeout'], service.timeout)
+        retry = service.session.get_adapter('https://api.openrouteservice.org').max_retries
+        self.assertEqual(set(retry.status_forcelist), set(RETRY_STATUSES))
+        self.assertIn('POST', retry.allowed_methods)
+        self.assertEqual(retry.read, 0)
+
+    def test_geocoding_uses_session_with_timeout(self):
+        service = RoutingService()
+        service.breaker.reset()
+        response = mock.Mock()
+        response.json.return_value = {'features': []}
+        with mock.patch.object(service.session, 'get', return_value=response) as get:
+            self.assertEqual(service.geocode_address('Ayala'), [])
+        self.assertEqual(get.call_args.kwargs['timeout'], service.timeout)
@@ -0,0 +1,84 @@
+import itertools
+import random
+
+from django.test import SimpleTestCase
+
+from booking_app import sequencing
+from booking_app.sequencing import DROPOFF, PICKUP, SequenceStop
+
+
+def _requests(rng, count, onboard=0):
+    stops = []
+    for group in range(count):
+        stops.append(SequenceStop((14.60 + rng.uniform(-0.03, 0.03), 120.98 + rng.uniform(-0.03, 0.03)), PICKUP, group, 1))
+        stops.append(SequenceStop((14.60 + rng.uniform(-0.03, 0.03), 120.98 + rng.uniform(-0.03, 0.03)), DROPOFF, group, 1))
+    for group in range(count, count + onboard):
+        stops.append(SequenceStop((14.60 + rng.uniform(-0.03, 0.03), 120.98 + rng.uniform(-0.03, 0.03)), DROPOFF, group, 1))
+    return stops
+
+
+def _valid(stops, order, capacity):
+    load = sum(1 for s in stops if s.kind == DROPOFF and not any(p.kind == PICKUP and p.group == s.group for p in stops))
+    picked = set()
+    for i in order:
+        stop = stops[i]
+        if stop.kind == PICKUP:
+            picked.add(stop.group)
+            load += stop.load
+        else:
+            has_pickup = any(p.kind == PICKUP and p.group == stop.group for p in stops)
+            if has_pickup and stop.group not in picked:
+                return False
+            load -= stop.load
+        if capacity is not None and load > capacity:
+            return False
+    return sorted(order) == list(range(len(stops)))
+
+
+class SequencingTest(SimpleTestCase):
+    start = (14.60, 120.98)
+
+    def test_exact_solver_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(5):
+            stops = _requests(rng, 3)
+            order = sequencing.solve(stops, self.start, capacity=2)
+            self.assertTrue(_valid(stops, order, 2))
+            best = min(
+                sequencing.route_cost(stops, perm, self.start)
+                for perm in itertools.permutations(range(len(stops)))
+                if _valid(stops, perm, 2)
+            )
+            self.assertAlmostEqual(sequencing.route_cost(stops, order, self.start), best)
+
+    def test_heuristic_respects_precedence_and_capacity(self):
+        rng = random.Random(11)
+        stops = _requests(rng, 7, onboard=2)
+        self.assertGreater(len(stops), sequencing.EXACT_MAX_STOPS)
+        order = sequencing.solve(stops, self.start, capacity=3)
+        self.assertTrue(_valid(stops, order, 3))
+
+    def test_single_seat_alternates_pickups_and_dropoffs(self):
+        stops = _requests(random.Random(3), 3)
+        order = sequencing.solve(stops, self.start, capacity=1)
+        kinds = [stops[i].kind for i in order]
+        self.assertEqual(kinds, [PICKUP, DROPOFF] * 3)
+
+    def test_over_capacity_still_returns_a_valid_order(self):
+        stops = _requests(random.Random(5), 1, onboard=2)
+        order = sequencing.solve(stops, self.start, capacity=1)
+        self.assertTrue(_valid(stops, order, None))
+
+    def test_custom_cost_matrix(self):
+        # Road times say the geographically nearer drop-off is the slow one
+        stops = [
+            SequenceStop((14.601, 120.98), DROPOFF, 1, 1),
+            SequenceStop((14.650, 120.98), DROPOFF, 2, 1),
+        ]
+
+        def times(points):
+            slow = {0: {1: 30.0, 2: 5.0}, 1: {0: 30.0, 2: 20.0}, 2: {0: 5.0, 1: 20.0}}
+            return [[0.0 if a == b else slow[a][b] for b in range(len(points))] for a in range(len(points))]
+
+        self.assertEqual(sequencing.solve(stops, self.start), [0, 1])
+        self.assertEqual(sequencing.solve(stops, self.start, cost_matrix=times), [1, 0])
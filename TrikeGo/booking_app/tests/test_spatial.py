@@ -0,0 +1,132 @@
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from booking_app import spatial
+from booking_app.models import Booking
+from booking_app.spatial import GeoGridIndex, cells_covering, geohash_bounds, geohash_encode
+
+User = get_user_model()
+
+
+class GeohashTest(TestCase):
+    def test_encode_known_value(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_bounds_contain_point(self):
+        south, west, north, east = geohash_bounds(geohash_encode(14.5995, 120.9842, 6))
+        self.assertTrue(south <= 14.5995 <= north)
+        self.assertTrue(west <= 120.9842 <= east)
+
+    def test_cells_covering_includes_neighbours(self):
+        cells = cells_covering(14.5995, 120.9842, 1.0, 6)
+        self.assertIn(geohash_encode(14.5995, 120.9842, 6), cells)
+        self.assertIn(geohash_encode(14.6080, 120.9842, 6), cells)
+        self.assertIsNone(cells_covering(14.5995, 120.9842, 5000, 6))
+
+
+class GeoGridIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.index = GeoGridIndex('geo_test', precision=6)
+
+    def test_query_returns_nearest_within_radius(self):
+        self.index.upsert(1, 14.5995, 120.9842)
+        self.index.upsert(2, 14.6020, 120.9842)   # ~280 m away
+        self.index.upsert(3, 14.7000, 120.9842)   # ~11 km away
+        results = self.index.query(14.5995, 120.9842, 1.0)
+        self.assertEqual([member for member, _ in results], [1, 2])
+        self.assertAlmostEqual(results[1][1], 0.278, places=2)
+
+    def test_move_and_remove(self):
+        self.index.upsert(1, 14.5995, 120.9842)
+        self.index.upsert(1, 14.7000, 120.9842)
+        self.assertEqual(self.index.query(14.5995, 120.9842, 1.0), [])
+        self.assertEqual([m for m, _ in self.index.query(14.7000, 120.9842, 1.0)], [1])
+        self.index.remove(1)
+        self.assertEqual(self.index.query(14.7000, 120.9842, 1.0), [])
+
+    def test_concurrent_writers_in_one_cell_are_all_kept(self):
+        start = threading.Barrier(20)
+
+        def write(member_id):
+            start.wait()
+            self.index.upsert(member_id, 14.5995 + member_id * 1e-6, 120.9842)
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(m for m, _ in self.index.query(14.5995, 120.9842, 0.5)), list(range(20)))
+
+    @override_settings(SPATIAL_INDEX_REBUILD_SECONDS=300)
+    def test_warm_flag_expires_so_the_index_is_rebuilt(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.index.mark_warm()
+        self.assertEqual(cache_set.call_args.kwargs['timeout'], 300)
+
+    def test_rebuild_replaces_contents(self):
+        self.index.upsert(9, 14.5995, 120.9842)
+        self.index.rebuild([(1, 14.5995, 120.9842)])
+        self.assertEqual([m for m, _ in self.index.query(14.5995, 120.9842, 1.0)], [1])
+        self.assertTrue(self.index.is_warm())
+
+    def test_rebuild_keeps_members_upserted_after_the_read(self):
+        self.index.upsert(9, 14.5995, 120.9842)
+        started = time.time()
+        self.index.upsert(5, 14.5996, 120.9842)
+        self.index.rebuild([(1, 14.5995, 120.9842)], started=started)
+        self.assertEqual(sorted(m for m, _ in self.index.query(14.5995, 120.9842, 1.0)), [1, 5])
+
+    def test_queries_during_rebuild_see_the_new_contents(self):
+        self.index.upsert(9, 14.5995, 120.9842)
+        seen = []
+        discard = spatial._cell_sets.discard
+
+        def discard_and_query(key, *members):
+            seen.append([m for m, _ in self.index.query(14.5995, 120.9842, 1.0)])
+            discard(key, *members)
+
+        with mock.patch.object(spatial._cell_sets, 'discard', side_effect=discard_and_query):
+            self.index.rebuild([(1, 14.5995, 120.9842)])
+        self.assertTrue(seen)
+        self.assertTrue(all(1 in ids for ids in seen))
+
+    def test_concurrent_rebuild_is_skipped(self):
+        cache.add(self.index._rebuild_lock_key, True)
+        self.assertIsNone(self.index.rebuild([(1, 14.5995, 120.9842)]))
+        self.assertFalse(self.index.is_warm())
+
+
+class PendingPickupIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.passenger = User.objects.create_user(username='pax', password='p', trikego_user='P')
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+
+    def test_booking_signals_keep_index_in_sync(self):
+        booking = Booking.objects.create(
+            passenger=self.passenger,
+            pickup_address='A', destination_address='B',
+            pickup_latitude=14.5995, pickup_longitude=120.9842,
+            destination_latitude=14.6100, destination_longitude=120.9900,
+        )
+        nearby = spatial.pending_pickups_near(14.6000, 120.9842, 1.0)
+        self.assertEqual([booking_id for booking_id, _ in nearby], [booking.id])
+
+        booking.driver = self.driver
+        booking.status = 'accepted'
+        booking.save()
+        self.assertEqual(spatial.pending_pickups_near(14.6000, 120.9842, 1.0), [])
+
+    def test_cache_outage_falls_back_to_the_database(self):
+        client = mock.Mock()
+        client.sadd.side_effect = client.pipeline.return_value.execute.side_effect = ConnectionError('redis down')
+        with mock.patch.object(spatial.CellSets, '_redis', return_value=client):
+            self.assertIsNone(spatial.pending_pickups_near(14.6000, 120.9842, 1.0))
+            self.assertIsNone(spatial.drivers_within(14.6000, 120.9842, 1.0))
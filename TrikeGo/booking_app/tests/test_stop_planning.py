@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from booking_app import cache_versions, locations
+from booking_app.models import Booking, BookingStop
+from booking_app.utils import build_driver_itinerary, ensure_booking_stops, order_driver_stops, plan_driver_stops
+
+User = get_user_model()
+
+
+def _writes(ctx):
+    return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+
+
+class StopPlanningTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='drv', password='p', trikego_user='D')
+        locations.record_location(self.driver.id, 14.5995, 120.9842)
+        for idx, lat in enumerate((14.6010, 14.6050)):
+            passenger = User.objects.create_user(username=f'pax{idx}', password='p', trikego_user='P')
+            booking = Booking.objects.create(
+                passenger=passenger, driver=self.driver, status='accepted',
+                pickup_address='A', destination_address='B',
+                pickup_latitude=lat, pickup_longitude=120.9842,
+                destination_latitude=lat + 0.01, destination_longitude=120.9900,
+            )
+            ensure_booking_stops(booking)
+
+    def _db_state(self):
+        return list(BookingStop.objects.order_by('id').values_list('sequence', 'status'))
+
+    def test_ordering_is_pure(self):
+        stops = list(BookingStop.objects.select_related('booking'))
+        before = [(s.sequence, s.status) for s in stops]
+        order = order_driver_stops(stops, (14.5995, 120.9842))
+        self.assertEqual(order[0].stop_type, 'PICKUP')
+        self.assertAlmostEqual(float(order[0].latitude), 14.6010)
+        self.assertEqual([(s.sequence, s.status) for s in stops], before)
+
+    def test_read_only_planning_does_not_write(self):
+        BookingStop.objects.update(status='UPCOMING', sequence=9)
+        stale = self._db_state()
+
+        with CaptureQueriesContext(connection) as ctx:
+            payload = build_driver_itinerary(self.driver)
+        self.assertEqual(_writes(ctx), [])
+        self.assertEqual(self._db_state(), stale)
+        self.assertEqual(payload['itinerary']['stops'][0]['status'], 'CURRENT')
+
+    def test_persisted_changes_use_one_bulk_write(self):
+        BookingStop.objects.update(status='UPCOMING', sequence=9)
+
+        with CaptureQueriesContext(connection) as ctx:
+            order = plan_driver_stops(self.driver)
+        self.assertEqual(len(_writes(ctx)), 1)
+        self.assertEqual(
+            sorted(self._db_state()),
+            [(1, 'CURRENT'), (2, 'UPCOMING'), (3, 'UPCOMING'), (4, 'UPCOMING')],
+        )
+        self.assertEqual(BookingStop.objects.get(status='CURRENT').id, order[0].id)
+
+        # Replanning an unchanged itinerary writes nothing
+        with CaptureQueriesContext(connection) as ctx:
+            plan_driver_stops(self.driver)
+        self.assertEqual(_writes(ctx), [])
+
+    def test_persisted_changes_retire_cached_responses(self):
+        BookingStop.objects.update(status='UPCOMING', sequence=9)
+        booking_ids = list(Booking.objects.values_list('id', flat=True))
+        before = [cache_versions.current_version(cache_versions.BOOKING, bid) for bid in booking_ids]
+        driver_before = cache_versions.current_version(cache_versions.DRIVER, self.driver.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            plan_driver_stops(self.driver)
+
+        after = [cache_versions.current_version(cache_versions.BOOKING, bid) for bid in booking_ids]
+        self.assertTrue(all(a > b for a, b in zip(after, before)))
+        self.assertGreater(cache_versions.current_version(cache_versions.DRIVER, self.driver.id), driver_before)
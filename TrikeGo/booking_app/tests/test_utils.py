@@ -1,6 +1,7 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from booking_app.utils import seats_available, pickup_within_detour
+from booking_app import locations
 from booking_app.models import Booking
 from user_app.models import Driver, Tricycle
 
@@ -26,9 +27,7 @@ class UtilsTestCase(TestCase):
 
     def test_pickup_within_detour(self):
         # Set driver current location
-        self.driver_profile.current_latitude = 14.5995
-        self.driver_profile.current_longitude = 120.9842
-        self.driver_profile.save()
+        locations.record_location(self.user.id, 14.5995, 120.9842)
         # pickup within ~300m
         ok = pickup_within_detour(self.user, 14.6020, 120.9842, max_km=0.5)
         self.assertTrue(ok)
@@ -0,0 +1,113 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from booking_app import zone_table
+from booking_app.models import Booking
+from booking_app.services import RoutingService
+from booking_app.spatial import geohash_encode
+from booking_app.tasks import refine_booking_estimate
+from user_app.models import Passenger
+
+User = get_user_model()
+
+PICKUP = (14.5995, 120.9842)
+DESTINATION = (14.6250, 121.0100)
+
+
+class ZoneTableTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.passenger = User.objects.create_user(username='pax', password='p', trikego_user='P')
+        self.zones = [geohash_encode(*PICKUP, 6), geohash_encode(*DESTINATION, 6)]
+        self.service = RoutingService()
+
+    def _refresh(self):
+        matrix = {'durations': [[0.0, 600.0], [620.0, 0.0]], 'distances': [[0.0, 5.0], [5.2, 0.0]]}
+        with mock.patch.object(self.service, 'travel_matrix', return_value=matrix) as travel_matrix:
+            self.assertEqual(zone_table.refresh_table(self.zones), 2)
+        return travel_matrix
+
+    def test_busiest_zones_come_from_booking_endpoints(self):
+        for _ in range(2):
+            Booking.objects.create(
+                passenger=self.passenger, pickup_address='A', destination_address='B',
+                pickup_latitude=PICKUP[0], pickup_longitude=PICKUP[1],
+                destination_latitude=DESTINATION[0], destination_longitude=DESTINATION[1],
+            )
+        self.assertEqual(sorted(zone_table.busiest_zones()), sorted(self.zones))
+
+    def test_refresh_routes_zone_centroids_in_one_matrix_call(self):
+        travel_matrix = self._refresh()
+        locations = travel_matrix.call_args[0][0]
+        self.assertEqual(len(locations), 2)
+        # (lon, lat) of each cell centre
+        self.assertAlmostEqual(locations[0][0], PICKUP[1], places=2)
+        self.assertAlmostEqual(locations[0][1], PICKUP[0], places=2)
+
+    def test_quote_scales_the_zone_pair_by_straight_line(self):
+        self._refresh()
+        with mock.patch.object(self.service, 'calculate_route') as calculate_route:
+            quote = zone_table.quote(PICKUP, DESTINATION)
+        calculate_route.assert_not_called()
+
+        centroid_km = zone_table.haversine_km(*zone_table.zone_centroid(self.zones[0]), *zone_table.zone_centroid(self.zones[1]))
+        scale = zone_table.haversine_km(*PICKUP, *DESTINATION) / centroid_km
+        self.assertTrue(quote['estimated'])
+        self.assertAlmostEqual(quote['distance'], round(5.0 * scale, 2))
+        self.assertEqual(quote['duration'], int(600 * scale))
+
+    def test_no_quote_without_table_or_within_one_zone(self):
+        self.assertIsNone(zone_table.quote(PICKUP, DESTINATION))
+        self._refresh()
+        self.assertIsNone(zone_table.quote(PICKUP, (PICKUP[0] + 0.001, PICKUP[1])))
+        self.assertIsNone(zone_table.quote(PICKUP, (10.3, 123.9)))
+
+    def test_refinement_replaces_the_quote_while_pending(self):
+        booking = Booking.objects.create(
+            passenger=self.passenger, pickup_address='A', destination_address='B',
+            pickup_latitude=PICKUP[0], pickup_longitude=PICKUP[1],
+            destination_latitude=DESTINATION[0], destination_longitude=DESTINATION[1],
+            estimated_distance=Decimal('4.00'), estimated_duration=10,
+        )
+        routed = {'route_data': {}, 'distance': 6.0, 'duration': 1200, 'too_close': False}
+        with mock.patch.object(self.service, 'calculate_route', return_value=routed):
+            self.assertTrue(refine_booking_estimate(booking.id))
+
+        booking.refresh_from_db()
+        self.assertEqual(booking.estimated_distance, Decimal('6.00'))
+        self.assertEqual(booking.estimated_duration, 20)
+        self.assertEqual(booking.fare, Decimal('65.00'))
+
+        Booking.objects.filter(id=booking.id).update(status='accepted')
+        with mock.patch.object(self.service, 'calculate_route', return_value=routed) as calculate_route:
+            self.assertFalse(refine_booking_estimate(booking.id))
+        calculate_route.assert_not_called()
+
+    def test_route_info_shows_the_refined_fare(self):
+        Passenger.objects.create(user=self.passenger)
+        booking = Booking.objects.create(
+            passenger=self.passenger, pickup_address='A', destination_address='B',
+            pickup_latitude=PICKUP[0], pickup_longitude=PICKUP[1],
+            destination_latitude=DESTINATION[0], destination_longitude=DESTINATION[1],
+            estimated_distance=Decimal('4.00'), estimated_duration=10, fare=Decimal('40.00'),
+        )
+        self.client.force_login(self.passenger)
+        url = reverse('user:get_route_info', args=[booking.id])
+        routed = {'route_data': {}, 'distance': 6.0, 'duration': 1200, 'too_close': False}
+        with mock.patch.object(self.service, 'calculate_route', return_value=routed):
+            first = self.client.get(url)
+            self.assertEqual(first.json()['fare'], 40.0)
+            # A second poll is served from the cache, so only a version bump can reveal the refinement
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+            self.assertTrue(refine_booking_estimate(booking.id))
+            refreshed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(refreshed.status_code, 200)
+        self.assertEqual(refreshed.json()['fare'], 65.0)
+        self.assertEqual(refreshed.json()['estimated_distance_km'], 6.0)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api_views, views
 from payments_app import api_views as payments_api
 from tracking_app import api_views as tracking_api
 
@@ -18,6 +18,10 @@ urlpatterns = [
     path('api/reroute/<int:booking_id>/', tracking_api.manual_reroute, name='manual_reroute'),
     path('api/driver/itinerary/', tracking_api.driver_itinerary, name='driver_itinerary'),
     path('api/itinerary/complete_stop/', tracking_api.complete_itinerary_stop, name='complete_itinerary_stop'),
+
+    # Server-side geocoding (shared caches and upstream quota)
+    path('api/geocode/autocomplete/', api_views.geocode_autocomplete, name='geocode_autocomplete'),
+    path('api/geocode/reverse/', api_views.geocode_reverse, name='geocode_reverse'),
     
     # Payment PIN verification endpoints
     # Payment PIN endpoints moved to payments app
@@ -1,11 +1,17 @@
-from typing import Dict, List, Optional, Tuple, Set
+from typing import Dict, List, Optional, Tuple
 
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
 from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
 import random
 import math
+import threading
+
+from .geo import distance_matrix, haversine_km, nearest
 
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -14,18 +20,11 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     Parameters are latitude and longitude in decimal degrees: (lat1, lon1, lat2, lon2).
     Returns distance in kilometers as a float.
     """
-    # Earth radius in kilometers
-    radius = 6371.0
-    ph1 = math.radians(lat1)
-    ph2 = math.radians(lat2)
-    d_phi = math.radians(lat2 - lat1)
-    d_lambda = math.radians(lon2 - lon1)
-    a = math.sin(d_phi / 2) ** 2 + math.cos(ph1) * math.cos(ph2) * math.sin(d_lambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return radius * c
-
-from .models import Booking, BookingStop, DriverLocation
-from .services import RoutingService
+    return haversine_km(lat1, lon1, lat2, lon2)
+
+from .models import Booking, BookingStop
+from . import cache_versions, itinerary_state, locations, sequencing
+from .services import FALLBACK_SPEED_KMH, RoutingService
 from user_app.models import Driver, Tricycle
 
 
@@ -53,15 +52,11 @@ def pickup_within_detour(driver_user, pickup_lat: float, pickup_lon: float, max_
     """Simple option A detour check: return True if pickup is within `max_km` of any point on the driver's
     current route approximation (driver current location + active bookings' pickup/destination points).
     """
-    driver_profile = Driver.objects.filter(user=driver_user).first()
     points = []  # list of (lat, lon)
 
-    if driver_profile:
-        if driver_profile.current_latitude is not None and driver_profile.current_longitude is not None:
-            try:
-                points.append((float(driver_profile.current_latitude), float(driver_profile.current_longitude)))
-            except Exception:
-                pass
+    driver_coord = locations.get_coordinates(driver_user.id)
+    if driver_coord:
+        points.append(driver_coord)
 
     # include active bookings' waypoints
     active_bookings = Booking.objects.filter(driver=driver_user, status__in=['accepted', 'on_the_way', 'started'])
@@ -81,21 +76,70 @@ def pickup_within_detour(driver_user, pickup_lat: float, pickup_lon: float, max_
     if not points:
         return True
 
-    for pt_lat, pt_lon in points:
-        try:
-            d = calculate_distance(pt_lat, pt_lon, float(pickup_lat), float(pickup_lon))
-            if d <= float(max_km):
-                return True
-        except Exception:
+    try:
+        closest = nearest((float(pickup_lat), float(pickup_lon)), points)
+    except (TypeError, ValueError):
+        return False
+    return closest is not None and closest[1] <= float(max_km)
+
+
+def insertion_detour_km(
+    route: List[Tuple[float, float]],
+    pickup: Tuple[float, float],
+    dropoff: Optional[Tuple[float, float]] = None,
+) -> float:
+    """Extra kilometres needed to serve a new pickup (and drop-off) along `route`.
+
+    `route` is the driver's current path as (lat, lon) points, starting at the driver.
+    The pickup is inserted at its cheapest position and the drop-off at the cheapest
+    position after it. The pickup-to-destination leg itself is not counted as detour,
+    so for an idle driver the result is simply the distance to the pickup.
+    """
+    if not route:
+        return 0.0
+
+    # One batched matrix over every point instead of a haversine per leg
+    n = len(route)
+    points = list(route) + [pickup] + ([dropoff] if dropoff is not None else [])
+    matrix = distance_matrix(points, points)
+    p_idx, d_idx = n, n + 1
+
+    def leg_after(i, via):
+        # Cost of visiting `via` between route[i] and route[i + 1]
+        if i + 1 < n:
+            return matrix[i][via] + matrix[via][i + 1] - matrix[i][i + 1]
+        return matrix[i][via]
+
+    best = float('inf')
+    for i in range(n):
+        pickup_cost = leg_after(i, p_idx)
+        if dropoff is None:
+            best = min(best, pickup_cost)
             continue
 
-    return False
+        # Drop-off immediately after the pickup
+        cost = matrix[i][p_idx] + matrix[p_idx][d_idx]
+        if i + 1 < n:
+            cost += matrix[d_idx][i + 1] - matrix[i][i + 1]
+        best = min(best, cost)
+
+        # Drop-off later in the route
+        for j in range(i + 1, n):
+            best = min(best, pickup_cost + leg_after(j, d_idx))
+
+    if dropoff is not None:
+        best -= matrix[p_idx][d_idx]
+    return max(0.0, best)
 
 
 # ---- Multi-stop itinerary helpers ----
 
-def ensure_booking_stops(booking: Booking) -> None:
-    """Ensure the booking has pickup and dropoff BookingStop entries."""
+def ensure_booking_stops(booking: Booking) -> bool:
+    """Ensure the booking has pickup and dropoff BookingStop entries.
+
+    Returns True when stops were created, in which case the driver's plan has
+    already been updated to include them.
+    """
     stops = {stop.stop_type: stop for stop in booking.stops.all()}
 
     driver_user = booking.driver
@@ -136,34 +180,17 @@ def ensure_booking_stops(booking: Booking) -> None:
         created = True
 
     if created and booking.driver:
-        resequence_driver_stops(booking.driver)
-
-
-def resequence_driver_stops(driver_user) -> None:
-    """Normalize the sequence numbers for a driver's active stops."""
-    stops = BookingStop.objects.filter(
-        booking__driver=driver_user,
-        booking__status__in=['accepted', 'on_the_way', 'started']
-    ).order_by('created_at')
-
-    for idx, stop in enumerate(stops, start=1):
-        if stop.sequence != idx:
-            stop.sequence = idx
-            stop.save(update_fields=['sequence'])
+        plan_driver_stops(booking.driver)
+    return created
 
 
 def _driver_start_location(driver_user) -> Optional[Tuple[float, float]]:
-    try:
-        location = DriverLocation.objects.get(driver=driver_user)
-        return (float(location.latitude), float(location.longitude))
-    except DriverLocation.DoesNotExist:
-        pass
+    return locations.get_coordinates(driver_user.id)
 
-    driver_profile = Driver.objects.filter(user=driver_user).first()
-    if driver_profile and driver_profile.current_latitude and driver_profile.current_longitude:
-        return (float(driver_profile.current_latitude), float(driver_profile.current_longitude))
 
-    return None
+def _driver_capacity(driver_user) -> Optional[int]:
+    capacity = Tricycle.objects.filter(driver__user=driver_user).values_list('max_capacity', flat=True).first()
+    return int(capacity) if capacity else None
 
 
 def _stop_coordinates(stop: BookingStop) -> Optional[Tuple[float, float]]:
@@ -189,6 +216,48 @@ def _append_unique_point(polyline: List[List[float]], lat: float, lon: float, ep
         polyline.append([lat_f, lon_f])
 
 
+def road_time_matrix(points: List[Tuple[float, float]]) -> List[List[float]]:
+    """Travel times in seconds between every pair of (lat, lon) points.
+
+    One ORS matrix request; pairs it cannot route (or every pair, when the call
+    fails) use straight-line distance at FALLBACK_SPEED_KMH.
+    """
+    estimate = [
+        [km / FALLBACK_SPEED_KMH * 3600 for km in row]
+        for row in distance_matrix(points, points)
+    ]
+    if len(points) < 2:
+        return estimate
+    try:
+        durations = RoutingService().duration_matrix([(lon, lat) for lat, lon in points])
+    except Exception:
+        durations = None
+    if not durations:
+        return estimate
+    return [
+        [road if road is not None else straight for road, straight in zip(road_row, straight_row)]
+        for road_row, straight_row in zip(durations, estimate)
+    ]
+
+
+def _fallback_segment_meta(start: Tuple[float, float], end: Tuple[float, float]) -> Dict[str, float]:
+    distance_km = float(haversine_km(start[0], start[1], end[0], end[1]))
+    # Assume 20 km/h average speed for fallback ETA estimates
+    duration_sec = 0
+    if distance_km > 0:
+        duration_sec = int(max(60, (distance_km / FALLBACK_SPEED_KMH) * 3600))
+    return {'distanceKm': distance_km, 'durationSec': float(duration_sec)}
+
+
+def _segment_key(start: Tuple[float, float], end: Tuple[float, float]) -> Tuple[float, float, float, float]:
+    return (
+        round(start[0], 5),
+        round(start[1], 5),
+        round(end[0], 5),
+        round(end[1], 5),
+    )
+
+
 def _segment_route(
     start: Tuple[float, float],
     end: Tuple[float, float],
@@ -198,23 +267,13 @@ def _segment_route(
     """Return route points for a segment and capture distance/ETA metadata."""
 
     def _fallback_meta() -> Dict[str, float]:
-        distance_km = float(calculate_distance(start[0], start[1], end[0], end[1]))
-        # Assume 20 km/h average speed for fallback ETA estimates
-        duration_sec = 0
-        if distance_km > 0:
-            duration_sec = int(max(60, (distance_km / 20.0) * 3600))
-        return {'distanceKm': distance_km, 'durationSec': float(duration_sec)}
+        return _fallback_segment_meta(start, end)
 
     if routing_service is None:
         meta = _fallback_meta()
         return None, False, meta
 
-    key = (
-        round(start[0], 5),
-        round(start[1], 5),
-        round(end[0], 5),
-        round(end[1], 5),
-    )
+    key = _segment_key(start, end)
 
     if key in cache:
         return cache[key]
@@ -235,6 +294,15 @@ def _segment_route(
         cache[key] = (None, False, meta)
         return cache[key]
 
+    if route_info.get('degraded'):
+        # Circuit breaker is open: the straight-line estimate is not a routed leg
+        meta = {
+            'distanceKm': float(route_info.get('distance') or 0.0),
+            'durationSec': float(route_info.get('duration') or 0.0)
+        }
+        cache[key] = (None, False, meta)
+        return cache[key]
+
     if route_info.get('too_close'):
         segment = [[float(start[0]), float(start[1])], [float(end[0]), float(end[1])]]
         meta = {
@@ -267,11 +335,144 @@ def _segment_route(
     return cache[key]
 
 
+def _prefetch_segments(
+    routing_service,
+    path: List[Tuple[float, float]],
+    cache: Dict[Tuple[float, float, float, float], Tuple[Optional[List[List[float]]], bool, Dict[str, float]]],
+) -> bool:
+    """Route every uncached leg of `path` with one multi-waypoint request.
+
+    Fills `cache` in the shape `_segment_route` uses, so the per-leg loop only
+    makes its own requests for legs this could not cover. Returns True on success.
+    """
+    legs = list(zip(path, path[1:]))
+    missing = [leg for leg in legs if _segment_key(*leg) not in cache]
+    if len(missing) < 2:
+        # A single leg costs the same request either way
+        return False
+
+    route_info = routing_service.calculate_multi_route([(lon, lat) for lat, lon in path])
+    if not route_info:
+        return False
+
+    for (start, end), leg in zip(legs, route_info['legs']):
+        key = _segment_key(start, end)
+        if key in cache or len(leg['points']) < 2:
+            continue
+        cache[key] = (
+            leg['points'],
+            True,
+            {'distanceKm': float(leg['distance']), 'durationSec': float(leg['duration'])},
+        )
+    return True
+
+
+_segment_pool: Optional[ThreadPoolExecutor] = None
+_segment_pool_lock = threading.Lock()
+# Calls left running past the deadline still hold a worker until the HTTP
+# session's read timeout ends them; `future.cancel()` cannot stop them.
+_abandoned_segment_calls = 0
+
+
+def _segment_workers() -> int:
+    return max(1, int(getattr(settings, 'ORS_SEGMENT_WORKERS', 4)))
+
+
+def _get_segment_pool() -> ThreadPoolExecutor:
+    """Process-wide pool, so concurrent itinerary reads share one bound on ORS requests."""
+    global _segment_pool
+    with _segment_pool_lock:
+        if _segment_pool is None:
+            _segment_pool = ThreadPoolExecutor(
+                max_workers=_segment_workers(),
+                thread_name_prefix='ors-segment',
+            )
+        return _segment_pool
+
+
+def _abandon_segment_call(future) -> None:
+    global _abandoned_segment_calls
+    with _segment_pool_lock:
+        _abandoned_segment_calls += 1
+
+    def _release(_future):
+        global _abandoned_segment_calls
+        with _segment_pool_lock:
+            _abandoned_segment_calls -= 1
+
+    future.add_done_callback(_release)
+
+
+def _free_segment_workers() -> int:
+    with _segment_pool_lock:
+        return max(0, _segment_workers() - _abandoned_segment_calls)
+
+
+def _abandoned_segment_meta(start: Tuple[float, float], end: Tuple[float, float]) -> Dict[str, float]:
+    meta = _fallback_segment_meta(start, end)
+    meta['abandoned'] = True
+    return meta
+
+
+def _route_segments_concurrently(
+    routing_service,
+    path: List[Tuple[float, float]],
+    cache: Dict[Tuple[float, float, float, float], Tuple[Optional[List[List[float]]], bool, Dict[str, float]]],
+) -> int:
+    """Route the uncached legs of `path` in parallel, waiting at most ORS_SEGMENT_DEADLINE_SECONDS.
+
+    Legs that fail or miss the deadline get the straight-line fallback so the
+    itinerary is never slower than its slowest leg or the deadline. Only as many
+    legs are submitted as there are workers not held by calls abandoned earlier;
+    the rest fall back straight away instead of queueing behind them. Legs that
+    missed the deadline or found no free worker are flagged `abandoned` in their
+    meta; returns how many there were.
+    """
+    legs = {}
+    for start, end in zip(path, path[1:]):
+        key = _segment_key(start, end)
+        if key not in cache:
+            legs.setdefault(key, (start, end))
+    if len(legs) < 2:
+        return 0
+
+    pool = _get_segment_pool()
+    free = _free_segment_workers()
+    submitted = list(legs.items())[:free]
+    for key, (start, end) in list(legs.items())[free:]:
+        cache[key] = (None, False, _abandoned_segment_meta(start, end))
+    futures = {
+        # Each worker gets its own scratch cache; results are merged below
+        pool.submit(_segment_route, start, end, routing_service, {}): key
+        for key, (start, end) in submitted
+    }
+    deadline = float(getattr(settings, 'ORS_SEGMENT_DEADLINE_SECONDS', 5))
+    done, not_done = wait(futures, timeout=deadline) if futures else (set(), set())
+
+    for future in done:
+        key = futures[future]
+        try:
+            cache[key] = future.result()
+        except Exception:
+            cache[key] = (None, False, _fallback_segment_meta(*legs[key]))
+    for future in not_done:
+        if not future.cancel():
+            _abandon_segment_call(future)
+        key = futures[future]
+        cache[key] = (None, False, _abandoned_segment_meta(*legs[key]))
+    return len(legs) - len(done)
+
+
 def _build_route_polyline(
     start_coord: Optional[Tuple[float, float]],
-    stops: List[BookingStop]
+    stops: List[BookingStop],
+    segment_cache: Optional[Dict[Tuple[float, float, float, float], Tuple[Optional[List[List[float]]], bool, Dict[str, float]]]] = None,
 ) -> Tuple[List[List[float]], bool, List[Dict[str, object]]]:
-    """Construct a polyline for the full itinerary using ORS routes when possible."""
+    """Construct a polyline for the full itinerary using ORS routes when possible.
+
+    `segment_cache` carries routed legs between calls; on return it only holds
+    the legs of this itinerary.
+    """
 
     polyline: List[List[float]] = []
     used_precise_route = False
@@ -282,7 +483,16 @@ def _build_route_polyline(
     except Exception:
         routing_service = None
 
-    segment_cache: Dict[Tuple[float, float, float, float], Tuple[Optional[List[List[float]]], bool, Dict[str, float]]] = {}
+    if segment_cache is None:
+        segment_cache = {}
+    used_keys = set()
+
+    if routing_service is not None:
+        path = ([start_coord] if start_coord else []) + [
+            coord for coord in (_stop_coordinates(stop) for stop in stops) if coord is not None
+        ]
+        if not _prefetch_segments(routing_service, path, segment_cache):
+            _route_segments_concurrently(routing_service, path, segment_cache)
 
     previous_coord = start_coord if start_coord else None
     if start_coord:
@@ -299,6 +509,7 @@ def _build_route_polyline(
             previous_coord = next_coord
             continue
 
+        used_keys.add(_segment_key(previous_coord, next_coord))
         segment, precise, meta = _segment_route(previous_coord, next_coord, routing_service, segment_cache)
         used_precise_route = used_precise_route or precise
         segment_points: Optional[List[List[float]]] = None
@@ -326,6 +537,7 @@ def _build_route_polyline(
                 'stopId': str(stop.stop_uid),
                 'distanceKm': float(meta.get('distanceKm', 0.0)),
                 'durationSec': float(meta.get('durationSec', 0.0)),
+                'abandoned': bool(meta.get('abandoned')),
             })
 
         previous_coord = next_coord
@@ -333,22 +545,28 @@ def _build_route_polyline(
     if not polyline and start_coord:
         _append_unique_point(polyline, start_coord[0], start_coord[1])
 
+    for key in set(segment_cache) - used_keys:
+        del segment_cache[key]
+
     return polyline, used_precise_route, segments
 
 
-def plan_driver_stops(driver_user) -> List[BookingStop]:
-    """
-    Generate an optimized ordered list of stops for the driver's active bookings.
-    Uses a greedy algorithm that considers complete trips (pickup + dropoff together)
-    to minimize total travel distance.
+def order_driver_stops(
+    stops: List[BookingStop],
+    start_location: Optional[Tuple[float, float]] = None,
+    capacity: Optional[int] = None,
+    cost_matrix: Optional[sequencing.CostMatrix] = None,
+    previous_order: Optional[List[int]] = None,
+) -> List[BookingStop]:
     """
-    stops = list(
-        BookingStop.objects.filter(
-            booking__driver=driver_user,
-            booking__status__in=['accepted', 'on_the_way', 'started']
-        ).select_related('booking')
-    )
+    Order a driver's stops without touching them or the database.
+    Completed stops come first in completion order; pending stops are
+    sequenced by `sequencing.solve` (pickup before drop-off, at most
+    `capacity` passengers on board, shortest total route).
 
+    With `previous_order` (stop ids from an earlier plan) the known stops keep
+    their order and only stops it has not seen are inserted.
+    """
     if not stops:
         return []
 
@@ -362,13 +580,6 @@ def plan_driver_stops(driver_user) -> List[BookingStop]:
 
     order: List[BookingStop] = ordered_completed.copy()
 
-    # Track which pickups have been completed
-    completed_pickups = {
-        stop.booking_id
-        for stop in ordered_completed
-        if stop.stop_type == 'PICKUP'
-    }
-
     current_location = None
     if ordered_completed:
         for completed_stop in reversed(ordered_completed):
@@ -377,145 +588,138 @@ def plan_driver_stops(driver_user) -> List[BookingStop]:
                 current_location = coord
                 break
     if current_location is None:
-        current_location = _driver_start_location(driver_user)
-
-    # Group pending stops by booking
-    pending_by_booking = {}
-    for stop in pending:
-        if stop.booking_id not in pending_by_booking:
-            pending_by_booking[stop.booking_id] = {'pickup': None, 'dropoff': None}
-        if stop.stop_type == 'PICKUP':
-            pending_by_booking[stop.booking_id]['pickup'] = stop
-        else:
-            pending_by_booking[stop.booking_id]['dropoff'] = stop
+        current_location = start_location
 
-    # Separate bookings that still need pickup vs those already picked up
-    needs_pickup = []
-    needs_dropoff_only = []
-    
-    for booking_id, pair in pending_by_booking.items():
-        if booking_id in completed_pickups:
-            # Already picked up, just need dropoff
-            if pair['dropoff']:
-                needs_dropoff_only.append(pair['dropoff'])
-        else:
-            # Still needs pickup
-            if pair['pickup']:
-                needs_pickup.append(pair)
-
-    # Optimize route using greedy nearest-neighbor with trip completion preference
-    pending_pickups = []
-    pickup_dropoff_map: Dict[int, BookingStop] = {}
-    for pair in needs_pickup:
-        pickup = pair.get('pickup')
-        dropoff = pair.get('dropoff')
-        if pickup:
-            pending_pickups.append(pickup)
-            if dropoff:
-                pickup_dropoff_map[pickup.booking_id] = dropoff
-
-    dropoff_lookup = {stop.booking_id: stop for stop in needs_dropoff_only if stop}
-    pending_dropoffs = [stop for stop in needs_dropoff_only if stop]
-
-    planned_pickups: Set[int] = set()
-
-    while pending_pickups or pending_dropoffs:
-        candidates: List[Tuple[str, BookingStop, float, Optional[Tuple[float, float]]]] = []
-
-        for pickup in list(pending_pickups):
-            pickup_coord = _stop_coordinates(pickup)
-            if pickup_coord is None:
-                continue
-
-            if current_location:
-                distance = calculate_distance(
-                    current_location[0], current_location[1],
-                    pickup_coord[0], pickup_coord[1]
-                )
-            else:
-                distance = 0.0
-
-            candidates.append(('pickup', pickup, distance, pickup_coord))
-
-        # Allow drop-offs only when their pickup is either completed or already planned in this pass
-        available_dropoffs = [
-            stop for stop in pending_dropoffs
-            if stop.booking_id in completed_pickups or stop.booking_id in planned_pickups
-        ]
+    # A booking whose pending stops lack coordinates cannot be placed; keep it whole at the end
+    unlocated_bookings = {s.booking_id for s in pending if _stop_coordinates(s) is None}
+    to_solve = sorted(
+        (s for s in pending if s.booking_id not in unlocated_bookings),
+        key=lambda s: (s.sequence, s.id),
+    )
+    unlocated = sorted(
+        (s for s in pending if s.booking_id in unlocated_bookings),
+        key=lambda s: (s.booking_id, s.stop_type != 'PICKUP', s.id),
+    )
 
-        for dropoff in available_dropoffs:
-            dropoff_coord = _stop_coordinates(dropoff)
-            if dropoff_coord is None:
-                continue
-
-            if current_location:
-                distance = calculate_distance(
-                    current_location[0], current_location[1],
-                    dropoff_coord[0], dropoff_coord[1]
-                )
-            else:
-                distance = 0.0
-
-            # Slightly prioritize drop-offs when distances are similar to clear passengers fast
-            adjusted_distance = distance * 0.9
-            candidates.append(('dropoff', dropoff, adjusted_distance, dropoff_coord))
-
-        if not candidates:
-            # No coordinate data for remaining stops; append them in arbitrary order to avoid stalling
-            for pickup in pending_pickups:
-                order.append(pickup)
-            for dropoff in pending_dropoffs:
-                if dropoff not in order:
-                    order.append(dropoff)
-            break
-
-        candidates.sort(key=lambda item: item[2])
-        best_type, best_stop, _, best_coord = candidates[0]
-
-        if best_type == 'pickup':
-            order.append(best_stop)
-            if best_stop in pending_pickups:
-                pending_pickups.remove(best_stop)
-            completed_pickups.add(best_stop.booking_id)
-            planned_pickups.add(best_stop.booking_id)
-
-            dropoff = dropoff_lookup.get(best_stop.booking_id) or pickup_dropoff_map.get(best_stop.booking_id)
-            if dropoff:
-                dropoff_lookup.setdefault(best_stop.booking_id, dropoff)
-                if dropoff not in pending_dropoffs:
-                    pending_dropoffs.append(dropoff)
-
-            if best_coord:
-                current_location = best_coord
-        else:
-            order.append(best_stop)
-            try:
-                pending_dropoffs.remove(best_stop)
-            except ValueError:
-                pending_dropoffs = [d for d in pending_dropoffs if d.id != best_stop.id]
+    # Drop-offs whose pickup is done count as passengers already on board
+    solver_stops = [
+        sequencing.SequenceStop(
+            _stop_coordinates(s),
+            s.stop_type,
+            s.booking_id,
+            int(s.passenger_count or 1),
+        )
+        for s in to_solve
+    ]
+    index_of = {s.id: i for i, s in enumerate(to_solve)}
+    kept = [index_of[stop_id] for stop_id in previous_order or () if stop_id in index_of]
+    if kept:
+        kept_set = set(kept)
+        route = sequencing.insert(
+            solver_stops,
+            kept,
+            [i for i in range(len(to_solve)) if i not in kept_set],
+            start=current_location,
+            capacity=capacity,
+            cost_matrix=cost_matrix,
+        )
+    else:
+        route = sequencing.solve(
+            solver_stops,
+            start=current_location,
+            capacity=capacity,
+            cost_matrix=cost_matrix,
+        )
+    order.extend(to_solve[i] for i in route)
+    order.extend(unlocated)
+
+    return order
 
-            if best_coord:
-                current_location = best_coord
 
-    # Update sequences and statuses
+def apply_stop_order(order: List[BookingStop]) -> List[BookingStop]:
+    """
+    Set sequence and CURRENT/UPCOMING status on the in-memory stops to match `order`.
+    Returns the stops whose values actually changed.
+    """
+    changed = []
     first_incomplete_found = False
     for idx, stop in enumerate(order, start=1):
-        updates = []
+        dirty = False
         if stop.sequence != idx:
             stop.sequence = idx
-            updates.append('sequence')
+            dirty = True
 
         if stop.status != 'COMPLETED':
             desired_status = 'CURRENT' if not first_incomplete_found else 'UPCOMING'
             if stop.status != desired_status:
                 stop.status = desired_status
-                updates.append('status')
+                dirty = True
             first_incomplete_found = True
 
-        if updates:
-            update_fields = list(set(updates + ['updated_at']))
-            stop.save(update_fields=update_fields)
+        if dirty:
+            changed.append(stop)
+    return changed
+
+
+def save_stop_order(changed: List[BookingStop]) -> int:
+    """Write changed stop sequences/statuses in a single bulk update."""
+    if not changed:
+        return 0
+    now = timezone.now()
+    for stop in changed:
+        # bulk_update bypasses auto_now
+        stop.updated_at = now
+    booking_ids = {stop.booking_id for stop in changed}
+    driver_ids = {stop.booking.driver_id for stop in changed} - {None}
+    with transaction.atomic():
+        BookingStop.objects.bulk_update(changed, ['sequence', 'status', 'updated_at'])
+        # bulk_update sends no post_save, so retire cached route_info/itineraries here.
+        # Every open booking of the driver shares the itinerary, not just the changed ones.
+        cache_versions.bump_on_commit(cache_versions.BOOKING, *booking_ids)
+        cache_versions.bump_on_commit(cache_versions.DRIVER, *driver_ids)
+        for driver_id in driver_ids:
+            transaction.on_commit(lambda driver_id=driver_id: cache_versions.bump_driver_bookings(driver_id))
+    return len(changed)
+
+
+def plan_driver_stops(
+    driver_user,
+    persist: bool = True,
+    cost_matrix: Optional[sequencing.CostMatrix] = None,
+) -> List[BookingStop]:
+    """
+    Generate the ordered list of stops for the driver's active bookings.
+    The cached order from itinerary_state is reused and only new stops are
+    inserted; a full solve happens when there is none.
+    With persist=False (read-only requests) the plan is only applied in memory.
+    Stops are ordered by road travel time (road_time_matrix) unless another
+    `cost_matrix` is given.
+    """
+    stops = list(
+        BookingStop.objects.filter(
+            booking__driver=driver_user,
+            booking__status__in=['accepted', 'on_the_way', 'started']
+        ).select_related('booking')
+    )
 
+    if not stops:
+        itinerary_state.forget(driver_user.id)
+        return []
+
+    cached = itinerary_state.get_order(driver_user.id)
+    order = order_driver_stops(
+        stops,
+        _driver_start_location(driver_user),
+        capacity=_driver_capacity(driver_user),
+        cost_matrix=cost_matrix or road_time_matrix,
+        previous_order=[stop_id for stop_id, _ in cached] if cached else None,
+    )
+    pending = [(s.id, s.booking_id) for s in order if s.status != 'COMPLETED']
+    if pending != cached:
+        itinerary_state.store_order(driver_user.id, pending)
+    changed = apply_stop_order(order)
+    if persist:
+        save_stop_order(changed)
     return order
 
 
@@ -557,11 +761,14 @@ def _format_currency(value: Optional[Decimal]) -> Optional[str]:
         return None
 
 
-def build_driver_itinerary(driver_user) -> Dict[str, object]:
-    """Construct the itinerary payload for the given driver."""
+def build_driver_itinerary(driver_user, persist: bool = False) -> Dict[str, object]:
+    """Construct the itinerary payload for the given driver.
+
+    Read-only by default; pass persist=True to also save the planned stop order.
+    """
     driver_profile = Driver.objects.filter(user=driver_user).first()
     driver_status = getattr(driver_profile, 'status', 'Offline')
-    ordered_stops = plan_driver_stops(driver_user)
+    ordered_stops = plan_driver_stops(driver_user, persist=persist)
 
     if not ordered_stops:
         return {
@@ -654,7 +861,15 @@ def build_driver_itinerary(driver_user) -> Dict[str, object]:
         current_stop_index = next((i for i, stop in enumerate(ordered_stops) if stop.status != 'COMPLETED'), len(ordered_stops) - 1)
 
     start_coord = _driver_start_location(driver_user)
-    polyline, has_precise_route, segment_routes = _build_route_polyline(start_coord, ordered_stops)
+    segment_cache = itinerary_state.get_segments(driver_user.id)
+    known_segments = set(segment_cache)
+    polyline, has_precise_route, segment_routes = _build_route_polyline(start_coord, ordered_stops, segment_cache)
+    if set(segment_cache) != known_segments:
+        # Fallback legs are retried on the next read rather than remembered
+        itinerary_state.store_segments(
+            driver_user.id,
+            {key: value for key, value in segment_cache.items() if value[0] is not None},
+        )
 
     stop_status_lookup = {stop['stopId']: stop.get('status', 'UPCOMING') for stop in stops_payload}
     total_distance_km = 0.0
@@ -742,7 +957,7 @@ def build_driver_itinerary(driver_user) -> Dict[str, object]:
         booking_summaries.append({
             'bookingId': booking_id,
             'status': booking.status,
-            'passengerName': booking.passenger.get_full_name() or booking.ripassenger.username,
+            'passengerName': booking.passenger.get_full_name() or booking.passenger.username,
             'fare': float(quantized) if quantized is not None else (float(fare_decimal) if fare_decimal is not None else None),
             'fareDisplay': fare_display,
             'passengers': booking_passengers.get(booking_id, int(getattr(booking, 'passengers', 1) or 1)),
@@ -770,6 +985,10 @@ def build_driver_itinerary(driver_user) -> Dict[str, object]:
         'totalDurationSec': total_duration_sec,
         'remainingDistanceKm': remaining_distance_km,
         'remainingDurationSec': remaining_duration_sec,
+        # ORS circuit breaker is open: legs and ETAs are straight-line estimates
+        'routingDegraded': RoutingService().degraded,
+        # Legs estimated because their ORS call missed the deadline or found no free worker
+        'abandonedSegmentCalls': sum(1 for segment in segment_routes if segment.get('abandoned')),
     }
 
     return {
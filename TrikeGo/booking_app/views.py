@@ -6,7 +6,6 @@ from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse, HttpResponseForbidden
 from django.utils import timezone
-from django.core.cache import cache
 from .forms import BookingForm
 from .models import Booking
 from user_app.models import CustomUser
@@ -63,9 +62,6 @@ def cancel_booking(request, booking_id):
         return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
 
     if booking.status in ['pending', 'accepted', 'on_the_way']:
-        old_status = booking.status
-        old_driver_id = booking.driver_id
-        
         if request.user == booking.passenger:
             # When passenger cancels, just revert to pending and clear driver assignment
             booking.status = 'pending'
@@ -74,21 +70,9 @@ def cancel_booking(request, booking_id):
             # When driver cancels, revert to pending so another driver can accept
             booking.status = 'pending'
             booking.driver = None
+        # Cached route_info is retired by the Booking post_save handler
         booking.save()
         
-        # Clear all possible cache entries for this booking
-        cache_keys = [
-            f'route_info_{booking_id}_{old_status}_{old_driver_id or "none"}',
-            f'route_info_{booking_id}_pending_none',
-            f'route_info_{booking_id}_accepted_{old_driver_id or "none"}',
-            f'route_info_{booking_id}_on_the_way_{old_driver_id or "none"}',
-        ]
-        for key in cache_keys:
-            try:
-                cache.delete(key)
-            except Exception:
-                pass
-        
         return JsonResponse({'status': 'success', 'message': 'Booking cancelled successfully.'})
     else:
         return JsonResponse({'status': 'error', 'message': 'This booking can no longer be cancelled.'}, status=400)
@@ -0,0 +1,132 @@
+"""Precomputed travel times and road distances between service-area zones.
+
+Zones are geohash cells at ZONE_TABLE_PRECISION. The busiest pickup and
+destination cells of recent bookings are routed against each other with one
+matrix request (see `refresh_table`, run by Celery beat every
+ZONE_TABLE_REFRESH_SECONDS) and the table is kept in the cache.
+
+`quote` turns a table entry into a distance/duration estimate for a trip
+without network I/O, so fare estimates do not wait on ORS. The zone pair's
+road distance is scaled by how much longer or shorter the trip's straight line
+is than the line between the two cell centres. Trips within one zone, or
+between zones not in the table, get no quote and callers route them as before.
+"""
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .geo import haversine_km
+from .services import RoutingService
+from .spatial import geohash_bounds, geohash_encode
+
+logger = logging.getLogger(__name__)
+
+TABLE_KEY = 'zone_travel_table'
+
+# Below this the points count as "too close" and calculate_route answers them
+MIN_TRIP_METERS = 50
+
+Point = Tuple[float, float]
+
+
+def _precision() -> int:
+    return int(getattr(settings, 'ZONE_TABLE_PRECISION', 6))
+
+
+def zone_centroid(cell: str) -> Point:
+    south, west, north, east = geohash_bounds(cell)
+    return (south + north) / 2, (west + east) / 2
+
+
+def busiest_zones(limit: Optional[int] = None, precision: Optional[int] = None) -> List[str]:
+    """Most used pickup/destination cells of bookings in the last ZONE_TABLE_LOOKBACK_DAYS."""
+    from .models import Booking
+
+    limit = int(limit if limit is not None else getattr(settings, 'ZONE_TABLE_MAX_ZONES', 40))
+    precision = precision or _precision()
+    since = timezone.now() - timedelta(days=int(getattr(settings, 'ZONE_TABLE_LOOKBACK_DAYS', 30)))
+    rows = Booking.objects.filter(booking_time__gte=since).values_list(
+        'pickup_latitude', 'pickup_longitude', 'destination_latitude', 'destination_longitude',
+    )
+    counts: Counter = Counter()
+    for p_lat, p_lon, d_lat, d_lon in rows.iterator():
+        for lat, lon in ((p_lat, p_lon), (d_lat, d_lon)):
+            if lat is not None and lon is not None:
+                counts[geohash_encode(float(lat), float(lon), precision)] += 1
+    return [cell for cell, _ in counts.most_common(limit)]
+
+
+def refresh_table(zones: Optional[List[str]] = None) -> int:
+    """Route every zone pair with one matrix request and cache the table. Returns the zone count."""
+    zones = list(zones) if zones is not None else busiest_zones()
+    if len(zones) < 2:
+        return 0
+    centroids = [zone_centroid(cell) for cell in zones]
+    matrix = RoutingService().travel_matrix([(lon, lat) for lat, lon in centroids])
+    if matrix is None:
+        logger.warning('Zone table refresh failed; keeping the previous table')
+        return 0
+
+    table = {
+        'precision': len(zones[0]),
+        'zones': zones,
+        'durations': matrix['durations'],
+        'distances': matrix['distances'],
+        'built_at': time.time(),
+    }
+    # Kept until the next successful refresh replaces it
+    cache.set(TABLE_KEY, table, timeout=None)
+    return len(zones)
+
+
+def get_table() -> Optional[Dict[str, object]]:
+    try:
+        return cache.get(TABLE_KEY)
+    except Exception:
+        return None
+
+
+def quote(pickup: Point, destination: Point) -> Optional[Dict[str, object]]:
+    """Estimated road distance (km) and duration (seconds) between two (lat, lon) points.
+
+    Returns a dict shaped like `RoutingService.calculate_route` results (without
+    route_data) and flagged 'estimated', or None when the table cannot answer.
+    """
+    table = get_table()
+    if not table:
+        return None
+    p_lat, p_lon = float(pickup[0]), float(pickup[1])
+    d_lat, d_lon = float(destination[0]), float(destination[1])
+    straight_km = haversine_km(p_lat, p_lon, d_lat, d_lon)
+    if straight_km * 1000 < MIN_TRIP_METERS:
+        return None
+
+    precision = table['precision']
+    origin = geohash_encode(p_lat, p_lon, precision)
+    target = geohash_encode(d_lat, d_lon, precision)
+    if origin == target:
+        return None
+    index = {cell: i for i, cell in enumerate(table['zones'])}
+    if origin not in index or target not in index:
+        return None
+    i, j = index[origin], index[target]
+    zone_km = table['distances'][i][j]
+    zone_seconds = table['durations'][i][j]
+    if zone_km is None or zone_seconds is None:
+        return None
+
+    centroid_km = haversine_km(*zone_centroid(origin), *zone_centroid(target))
+    scale = straight_km / centroid_km if centroid_km > 0 else 1.0
+    return {
+        'route_data': None,
+        'distance': round(zone_km * scale, 2),
+        'duration': int(zone_seconds * scale),
+        'too_close': False,
+        'estimated': True,
+    }
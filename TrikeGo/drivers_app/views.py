@@ -1,3 +1,4 @@
+import base64
 from datetime import timedelta
 from decimal import Decimal
 
@@ -7,10 +8,11 @@ import json
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
 from django.core.mail import mail_admins
+from django.db.models import Q
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
@@ -18,9 +20,17 @@ from django.views.decorators.http import require_GET, require_POST, require_http
 import os
 from supabase import create_client
 
-from booking_app.models import Booking, DriverLocation
+from booking_app import cache_versions, itinerary_stream, locations, realtime, spatial
+from booking_app.models import Booking, BookingStop
 from booking_app.services import RoutingService
-from booking_app.utils import ensure_booking_stops, pickup_within_detour, seats_available
+from booking_app.utils import (
+    calculate_distance,
+    ensure_booking_stops,
+    insertion_detour_km,
+    pickup_within_detour,
+    plan_driver_stops,
+    seats_available,
+)
 from drivers_app.forms import TricycleForm
 from user_app.models import Driver, Passenger
 try:
@@ -56,6 +66,11 @@ def _ensure_driver(request):
     return True
 
 
+def _driver_coordinates(user):
+    """Return the driver's last known (lat, lon), or None."""
+    return locations.get_coordinates(user.id)
+
+
 def _wants_json(request):
     accept = request.headers.get('Accept', '')
     return request.headers.get('x-requested-with') == 'XMLHttpRequest' or 'application/json' in accept.lower()
@@ -244,27 +259,30 @@ def accept_ride(request, booking_id):
     Driver.objects.filter(user=request.user).update(status='In_trip')
     Passenger.objects.filter(user=booking.passenger).update(status='In_trip')
 
-    try:
-        driver_location = DriverLocation.objects.get(driver=request.user)
-        routing_service = RoutingService()
+    driver_location = locations.get_location(request.user.id)
+    if driver_location is None:
+        messages.warning(request, 'Please enable location sharing to see route information.')
+    else:
+        try:
+            routing_service = RoutingService()
 
-        start_coords = (float(driver_location.longitude), float(driver_location.latitude))
-        pickup_coords = (float(booking.pickup_longitude), float(booking.pickup_latitude))
+            start_coords = (float(driver_location.longitude), float(driver_location.latitude))
+            pickup_coords = (float(booking.pickup_longitude), float(booking.pickup_latitude))
 
-        route_info = routing_service.calculate_route(start_coords, pickup_coords)
+            route_info = routing_service.calculate_route(start_coords, pickup_coords)
 
-        if route_info: 
-            routing_service.save_route_snapshot(booking, route_info)
-            booking.estimated_distance = Decimal(str(route_info['distance']))
-            booking.estimated_duration = route_info['duration'] // 60
-            booking.estimated_arrival = timezone.now() + timedelta(seconds=route_info['duration'])
-    except DriverLocation.DoesNotExist:
-        messages.warning(request, 'Please enable location sharing to see route information.')
-    except Exception as exc:
-        messages.warning(request, f'Could not calculate route: {exc}')
+            if route_info: 
+                routing_service.save_route_snapshot(booking, route_info)
+                booking.estimated_distance = Decimal(str(route_info['distance']))
+                booking.estimated_duration = route_info['duration'] // 60
+                booking.estimated_arrival = timezone.now() + timedelta(seconds=route_info['duration'])
+        except Exception as exc:
+            messages.warning(request, f'Could not calculate route: {exc}')
 
     booking.save()
-    ensure_booking_stops(booking)
+    if not ensure_booking_stops(booking):
+        # Stops left over from an earlier acceptance: slot them into this driver's order
+        plan_driver_stops(request.user)
     messages.success(
         request,
         f"You have accepted the ride from {booking.pickup_address} to {booking.destination_address}.",
@@ -285,6 +303,7 @@ def accept_ride(request, booking_id):
                 'fare': float(booking.fare) if booking.fare is not None else None,
                 'payment_verified': booking.payment_verified,
             },
+            'routing_degraded': RoutingService().degraded,
         })
     # Push notification: inform the passenger that a driver accepted
     try:
@@ -495,6 +514,8 @@ def toggle_driver_status(request):
 
         driver.status = new_status
         driver.save(update_fields=['status'])
+        if new_status == 'Offline':
+            spatial.remove_driver(request.user.id)
 
         # Mirror to Supabase status table for realtime clients
         try:
@@ -567,49 +588,174 @@ def get_driver_trip_history(request):
     })
 
 
+AVAILABLE_RIDES_PAGE_SIZE = 30
+AVAILABLE_RIDES_MAX_PAGE_SIZE = 50
+# Upper bound on candidates scored per request in proximity mode
+AVAILABLE_RIDES_RANK_CANDIDATES = 200
+
+
+def _encode_cursor(payload):
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def _driver_route_points(user, driver_coord):
+    """Driver position followed by the coordinates of their remaining itinerary stops."""
+    route = [driver_coord]
+    stops = BookingStop.objects.filter(
+        booking__driver=user,
+        booking__status__in=ACTIVE_BOOKING_STATUSES,
+    ).exclude(status='COMPLETED').order_by('sequence', 'id').values_list('latitude', 'longitude')
+    for lat, lon in stops:
+        if lat is not None and lon is not None:
+            route.append((float(lat), float(lon)))
+    return route
+
+
+def _serialize_available_ride(booking):
+    try:
+        passenger_name = booking.passenger.get_full_name().strip() or booking.passenger.username
+    except Exception:
+        passenger_name = 'Passenger'
+
+    fare = float(booking.fare) if booking.fare is not None else None
+    discount = float(booking.discount_amount) if booking.discount_amount else 0
+    return {
+        'id': booking.id,
+        'status': booking.status,
+        'booking_time': booking.booking_time.isoformat() if booking.booking_time else None,
+        'updated_at': booking.booking_time.isoformat() if booking.booking_time else None,
+        'pickup_address': booking.pickup_address,
+        'destination_address': booking.destination_address,
+        'passengers': booking.passengers or 1,
+        'fare': fare,
+        'fare_display': f"₱{booking.fare:.2f}" if booking.fare is not None else None,
+        'estimated_distance_km': float(booking.estimated_distance) if booking.estimated_distance is not None else None,
+        'estimated_duration_min': booking.estimated_duration,
+        'passenger_name': passenger_name,
+        'original_fare': (fare + discount) if fare is not None else None,
+        'discount_code': booking.discount_code.code if booking.discount_code else None,
+        'discount_amount': discount,
+    }
+
+
 @login_required
 @require_GET
 def available_rides_api(request):
+    """Pending rides for the driver, oldest first or ranked by proximity.
+
+    Query params: `sort` (`time` or `proximity`), `radius_km`, `limit` and the
+    opaque `cursor` returned as `next_cursor` by the previous page.
+    """
     if not _ensure_driver(request):
         return JsonResponse({'status': 'error', 'message': 'Driver only'}, status=403)
 
-    rides = []
-    pending_bookings = (
-        Booking.objects.filter(status='pending', driver__isnull=True)
-        .select_related('passenger')
-        .order_by('booking_time')[:30]
-    )
+    pending_bookings = Booking.objects.filter(status='pending', driver__isnull=True)
+
+    try:
+        limit = int(request.GET.get('limit', AVAILABLE_RIDES_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = AVAILABLE_RIDES_PAGE_SIZE
+    limit = max(1, min(limit, AVAILABLE_RIDES_MAX_PAGE_SIZE))
+    sort = request.GET.get('sort', 'time')
+    cursor = _decode_cursor(request.GET.get('cursor'))
+
+    # Only list pickups near the driver when we know where they are
+    try:
+        radius_km = float(request.GET.get('radius_km', settings.AVAILABLE_RIDES_RADIUS_KM))
+    except (TypeError, ValueError):
+        radius_km = settings.AVAILABLE_RIDES_RADIUS_KM
+    driver_coord = _driver_coordinates(request.user)
+    pickup_distances = {}
+    if driver_coord and radius_km > 0:
+        nearby = spatial.pending_pickups_near(driver_coord[0], driver_coord[1], radius_km)
+        if nearby is not None:
+            pickup_distances = dict(nearby)
+            pending_bookings = pending_bookings.filter(id__in=list(pickup_distances))
+
+    pending_bookings = pending_bookings.select_related('passenger', 'discount_code')
 
     import logging
     logger = logging.getLogger(__name__)
-    logger.info(f'Available rides API called by {request.user.username}, found {pending_bookings.count()} pending bookings')
 
-    for booking in pending_bookings:
-        try:
-            passenger_name = booking.passenger.get_full_name().strip() or booking.passenger.username
-        except Exception:
-            passenger_name = 'Passenger'
-
-        ride_data = {
-            'id': booking.id,
-            'status': booking.status,
-            'booking_time': booking.booking_time.isoformat() if booking.booking_time else None,
-            'updated_at': booking.booking_time.isoformat() if booking.booking_time else None,
-            'pickup_address': booking.pickup_address,
-            'destination_address': booking.destination_address,
-            'passengers': booking.passengers or 1,
-            'fare': float(booking.fare) if booking.fare is not None else None,
-            'fare_display': f"₱{booking.fare:.2f}" if booking.fare is not None else None,
-            'estimated_distance_km': float(booking.estimated_distance) if booking.estimated_distance is not None else None,
-            'estimated_duration_min': booking.estimated_duration,
-            'passenger_name': passenger_name,
-            'original_fare': float((booking.fare + booking.discount_amount)) if booking.discount_amount else float(booking.fare),
-            'discount_code': booking.discount_code.code if booking.discount_code else None,
-            'discount_amount': float(booking.discount_amount) if booking.discount_amount else 0,
-        }
-        rides.append(ride_data)
+    if sort == 'proximity' and driver_coord:
+        # Rank by the extra distance each pickup adds to the driver's current itinerary
+        route = _driver_route_points(request.user, driver_coord)
+        candidates = pending_bookings.order_by('booking_time', 'id')[:AVAILABLE_RIDES_RANK_CANDIDATES]
+        scored = []
+        for booking in candidates:
+            if booking.pickup_latitude is None or booking.pickup_longitude is None:
+                continue
+            pickup = (float(booking.pickup_latitude), float(booking.pickup_longitude))
+            dropoff = None
+            if booking.destination_latitude is not None and booking.destination_longitude is not None:
+                dropoff = (float(booking.destination_latitude), float(booking.destination_longitude))
+            detour = round(insertion_detour_km(route, pickup, dropoff), 3)
+            pickup_km = pickup_distances.get(booking.id)
+            if pickup_km is None:
+                pickup_km = calculate_distance(driver_coord[0], driver_coord[1], pickup[0], pickup[1])
+            scored.append((detour, round(pickup_km, 3), booking.id, booking))
+        scored.sort(key=lambda item: item[:3])
+
+        if cursor and 'score' in cursor and 'id' in cursor:
+            after = (float(cursor['score']), float(cursor.get('dist', 0)), int(cursor['id']))
+            scored = [item for item in scored if item[:3] > after]
+
+        page = scored[:limit]
+        has_more = len(scored) > limit
+        rides = []
+        for detour, pickup_km, _, booking in page:
+            ride_data = _serialize_available_ride(booking)
+            ride_data['detour_km'] = detour
+            ride_data['pickup_distance_km'] = pickup_km
+            rides.append(ride_data)
+        next_cursor = None
+        if has_more and page:
+            last = page[-1]
+            next_cursor = _encode_cursor({'score': last[0], 'dist': last[1], 'id': last[2]})
+        sort = 'proximity'
+    else:
+        # Keyset pagination on (booking_time, id) keeps pages stable as new rides arrive
+        if cursor and cursor.get('t') and cursor.get('id') is not None:
+            after_time = parse_datetime(cursor['t'])
+            if after_time is not None:
+                pending_bookings = pending_bookings.filter(
+                    Q(booking_time__gt=after_time) | Q(booking_time=after_time, id__gt=int(cursor['id']))
+                )
+        page = list(pending_bookings.order_by('booking_time', 'id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        rides = []
+        for booking in page:
+            ride_data = _serialize_available_ride(booking)
+            if booking.id in pickup_distances:
+                ride_data['pickup_distance_km'] = round(pickup_distances[booking.id], 3)
+            rides.append(ride_data)
+        next_cursor = None
+        if has_more and page and page[-1].booking_time:
+            next_cursor = _encode_cursor({'t': page[-1].booking_time.isoformat(), 'id': page[-1].id})
+        sort = 'time'
+
+    logger.info(f'Available rides API called by {request.user.username}, returning {len(rides)} pending bookings')
 
-    return JsonResponse({'status': 'success', 'rides': rides})
+    return JsonResponse({
+        'status': 'success',
+        'rides': rides,
+        'sort': sort,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    })
 
 
 @login_required
@@ -641,14 +787,9 @@ def driver_status(request):
             'hasActiveTrip': active_trip_exists,
             'desiredStatus': desired_status,
         }
-        try:
-            if driver_profile.current_latitude is not None and driver_profile.current_longitude is not None:
-                payload['currentLocation'] = {
-                    'lat': float(driver_profile.current_latitude),
-                    'lon': float(driver_profile.current_longitude),
-                }
-        except (TypeError, ValueError):
-            payload['currentLocation'] = None
+        coords = _driver_coordinates(request.user)
+        if coords:
+            payload['currentLocation'] = {'lat': coords[0], 'lon': coords[1]}
         return JsonResponse(payload)
 
     if request.content_type and 'application/json' in request.content_type.lower():
@@ -669,13 +810,12 @@ def driver_status(request):
         if active_trip_exists:
             return JsonResponse({'status': 'error', 'message': 'Finish or cancel your current trip before going offline.'}, status=400)
         driver_profile.status = 'Offline'
-        driver_profile.current_latitude = None
-        driver_profile.current_longitude = None
-        driver_profile.save(update_fields=['status', 'current_latitude', 'current_longitude'])
+        driver_profile.save(update_fields=['status'])
         try:
-            DriverLocation.objects.filter(driver=request.user).delete()
+            locations.clear_location(request.user.id)
         except Exception:
             pass
+        spatial.remove_driver(request.user.id)
         request.session['driver_desired_status'] = 'Offline'
         return JsonResponse({'status': 'success', 'driverStatus': 'Offline', 'hasActiveTrip': False})
 
@@ -695,14 +835,9 @@ def driver_status(request):
         'driverStatus': new_status,
         'hasActiveTrip': active_trip_exists,
     }
-    try:
-        if driver_profile.current_latitude is not None and driver_profile.current_longitude is not None:
-            response_payload['currentLocation'] = {
-                'lat': float(driver_profile.current_latitude),
-                'lon': float(driver_profile.current_longitude),
-            }
-    except (TypeError, ValueError):
-        pass
+    coords = _driver_coordinates(request.user)
+    if coords:
+        response_payload['currentLocation'] = {'lat': coords[0], 'lon': coords[1]}
     return JsonResponse(response_payload)
 
 
@@ -718,19 +853,12 @@ def update_driver_location(request):
         lat, lon = data.get('lat'), data.get('lon')
         if lat is None or lon is None:
             return JsonResponse({'status': 'error', 'message': 'Missing lat/lon.'}, status=400)
-        Driver.objects.filter(user=request.user).update(current_latitude=lat, current_longitude=lon)
+        fix = locations.record_location(request.user.id, lat, lon)
+        spatial.index_driver_location(request.user.id, lat, lon)
+        realtime.publish_driver_position(request.user.id, fix)
+        itinerary_stream.on_driver_moved(request.user.id, fix)
         try:
-            active_bookings = Booking.objects.filter(
-                driver=request.user,
-                status__in=['accepted', 'on_the_way', 'started'],
-            ).values('id', 'status', 'driver_id')
-            for entry in active_bookings:
-                bid = entry.get('id')
-                try:
-                    cache.delete(f'route_info_{bid}')
-                    cache.delete(f"route_info_{bid}_{entry.get('status')}_{entry.get('driver_id') or 'none'}")
-                except Exception:
-                    pass
+            cache_versions.bump_driver_bookings(request.user.id)
         except Exception:
             pass
         return JsonResponse({'status': 'success'})
@@ -748,12 +876,11 @@ def get_driver_location(request, booking_id):
         return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
     if not booking.driver:
         return JsonResponse({'status': 'error', 'message': 'No driver assigned yet.'}, status=404)
-    try:
-        driver_profile = Driver.objects.get(user=booking.driver)
-        return JsonResponse({
-            'status': 'success',
-            'lat': driver_profile.current_latitude,
-            'lon': driver_profile.current_longitude,
-        })
-    except Driver.DoesNotExist:
+    if not Driver.objects.filter(user=booking.driver).exists():
         return JsonResponse({'status': 'error', 'message': 'Driver profile not found.'}, status=404)
+    coords = locations.get_coordinates(booking.driver_id)
+    return JsonResponse({
+        'status': 'success',
+        'lat': coords[0] if coords else None,
+        'lon': coords[1] if coords else None,
+    })
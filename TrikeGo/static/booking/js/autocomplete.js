@@ -1,25 +1,14 @@
 (function () {
-    const DEFAULT_API_KEY = '5b3ce3597851110001cf62488c26abeb';
-
-    function resolveApiKey() {
-        const body = document.body;
-        if (body && body.dataset && body.dataset.orsApiKey) {
-            const trimmed = body.dataset.orsApiKey.trim();
-            if (trimmed.length > 0) {
-                return trimmed;
-            }
-        }
-        return DEFAULT_API_KEY;
-    }
+    // Suggestions come from the server, which caches them and shares one ORS quota
+    const AUTOCOMPLETE_URL = '/booking/api/geocode/autocomplete/';
 
     class ORSAutocomplete {
-        constructor(inputEl, resultsEl, hiddenLatId, hiddenLonId, apiKey) {
+        constructor(inputEl, resultsEl, hiddenLatId, hiddenLonId) {
             this.input = inputEl;
             this.results = resultsEl;
             this.hiddenLat = document.getElementById(hiddenLatId);
             this.hiddenLon = document.getElementById(hiddenLonId);
             this.timeout = null;
-            this.apiKey = apiKey;
             this.bind();
         }
 
@@ -38,7 +27,7 @@
                 this.showSearching();
                 this.timeout = window.setTimeout(() => {
                     this.search(query).catch((error) => {
-                        console.error('ORS autocomplete search failed:', error);
+                        console.error('Autocomplete search failed:', error);
                         this.results.innerHTML = '<div class="autocomplete-item">Unable to fetch suggestions.</div>';
                     });
                 }, 300);
@@ -63,16 +52,13 @@
             }
 
             const params = new URLSearchParams({
-                api_key: this.apiKey,
                 text: query,
-                size: '12',
-                'boundary.country': 'PH',
-                layers: 'address'
+                size: '12'
             });
 
-            const response = await fetch(`https://api.openrouteservice.org/geocode/search?${params.toString()}`);
+            const response = await fetch(`${AUTOCOMPLETE_URL}?${params.toString()}`, { credentials: 'same-origin' });
             if (!response.ok) {
-                throw new Error(`ORS response ${response.status}`);
+                throw new Error(`Autocomplete response ${response.status}`);
             }
 
             const data = await response.json();
@@ -142,17 +128,16 @@
     }
 
     document.addEventListener('DOMContentLoaded', () => {
-        const apiKey = resolveApiKey();
         const pickupInput = document.getElementById('pickup_location_input');
         const pickupResults = document.getElementById('pickup-results');
         const destinationInput = document.getElementById('destination_location_input');
         const destinationResults = document.getElementById('destination-results');
 
         if (pickupInput && pickupResults) {
-            new ORSAutocomplete(pickupInput, pickupResults, 'id_pickup_latitude', 'id_pickup_longitude', apiKey);
+            new ORSAutocomplete(pickupInput, pickupResults, 'id_pickup_latitude', 'id_pickup_longitude');
         }
         if (destinationInput && destinationResults) {
-            new ORSAutocomplete(destinationInput, destinationResults, 'id_destination_latitude', 'id_destination_longitude', apiKey);
+            new ORSAutocomplete(destinationInput, destinationResults, 'id_destination_latitude', 'id_destination_longitude');
         }
     });
 })();
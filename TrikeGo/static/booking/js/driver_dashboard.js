@@ -464,7 +464,9 @@
                 const durationVal = Number(ride.estimated_duration_min ?? ride.estimated_duration ?? NaN);
                 const distanceLabel = Number.isFinite(distanceVal) ? `Distance: ${distanceVal.toFixed(distanceVal >= 10 ? 1 : 2)} km` : '';
                 const etaLabel = Number.isFinite(durationVal) ? `ETA: ~${Math.max(1, Math.round(durationVal))} mins` : '';
-                const metaPieces = [distanceLabel, etaLabel].filter(Boolean);
+                const pickupKm = Number(ride.pickup_distance_km ?? NaN);
+                const pickupLabel = Number.isFinite(pickupKm) ? `Pickup: ${pickupKm.toFixed(pickupKm >= 10 ? 1 : 2)} km away` : '';
+                const metaPieces = [pickupLabel, distanceLabel, etaLabel].filter(Boolean);
 
                 const acceptUrl = buildAcceptRideUrl(ride.id);
                 const csrfToken = cfg.csrfToken || '';
@@ -520,7 +522,11 @@
             }
             driverRidesState.refreshing = true;
             try {
-                const response = await fetch(cfg.availableRidesEndpoint + (immediate ? '?t=' + Date.now() : ''), { credentials: 'same-origin' });
+                const params = new URLSearchParams({ sort: 'proximity' });
+                if (immediate) {
+                    params.set('t', Date.now());
+                }
+                const response = await fetch(`${cfg.availableRidesEndpoint}?${params.toString()}`, { credentials: 'same-origin' });
                 if (!response.ok) {
                     console.warn('Available rides fetch failed:', response.status, response.statusText);
                     return;
@@ -561,6 +567,8 @@
     let currentStopIndex = 0;
     let itineraryExpanded = false;
     let itineraryTimer = null;
+    let itinerarySocket = null;
+    let itinerarySocketRetry = 0;
     let itineraryMarkers = [];
     let itineraryRouteLayer = null;
     let itineraryRouteSignature = null;
@@ -826,7 +834,8 @@
         }
 
         fetchItineraryData();
-        itineraryTimer = setInterval(fetchItineraryData, 12000);
+        setItineraryPollInterval(12000);
+        connectItinerarySocket();
     }
 
     function toggleItinerary(expand) {
@@ -1523,6 +1532,60 @@
         return `${base}#${stopsSig}#${bookingsSig}`;
     }
 
+    function decodePolyline(encoded, precision = 5) {
+        const factor = Math.pow(10, precision);
+        const points = [];
+        let index = 0;
+        let lat = 0;
+        let lon = 0;
+        while (index < encoded.length) {
+            const deltas = [];
+            for (let i = 0; i < 2; i += 1) {
+                let shift = 0;
+                let result = 0;
+                let byte;
+                do {
+                    byte = encoded.charCodeAt(index++) - 63;
+                    result |= (byte & 0x1f) << shift;
+                    shift += 5;
+                } while (byte >= 0x20);
+                deltas.push(result & 1 ? ~(result >> 1) : result >> 1);
+            }
+            lat += deltas[0];
+            lon += deltas[1];
+            points.push([lat / factor, lon / factor]);
+        }
+        return points;
+    }
+
+    // Turn encoded lines and index-referenced legs back into the point arrays the map code reads
+    function expandItineraryGeometry(itinerary) {
+        if (!itinerary) return itinerary;
+        const precision = Number(itinerary.polylinePrecision) || 5;
+        const expand = (line) => (typeof line === 'string' ? decodePolyline(line, precision) : line);
+        const fullLine = expand(itinerary.fullRoutePolyline) || [];
+        const segments = Array.isArray(itinerary.fullRouteSegments)
+            ? itinerary.fullRouteSegments.map((seg) => {
+                if (Array.isArray(seg?.pointRange)) {
+                    const [first, last] = seg.pointRange;
+                    return { ...seg, points: fullLine.slice(first, last + 1) };
+                }
+                return seg && typeof seg.points === 'string' ? { ...seg, points: expand(seg.points) } : seg;
+            })
+            : itinerary.fullRouteSegments;
+        return { ...itinerary, fullRoutePolyline: fullLine, fullRouteSegments: segments };
+    }
+
+    function itineraryRequestUrl() {
+        const url = new URL(cfg.itineraryEndpoint, window.location.origin);
+        url.searchParams.set('geometry', 'polyline');
+        url.searchParams.set('segments', 'ref');
+        if (mapInstance && typeof mapInstance.getZoom === 'function') {
+            url.searchParams.set('zoom', String(mapInstance.getZoom()));
+        }
+        return url.toString();
+    }
+
     async function fetchItineraryData(options = {}) {
         if (!cfg.itineraryEndpoint) return;
         const forceLoader = Boolean(options.forceLoader);
@@ -1532,36 +1595,17 @@
             loaderShown = true;
         }
         try {
-            const response = await fetch(cfg.itineraryEndpoint, { credentials: 'same-origin' });
+            const response = await fetch(itineraryRequestUrl(), { credentials: 'same-origin' });
             if (!response.ok) {
                 throw new Error(`Status ${response.status}`);
             }
             const payload = await response.json();
-            if (payload && payload.driverStatus && typeof window.updateDriverAvailabilityUI === 'function') {
-                try {
-                    window.updateDriverAvailabilityUI(payload.driverStatus);
-                } catch (err) {
-                    console.warn('Driver availability sync failed', err);
-                }
-            }
             if (!payload || payload.status !== 'success') {
+                syncDriverStatus(payload && payload.driverStatus);
                 throw new Error('Invalid itinerary payload');
             }
-
-            const newSignature = computeItineraryStageSignature(payload.itinerary);
-            if (newSignature !== itineraryStageSignature) {
-                itineraryStageSignature = newSignature;
-                itineraryHasLoaded = false;
-                if (!loaderShown) {
-                    showRouteLoader(true);
-                    loaderShown = true;
-                }
-            }
-            itineraryData = payload.itinerary || null;
-            updateTrackingState();
-            renderItineraryUI();
-            if (!itineraryHasLoaded) {
-                itineraryHasLoaded = true;
+            if (applyItineraryPayload(payload, !loaderShown)) {
+                loaderShown = true;
             }
         } catch (err) {
             console.warn('Failed to fetch itinerary', err);
@@ -1572,6 +1616,96 @@
         }
     }
 
+    function syncDriverStatus(driverStatus) {
+        if (driverStatus && typeof window.updateDriverAvailabilityUI === 'function') {
+            try {
+                window.updateDriverAvailabilityUI(driverStatus);
+            } catch (err) {
+                console.warn('Driver availability sync failed', err);
+            }
+        }
+    }
+
+    // Returns true when it showed the route loader, which the caller must hide.
+    function applyItineraryPayload(payload, allowLoader) {
+        syncDriverStatus(payload.driverStatus);
+        let loaderShown = false;
+        const newSignature = computeItineraryStageSignature(payload.itinerary);
+        if (newSignature !== itineraryStageSignature) {
+            itineraryStageSignature = newSignature;
+            itineraryHasLoaded = false;
+            if (allowLoader) {
+                showRouteLoader(true);
+                loaderShown = true;
+            }
+        }
+        itineraryData = expandItineraryGeometry(payload.itinerary) || null;
+        updateTrackingState();
+        renderItineraryUI();
+        if (!itineraryHasLoaded) {
+            itineraryHasLoaded = true;
+        }
+        return loaderShown;
+    }
+
+    function applyItineraryMessage(data) {
+        if (!data) return;
+        let payload;
+        if (data.kind === 'snapshot') {
+            payload = data;
+        } else if (data.kind === 'diff') {
+            const itinerary = Object.assign({}, itineraryData || {}, data.changed || {});
+            (data.removed || []).forEach((key) => { delete itinerary[key]; });
+            payload = { status: 'success', driverStatus: data.driverStatus, itinerary };
+        } else {
+            return;
+        }
+        if (payload.status !== 'success') {
+            syncDriverStatus(payload.driverStatus);
+            return;
+        }
+        if (applyItineraryPayload(payload, true)) {
+            hideRouteLoader();
+        }
+    }
+
+    function setItineraryPollInterval(ms) {
+        if (itineraryTimer) clearInterval(itineraryTimer);
+        itineraryTimer = setInterval(fetchItineraryData, ms);
+    }
+
+    function connectItinerarySocket() {
+        if (!('WebSocket' in window)) return;
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        let socket;
+        try {
+            socket = new WebSocket(`${scheme}://${window.location.host}/ws/driver/itinerary/`);
+        } catch (err) {
+            return;
+        }
+        itinerarySocket = socket;
+
+        socket.onopen = () => {
+            itinerarySocketRetry = 0;
+            // Pushes carry the changes; polling only covers missed messages
+            setItineraryPollInterval(60000);
+        };
+        socket.onmessage = (evt) => {
+            let msg;
+            try { msg = JSON.parse(evt.data); } catch (err) { return; }
+            if (msg && msg.type === 'itinerary.update') {
+                applyItineraryMessage(msg.data);
+            }
+        };
+        socket.onclose = () => {
+            if (itinerarySocket !== socket) return;
+            itinerarySocket = null;
+            setItineraryPollInterval(12000);
+            itinerarySocketRetry = Math.min(itinerarySocketRetry + 1, 6);
+            setTimeout(connectItinerarySocket, 1000 * Math.pow(2, itinerarySocketRetry));
+        };
+    }
+
     function triggerEmergencyCall() {
         const telUri = 'tel:911';
         const skypeUri = 'skype:911?call';
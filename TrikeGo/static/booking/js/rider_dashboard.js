@@ -250,9 +250,10 @@
         }
         async search(query) {
             try {
-                const params = new URLSearchParams({ api_key: ORS_API_KEY, text: query, size: 10, 'boundary.country': 'PH' });
-                const url = `https://api.openrouteservice.org/geocode/search?${params.toString()}`;
-                const response = await fetch(url);
+                const params = new URLSearchParams({ text: query, size: 10 });
+                if (window.map) { try { const c = window.map.getCenter(); params.set('focus.lat', c.lat); params.set('focus.lon', c.lng); } catch(e){} }
+                const url = `/booking/api/geocode/autocomplete/?${params.toString()}`;
+                const response = await fetch(url, { credentials: 'same-origin' });
                 const data = await response.json();
                 let features = data.features || [];
                 try { if (window.map) { const center = window.map.getCenter(); features.forEach(f => { const [lon, lat] = f.geometry.coordinates; f.__distance = window.map.distance(center, L.latLng(lat, lon)); }); features.sort((a,b) => (a.__distance||0) - (b.__distance||0)); } } catch(e){}
@@ -527,11 +528,9 @@ try {
         try {
             if (window.map) {
                 async function reverseGeocodeAndFill(lat, lon) {
-                    const key = ORS_API_KEY || (window.PASSENGER_DASH_CONFIG && window.PASSENGER_DASH_CONFIG.ORS_API_KEY) || '';
-                    if (!key) return null;
-                    const url = `https://api.openrouteservice.org/geocode/reverse?api_key=${encodeURIComponent(key)}&point.lat=${encodeURIComponent(lat)}&point.lon=${encodeURIComponent(lon)}&size=1`;
+                    const url = `/booking/api/geocode/reverse/?lat=${encodeURIComponent(lat)}&lon=${encodeURIComponent(lon)}`;
                     try {
-                        const res = await fetch(url);
+                        const res = await fetch(url, { credentials: 'same-origin' });
                         if (!res.ok) return null;
                         const data = await res.json();
                         const feat = (data.features && data.features[0]) ? data.features[0] : null;
@@ -1237,6 +1236,68 @@ try {
                         if (trackingInterval) clearInterval(trackingInterval);
                         // Poll less aggressively to avoid hitting ORS rate limits; update route every 12s
                         trackingInterval = setInterval(() => updateAll(bookingId), 12000);
+                        connectTrackingSocket(bookingId);
+            }
+
+            // Live tracking socket: driver moves are applied to the marker directly and
+            // status/ETA changes trigger one full refresh. While connected, polling drops
+            // to a slow safety net; it returns to 12s if the socket closes.
+            let trackingSocket = null;
+            let trackingSocketRetry = 0;
+
+            function setTrackingPollInterval(bookingId, ms) {
+                if (trackingInterval) clearInterval(trackingInterval);
+                trackingInterval = setInterval(() => updateAll(bookingId), ms);
+            }
+
+            function connectTrackingSocket(bookingId) {
+                if (!('WebSocket' in window)) return;
+                if (trackingSocket) {
+                    try { trackingSocket.onclose = null; trackingSocket.close(); } catch (e) { /* ignore */ }
+                    trackingSocket = null;
+                }
+                const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+                let socket;
+                try {
+                    socket = new WebSocket(`${scheme}://${window.location.host}/ws/booking/${bookingId}/track/`);
+                } catch (e) {
+                    return;
+                }
+                trackingSocket = socket;
+
+                socket.onopen = () => {
+                    trackingSocketRetry = 0;
+                    setTrackingPollInterval(bookingId, 60000);
+                };
+                socket.onmessage = (evt) => {
+                    let msg;
+                    try { msg = JSON.parse(evt.data); } catch (e) { return; }
+                    const data = msg && msg.data;
+                    if (!data || String(currentTrackedBookingId) !== String(bookingId)) return;
+                    const keys = Object.keys(data).filter(k => k !== 'booking_id');
+                    const positionOnly = keys.every(k => k === 'driver_lat' || k === 'driver_lon' || k === 'heading');
+                    if (msg.type === 'tracking.delta' && positionOnly) {
+                        const lat = Number(data.driver_lat);
+                        const lon = Number(data.driver_lon);
+                        if (driverMarker && Number.isFinite(lat) && Number.isFinite(lon)) {
+                            driverMarker.setLatLng([lat, lon]);
+                            return;
+                        }
+                    }
+                    if (msg.type === 'tracking.delta') {
+                        updateAll(bookingId);
+                    }
+                };
+                socket.onclose = () => {
+                    if (trackingSocket !== socket) return;
+                    trackingSocket = null;
+                    if (String(currentTrackedBookingId) !== String(bookingId)) return;
+                    setTrackingPollInterval(bookingId, 12000);
+                    trackingSocketRetry = Math.min(trackingSocketRetry + 1, 6);
+                    setTimeout(() => {
+                        if (String(currentTrackedBookingId) === String(bookingId)) connectTrackingSocket(bookingId);
+                    }, 1000 * Math.pow(2, trackingSocketRetry));
+                };
             }
 
             // Booking preview and tracking boot
@@ -157,6 +157,41 @@ PUSH_NOTIFICATION_DEEPLINK_BASE = os.environ.get(
 
 # OpenRouteService API Configuration
 OPENROUTESERVICE_API_KEY = os.environ.get('OPENROUTESERVICE_API_KEY', 'eyJvcmciOiI1YjNjZTM1OTc4NTExMTAwMDFjZjYyNDgiLCJpZCI6ImIyOThlMTFhZDk5MzRmOGVhY2NmOTAxMGQzM2ZlYWJhIiwiaCI6Im11cm11cjY0In0=')
+# ORS HTTP client: connect/read timeouts (seconds), retries with exponential backoff
+# on 429/5xx and the size of the keep-alive connection pool shared by all threads.
+# These, ORS_BREAKER_* and ROUTING_* below are read once per process, when the
+# RoutingService singleton is created.
+ORS_HTTP_CONNECT_TIMEOUT = float(os.environ.get('ORS_HTTP_CONNECT_TIMEOUT', 3))
+ORS_HTTP_READ_TIMEOUT = float(os.environ.get('ORS_HTTP_READ_TIMEOUT', 10))
+ORS_HTTP_RETRIES = int(os.environ.get('ORS_HTTP_RETRIES', 2))
+ORS_HTTP_BACKOFF = float(os.environ.get('ORS_HTTP_BACKOFF', 0.5))
+ORS_HTTP_POOL_SIZE = int(os.environ.get('ORS_HTTP_POOL_SIZE', 10))
+# ORS circuit breaker: trips when FAILURE_RATIO of at least MIN_CALLS calls in the last
+# WINDOW seconds failed or took longer than SLOW seconds, then serves straight-line
+# estimates for OPEN seconds before probing ORS again.
+ORS_BREAKER_WINDOW_SECONDS = float(os.environ.get('ORS_BREAKER_WINDOW_SECONDS', 60))
+ORS_BREAKER_MIN_CALLS = int(os.environ.get('ORS_BREAKER_MIN_CALLS', 5))
+ORS_BREAKER_FAILURE_RATIO = float(os.environ.get('ORS_BREAKER_FAILURE_RATIO', 0.5))
+ORS_BREAKER_SLOW_SECONDS = float(os.environ.get('ORS_BREAKER_SLOW_SECONDS', 8))
+ORS_BREAKER_OPEN_SECONDS = float(os.environ.get('ORS_BREAKER_OPEN_SECONDS', 30))
+# Routing backend for directions and matrices: 'ors', 'local' (in-process A* on a road
+# graph built with `manage.py build_road_graph`) or a dotted path to a RoutingBackend.
+# Points further than MAX_SNAP_METERS from the local graph are routed by ORS unless
+# ROUTING_LOCAL_FALLBACK is false.
+ROUTING_BACKEND = os.environ.get('ROUTING_BACKEND', 'ors')
+ROUTING_GRAPH_PATH = os.environ.get('ROUTING_GRAPH_PATH', str(BASE_DIR / 'road_graph.json.gz'))
+ROUTING_GRAPH_MAX_SNAP_METERS = float(os.environ.get('ROUTING_GRAPH_MAX_SNAP_METERS', 300))
+ROUTING_LOCAL_FALLBACK = os.environ.get('ROUTING_LOCAL_FALLBACK', 'true').lower() == 'true'
+# Server-side geocoding (see booking_app.geocoding): cache TTL in seconds, reverse lookup
+# rounding (decimal places), the ORS geocoding calls allowed per minute across all
+# workers (0 = unlimited) and the local prefix index used to answer common places.
+GEOCODE_CACHE_TTL = int(os.environ.get('GEOCODE_CACHE_TTL', 7 * 24 * 60 * 60))
+GEOCODE_REVERSE_PRECISION = int(os.environ.get('GEOCODE_REVERSE_PRECISION', 4))
+GEOCODE_UPSTREAM_PER_MINUTE = int(os.environ.get('GEOCODE_UPSTREAM_PER_MINUTE', 60))
+GEOCODE_MIN_QUERY_LENGTH = int(os.environ.get('GEOCODE_MIN_QUERY_LENGTH', 3))
+GEOCODE_LOCAL_MIN_RESULTS = int(os.environ.get('GEOCODE_LOCAL_MIN_RESULTS', 5))
+GEOCODE_INDEX_MAX_ENTRIES = int(os.environ.get('GEOCODE_INDEX_MAX_ENTRIES', 5000))
+GEOCODE_INDEX_SEED_LIMIT = int(os.environ.get('GEOCODE_INDEX_SEED_LIMIT', 2000))
 
 # Caching: prefer Redis when a cache location is provided (e.g., in Render/production).
 # Fallback to LocMemCache for local development.
@@ -171,16 +206,61 @@ if os.environ.get('DJANGO_CACHE_LOCATION') or os.environ.get('REDIS_URL'):
                 # Don't raise exceptions on cache failures in production; degrade gracefully
                 'IGNORE_EXCEPTIONS': True,
             }
-        }
+        },
+        # Shared ORS route responses (see booking_app.route_cache)
+        'routes': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': CACHE_LOC,
+            'KEY_PREFIX': 'routes',
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'IGNORE_EXCEPTIONS': True,
+            }
+        },
     }
 else:
     CACHES = {
         'default': {
             'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
             'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'unique-snowflake'),
-        }
+        },
+        'routes': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'trikego-routes',
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.environ.get('ORS_ROUTE_CACHE_MAX_ENTRIES', 2000)),
+            },
+        },
     }
 
+# ORS directions cache: TTL in seconds, coordinate rounding (decimal places, 4 ~= 11 m)
+# and the largest route payload (bytes of GeoJSON) worth keeping. TTL 0 disables it.
+ORS_ROUTE_CACHE_ALIAS = os.environ.get('ORS_ROUTE_CACHE_ALIAS', 'routes')
+ORS_ROUTE_CACHE_TTL = int(os.environ.get('ORS_ROUTE_CACHE_TTL', 6 * 60 * 60))
+ORS_ROUTE_CACHE_PRECISION = int(os.environ.get('ORS_ROUTE_CACHE_PRECISION', 4))
+ORS_ROUTE_CACHE_MAX_BYTES = int(os.environ.get('ORS_ROUTE_CACHE_MAX_BYTES', 512 * 1024))
+# Route snapshots store an encoded polyline; vertices closer than this many metres to
+# the simplified line are dropped (0 keeps every vertex).
+ROUTE_SNAPSHOT_SIMPLIFY_METERS = float(os.environ.get('ROUTE_SNAPSHOT_SIMPLIFY_METERS', 2))
+
+# Itinerary legs that cannot be batched into one ORS request are routed in parallel
+# on a shared pool of ORS_SEGMENT_WORKERS threads. Legs still running after
+# ORS_SEGMENT_DEADLINE_SECONDS fall back to straight-line estimates. Their calls keep
+# a worker until ORS_HTTP_READ_TIMEOUT ends them; later builds only use the workers
+# that are still free and estimate the remaining legs.
+ORS_SEGMENT_WORKERS = int(os.environ.get('ORS_SEGMENT_WORKERS', 4))
+ORS_SEGMENT_DEADLINE_SECONDS = float(os.environ.get('ORS_SEGMENT_DEADLINE_SECONDS', 5))
+
+# Geohash grid index of online drivers and pending pickups (see booking_app.spatial).
+# Precision 6 cells are roughly 1.2 km x 0.6 km. Driver entries older than
+# SPATIAL_INDEX_DRIVER_MAX_AGE seconds are ignored. Radii of 0 disable the filters.
+SPATIAL_INDEX_PRECISION = int(os.environ.get('SPATIAL_INDEX_PRECISION', 6))
+SPATIAL_INDEX_DRIVER_MAX_AGE = int(os.environ.get('SPATIAL_INDEX_DRIVER_MAX_AGE', 600))
+# Both indexes are rebuilt from the database on the first query after this many seconds
+SPATIAL_INDEX_REBUILD_SECONDS = int(os.environ.get('SPATIAL_INDEX_REBUILD_SECONDS', 300))
+AVAILABLE_RIDES_RADIUS_KM = float(os.environ.get('AVAILABLE_RIDES_RADIUS_KM', 10))
+NEW_RIDE_BROADCAST_RADIUS_KM = float(os.environ.get('NEW_RIDE_BROADCAST_RADIUS_KM', 5))
+
 # If Redis is available, prefer cached DB-backed sessions and configure Channels to use it.
 REDIS_URL = os.environ.get('DJANGO_CACHE_LOCATION') or os.environ.get('REDIS_URL')
 if REDIS_URL:
@@ -201,6 +281,16 @@ if REDIS_URL:
         # If channels_redis isn't available in the environment, do nothing.
         CHANNEL_LAYERS = {}
 
+# Live tracking pushes a driver position to passengers only after it moves this far
+TRACKING_MIN_MOVE_METERS = float(os.environ.get('TRACKING_MIN_MOVE_METERS', 5))
+# Driver itinerary sockets are rebuilt after this much movement, and input changes
+# within ITINERARY_PUSH_DEBOUNCE_SECONDS are folded into one rebuild.
+ITINERARY_RECOMPUTE_MOVE_METERS = float(os.environ.get('ITINERARY_RECOMPUTE_MOVE_METERS', 150))
+ITINERARY_PUSH_DEBOUNCE_SECONDS = int(os.environ.get('ITINERARY_PUSH_DEBOUNCE_SECONDS', 2))
+# route_info and driver_itinerary responses are cached per booking/driver version
+# (see booking_app.cache_versions); this bounds how long an entry is reused without a bump.
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 120))
+
 # Celery broker: prefer explicit env var, otherwise use Redis URL when available
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') or REDIS_URL or 'redis://localhost:6379/0'
 
@@ -211,6 +301,56 @@ if DEBUG and 'CELERY_TASK_ALWAYS_EAGER' not in os.environ:
     CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = True
 
+# Reroute checks triggered by driver GPS pings run in Celery. Pings for the same
+# booking within REROUTE_DEBOUNCE_SECONDS are coalesced into a single check that
+# runs at the end of the window with the latest location.
+REROUTE_DEBOUNCE_SECONDS = int(os.environ.get('REROUTE_DEBOUNCE_SECONDS', 5))
+
+# Driver GPS fixes are buffered in the cache (booking_app.locations) and written to
+# the database in batches every DRIVER_LOCATION_FLUSH_INTERVAL seconds by Celery beat.
+# Without a beat process (eager Celery) fixes are written through immediately.
+_write_behind_env = os.environ.get('DRIVER_LOCATION_WRITE_BEHIND')
+if _write_behind_env is None:
+    DRIVER_LOCATION_WRITE_BEHIND = not CELERY_TASK_ALWAYS_EAGER
+else:
+    DRIVER_LOCATION_WRITE_BEHIND = _write_behind_env.lower() == 'true'
+DRIVER_LOCATION_FLUSH_INTERVAL = int(os.environ.get('DRIVER_LOCATION_FLUSH_INTERVAL', 10))
+DRIVER_LOCATION_STORE_TTL = int(os.environ.get('DRIVER_LOCATION_STORE_TTL', 60 * 60))
+
+# Fare quotes use a precomputed travel table between the ZONE_TABLE_MAX_ZONES busiest
+# geohash cells (precision 6 ~ 1.2 km x 0.6 km) of the last ZONE_TABLE_LOOKBACK_DAYS,
+# rebuilt from ORS every ZONE_TABLE_REFRESH_SECONDS by Celery beat. Quoted pending
+# bookings get a routed estimate afterwards when ZONE_TABLE_REFINE is true.
+ZONE_TABLE_PRECISION = int(os.environ.get('ZONE_TABLE_PRECISION', 6))
+ZONE_TABLE_MAX_ZONES = int(os.environ.get('ZONE_TABLE_MAX_ZONES', 40))
+ZONE_TABLE_LOOKBACK_DAYS = int(os.environ.get('ZONE_TABLE_LOOKBACK_DAYS', 30))
+ZONE_TABLE_REFRESH_SECONDS = int(os.environ.get('ZONE_TABLE_REFRESH_SECONDS', 6 * 60 * 60))
+ZONE_TABLE_REFINE = os.environ.get('ZONE_TABLE_REFINE', 'true').lower() == 'true'
+
+# Superseded route snapshots older than ROUTE_SNAPSHOT_RETENTION_HOURS are folded into a
+# per-booking RouteTrace (polylines simplified to ROUTE_TRACE_SIMPLIFY_METERS) and deleted,
+# ROUTE_SNAPSHOT_PRUNE_BATCH rows per transaction, every ROUTE_SNAPSHOT_PRUNE_INTERVAL seconds.
+ROUTE_SNAPSHOT_RETENTION_HOURS = float(os.environ.get('ROUTE_SNAPSHOT_RETENTION_HOURS', 24))
+ROUTE_SNAPSHOT_PRUNE_INTERVAL = int(os.environ.get('ROUTE_SNAPSHOT_PRUNE_INTERVAL', 60 * 60))
+ROUTE_SNAPSHOT_PRUNE_BATCH = int(os.environ.get('ROUTE_SNAPSHOT_PRUNE_BATCH', 200))
+ROUTE_SNAPSHOT_PRUNE_MAX_BATCHES = int(os.environ.get('ROUTE_SNAPSHOT_PRUNE_MAX_BATCHES', 50))
+ROUTE_TRACE_SIMPLIFY_METERS = float(os.environ.get('ROUTE_TRACE_SIMPLIFY_METERS', 10))
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-driver-locations': {
+        'task': 'booking_app.tasks.flush_driver_locations',
+        'schedule': DRIVER_LOCATION_FLUSH_INTERVAL,
+    },
+    'refresh-zone-table': {
+        'task': 'booking_app.tasks.refresh_zone_table',
+        'schedule': ZONE_TABLE_REFRESH_SECONDS,
+    },
+    'prune-route-snapshots': {
+        'task': 'booking_app.tasks.prune_route_snapshots',
+        'schedule': ROUTE_SNAPSHOT_PRUNE_INTERVAL,
+    },
+}
+
 AUTH_USER_MODEL = "user.CustomUser"
 LOGIN_URL = 'user:landing'
 LOGIN_REDIRECT_URL = reverse_lazy('user:logged_in_redirect')
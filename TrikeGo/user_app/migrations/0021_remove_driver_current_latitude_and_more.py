@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0020_rename_rider_passenger_alter_customuser_trikego_user'),
+        # Positions are copied into DriverLocation before the columns go away
+        ('booking', '0016_driverlocation_single_source'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='driver',
+            name='current_latitude',
+        ),
+        migrations.RemoveField(
+            model_name='driver',
+            name='current_longitude',
+        ),
+    ]
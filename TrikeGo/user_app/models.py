@@ -61,8 +61,7 @@ class Driver(models.Model):
     # longest choice value is 'In_trip' (7 chars) so max_length can be small but keep 16 for safety.
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='Offline')
     is_verified = models.BooleanField(default=False)
-    current_latitude = models.DecimalField(max_digits=18, decimal_places=15, null=True, blank=True)
-    current_longitude = models.DecimalField(max_digits=18, decimal_places=15, null=True, blank=True)
+    # Driver position lives in booking_app.DriverLocation; use booking_app.locations to read/write it.
 
 
 class Tricycle(models.Model):
@@ -16,17 +16,17 @@ from .models import Driver, Passenger, CustomUser, Tricycle
 from booking_app.forms import BookingForm
 from ratings_app.forms import RatingForm
 from datetime import date, timedelta
-from booking_app.models import Booking, DriverLocation
+from booking_app.models import Booking
 from django.core.paginator import Paginator
 from datetime import datetime
 from django.db.models import Q, Count
 import json
 from django.http import JsonResponse
-from django.core.cache import cache
-import os
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from booking_app.services import RoutingService
+from booking_app import cache_versions, locations, spatial, zone_table
 from django.conf import settings
 from decimal import Decimal
 from django.contrib.auth.views import redirect_to_login
@@ -50,9 +50,10 @@ from booking_app.utils import (
 )
 
 try:
-    from booking_app.tasks import compute_and_cache_route
+    from booking_app.tasks import compute_and_cache_route, refine_booking_estimate
 except Exception:
     compute_and_cache_route = None
+    refine_booking_estimate = None
 
 
 class LandingPage(View):
@@ -205,11 +206,10 @@ def cancel_booking(request, booking_id):
 
     if booking.status in ['pending', 'accepted', 'on_the_way']:
         old_status = booking.status
-        old_driver_id = booking.driver_id
         old_driver = booking.driver  # Save driver reference before clearing
 
         if booking.status == 'pending' and booking.driver is None:
-            print(f"[cancel_booking] Already pending with no driver, just clearing cache")
+            print(f"[cancel_booking] Already pending with no driver, cancelling")
             booking.status = 'cancelled_by_passenger'
             booking.save()
         else:
@@ -233,19 +233,6 @@ def cancel_booking(request, booking_id):
                 except Exception as e:
                     print(f'Failed to send cancellation notification: {e}')
 
-        cache_keys = [
-            f'route_info_{booking_id}_{old_status}_{old_driver_id or "none"}',
-            f'route_info_{booking_id}_pending_none',
-            f'route_info_{booking_id}_accepted_{old_driver_id or "none"}',
-            f'route_info_{booking_id}_on_the_way_{old_driver_id or "none"}',
-        ]
-        for key in cache_keys:
-            try:
-                cache.delete(key)
-                print(f"[cancel_booking] Cleared cache: {key}")
-            except Exception as e:
-                print(f"[cancel_booking] Cache delete failed for {key}: {e}")
-
         messages.success(request, 'Your booking has been cancelled.')
     else:
         messages.error(request, 'This booking cannot be cancelled at this stage.')
@@ -425,15 +412,21 @@ class PassengerDashboard(View):
             start_coords = (float(pickup_lon), float(pickup_lat))
             end_coords = (float(dest_lon), float(dest_lat))
 
+            route_info = None
             try:
-                routing_service = RoutingService()
-                route_info = routing_service.calculate_route(start_coords, end_coords)
+                # Zone table first so booking creation does not wait on ORS
+                route_info = zone_table.quote((float(pickup_lat), float(pickup_lon)), (float(dest_lat), float(dest_lon)))
+                if route_info is None:
+                    routing_service = RoutingService()
+                    route_info = routing_service.calculate_route(start_coords, end_coords)
 
                 if route_info and not route_info.get('too_close'):
                     booking.estimated_distance = Decimal(str(route_info['distance']))
                     booking.estimated_duration = route_info['duration'] // 60
                     booking.calculate_fare(discount_code_str=applied_code.code if applied_code else None)
                     booking.discount_code = applied_code
+                    if route_info.get('degraded'):
+                        messages.info(request, "Routing is temporarily unavailable; your fare is based on straight-line distance.")
                 else:
                     messages.warning(request, "Could not determine route estimates for fare calculation or points are too close.")
             except Exception as e:
@@ -455,6 +448,12 @@ class PassengerDashboard(View):
 
             print(f'Booking saved with id={booking.id} for passenger={request.user.username}')
 
+            if route_info and route_info.get('estimated') and refine_booking_estimate and settings.ZONE_TABLE_REFINE:
+                try:
+                    refine_booking_estimate.delay(booking.id)
+                except Exception as e:
+                    print(f'Could not queue fare refinement for booking {booking.id}: {e}')
+
             from django.db import connection
             connection.cursor().execute("COMMIT")
 
@@ -468,11 +467,19 @@ class PassengerDashboard(View):
             # Notify all available drivers about new ride
             try:
                 if dispatch_notification and NotificationMessage:
-                    # Get all online/available drivers
+                    # Get online/available drivers, preferring those near the pickup
                     available_drivers = Driver.objects.filter(
                         status__in=['Online', 'Available'],
                         user__is_active=True
-                    ).values_list('user_id', flat=True)
+                    )
+                    radius_km = settings.NEW_RIDE_BROADCAST_RADIUS_KM
+                    if radius_km > 0:
+                        nearby = spatial.drivers_within(pickup_lat, pickup_lon, radius_km)
+                        if nearby:
+                            nearby_drivers = available_drivers.filter(user_id__in=[driver_id for driver_id, _ in nearby])
+                            if nearby_drivers.exists():
+                                available_drivers = nearby_drivers
+                    available_drivers = available_drivers.values_list('user_id', flat=True)
                     
                     if available_drivers:
                         fare_display = f"₱{booking.fare:.2f}" if booking.fare else "TBD"
@@ -511,10 +518,9 @@ def logout_view(request):
                     driver_profile = Driver.objects.filter(user=request.user).first()
                     if driver_profile:
                         driver_profile.status = 'Offline'
-                        driver_profile.current_latitude = None
-                        driver_profile.current_longitude = None
-                        driver_profile.save(update_fields=['status', 'current_latitude', 'current_longitude'])
-                    DriverLocation.objects.filter(driver=request.user).delete()
+                        driver_profile.save(update_fields=['status'])
+                    locations.clear_location(request.user.id)
+                    spatial.remove_driver(request.user.id)
                 except Exception:
                     pass
     except Exception:
@@ -711,11 +717,16 @@ def update_passenger_location(request):
         if lat is None or lon is None:
             return JsonResponse({'status': 'error', 'message': 'Missing lat/lon.'}, status=400)
         Passenger.objects.filter(user=request.user).update(current_latitude=lat, current_longitude=lon)
+        # Queryset update: no Passenger post_save, so retire route_info here
+        cache_versions.bump_passenger_bookings(request.user.id)
         return JsonResponse({'status': 'success'})
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
 
+ROUTE_INFO_CACHE = cache_versions.CachedResponse('route_info', cache_versions.BOOKING)
+
+
 def get_route_info(request, booking_id):
     if not request.user.is_authenticated:
         accept = request.META.get('HTTP_ACCEPT', '')
@@ -725,15 +736,15 @@ def get_route_info(request, booking_id):
         if xrw == 'XMLHttpRequest' or 'application/json' in accept:
             return JsonResponse({'status': 'error', 'message': 'Authentication required'}, status=401)
         return redirect_to_login(request.get_full_path())
-    booking = get_object_or_404(Booking, id=booking_id)
 
-    cache_key = f'route_info_{booking_id}_{booking.status}_{booking.driver_id or "none"}'
-    try:
-        cached = cache.get(cache_key)
-        if cached:
-            return JsonResponse(cached)
-    except Exception:
-        cached = None
+    # Entries are per viewer and only written after the checks below passed for them
+    version, entry = ROUTE_INFO_CACHE.lookup(booking_id, variant=request.user.id)
+    if entry:
+        if cache_versions.is_not_modified(request, entry['etag']):
+            return cache_versions.not_modified(entry['etag'])
+        return cache_versions.tag_response(JsonResponse(entry['body']), entry['etag'])
+
+    booking = get_object_or_404(Booking, id=booking_id)
 
     accepted_statuses = {'accepted', 'on_the_way', 'started'}
     booking_is_active = booking.status in accepted_statuses
@@ -761,6 +772,9 @@ def get_route_info(request, booking_id):
     else:
         return JsonResponse({'status': 'error', 'message': 'Unauthorized.'}, status=403)
 
+    # One location-store read serves the route, driver marker and top-level fields
+    driver_coords = locations.get_coordinates(driver_profile.user_id) if driver_profile else None
+
     tricycle_data = None
     try:
         trike = Tricycle.objects.filter(driver=driver_profile).first() if driver_profile else None
@@ -797,6 +811,7 @@ def get_route_info(request, booking_id):
                     'distance': route_info.get('distance'),
                     'duration': route_info.get('duration'),
                     'too_close': route_info.get('too_close', False),
+                    'degraded': route_info.get('degraded', False),
                 }
         else:
             route_payload = None
@@ -813,16 +828,17 @@ def get_route_info(request, booking_id):
     else:
         try:
             routing_service = RoutingService()
+            # Only distances are needed here, so the zone table answers when it can
             if booking.pickup_latitude and booking.pickup_longitude and booking.destination_latitude and booking.destination_longitude:
                 pd_start = (float(booking.pickup_longitude), float(booking.pickup_latitude))
                 pd_end = (float(booking.destination_longitude), float(booking.destination_latitude))
-                pd_info = routing_service.calculate_route(pd_start, pd_end)
+                pd_info = zone_table.quote((pd_start[1], pd_start[0]), (pd_end[1], pd_end[0])) or routing_service.calculate_route(pd_start, pd_end)
                 if pd_info:
                     pickup_to_dest_km = pd_info.get('distance')
-            if booking.driver and driver_profile and driver_profile.current_latitude and driver_profile.current_longitude and booking.pickup_latitude and booking.pickup_longitude:
-                dp_start = (float(driver_profile.current_longitude), float(driver_profile.current_latitude))
+            if booking.driver and driver_coords and booking.pickup_latitude and booking.pickup_longitude:
+                dp_start = (driver_coords[1], driver_coords[0])
                 dp_end = (float(booking.pickup_longitude), float(booking.pickup_latitude))
-                dp_info = routing_service.calculate_route(dp_start, dp_end)
+                dp_info = zone_table.quote(driver_coords, (dp_end[1], dp_end[0])) or routing_service.calculate_route(dp_start, dp_end)
                 if dp_info:
                     driver_to_pickup_km = dp_info.get('distance')
         except Exception:
@@ -830,16 +846,6 @@ def get_route_info(request, booking_id):
 
     driver_info = None
     if driver_profile:
-        try:
-            from booking_app.models import DriverLocation as _DriverLocation
-            dl = _DriverLocation.objects.filter(driver=driver_profile.user).first()
-            if dl:
-                if not driver_profile.current_latitude and getattr(dl, 'latitude', None) is not None:
-                    driver_profile.current_latitude = dl.latitude
-                if not driver_profile.current_longitude and getattr(dl, 'longitude', None) is not None:
-                    driver_profile.current_longitude = dl.longitude
-        except Exception:
-            pass
         try:
             driver_name = f"{driver_profile.user.first_name} {driver_profile.user.last_name}".strip() or driver_profile.user.username
         except Exception:
@@ -847,8 +853,8 @@ def get_route_info(request, booking_id):
         driver_info = {
             'id': getattr(driver_profile, 'id', None),
             'name': driver_name,
-            'lat': driver_profile.current_latitude,
-            'lon': driver_profile.current_longitude,
+            'lat': driver_coords[0] if driver_coords else None,
+            'lon': driver_coords[1] if driver_coords else None,
         }
         if tricycle_data:
             driver_info['plate'] = tricycle_data.get('plate_number')
@@ -925,8 +931,8 @@ def get_route_info(request, booking_id):
         'status': 'success',
         'booking_status': booking.status,
         'driver': driver_info if booking_is_active else None,
-        'driver_lat': driver_profile.current_latitude if (booking_is_active and driver_profile) else None,
-        'driver_lon': driver_profile.current_longitude if (booking_is_active and driver_profile) else None,
+        'driver_lat': driver_coords[0] if (booking_is_active and driver_coords) else None,
+        'driver_lon': driver_coords[1] if (booking_is_active and driver_coords) else None,
         'driver_name': driver_info.get('name') if (booking_is_active and driver_info) else None,
         'passenger_lat': passenger_profile.current_latitude if passenger_profile else None,
         'passenger_lon': passenger_profile.current_longitude if passenger_profile else None,
@@ -948,14 +954,15 @@ def get_route_info(request, booking_id):
         'stops': stops_payload,
         'itinerary': shared_itinerary,
         'payment_verified': booking.payment_verified,
+        'routing_degraded': RoutingService().degraded,
     }
 
-    try:
-        cache.set(cache_key, response_data, timeout=int(os.environ.get('ROUTE_CACHE_TTL', 15)))
-    except Exception:
-        pass
-
-    return JsonResponse(response_data)
+    # Round-trip through JSON so the cached body is exactly what was sent
+    body = json.loads(json.dumps(response_data, cls=DjangoJSONEncoder))
+    etag = ROUTE_INFO_CACHE.store(booking_id, version, body, variant=request.user.id)
+    if cache_versions.is_not_modified(request, etag):
+        return cache_versions.not_modified(etag)
+    return cache_versions.tag_response(JsonResponse(body), etag)
 @login_required
 def get_passenger_trip_history(request):
     if request.user.trikego_user != 'P':